@@ -1,9 +1,199 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
 # Register your models here.
-from .models import ChamberAccess
+from .models import AlertRule, ChamberAccess, Excursion
+from .readings import FIELDS, MODEL_BY_CH
 
 @admin.register(ChamberAccess)
 class ChamberAccessAdmin(admin.ModelAdmin):
     list_display = ("user", "chamber")
-    list_filter = ("chamber",)
\ No newline at end of file
+    list_filter = ("chamber",)
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ("name", "chamber", "channel", "kind", "low", "high", "max_rate", "min_duration", "enabled")
+    list_filter = ("chamber", "kind", "enabled")
+    readonly_fields = ("last_value", "last_at", "breach_since", "open_excursion")
+
+
+@admin.register(Excursion)
+class ExcursionAdmin(admin.ModelAdmin):
+    list_display = ("rule", "chamber", "channel", "started_at", "ended_at", "peak", "samples")
+    list_filter = ("chamber", "channel")
+    list_select_related = ("rule",)
+    date_hierarchy = "started_at"
+
+
+# ---------------- Reading tables ----------------
+# Millions of rows per chamber, so the changelists avoid anything that scans
+# the table: counts are estimated, sorting is on the created_at index,
+# "Older" links page by created_at (?before=) instead of OFFSET, and the
+# date hierarchy finds its years/months/days with index probes.
+
+COUNT_CAP = 10_000
+
+
+def _table_estimate(model, using):
+    """Row count from table statistics (or the id range), without a scan."""
+    conn = connections[using]
+    table = model._meta.db_table
+    with conn.cursor() as cur:
+        if conn.vendor == "mysql":
+            cur.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table],
+            )
+            row = cur.fetchone()
+            return None if row is None else int(row[0] or 0)
+        if conn.vendor == "postgresql":
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            row = cur.fetchone()
+            return None if row is None else max(0, int(row[0]))
+    return model.objects.using(using).aggregate(n=Max("id"))["n"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Unfiltered: table statistics. Filtered: an exact count up to COUNT_CAP."""
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            return _table_estimate(qs.model, qs.db)
+        return qs.order_by()[:COUNT_CAP].count()
+
+
+class ProbedDatesQuerySet(models.QuerySet):
+    """
+    datetimes() for the admin date hierarchy, answered with one indexed
+    range probe per candidate year/month/day instead of a DISTINCT scan.
+    """
+
+    def datetimes(self, field_name, kind, order="ASC", tzinfo=None):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds["first"] is None:
+            return []
+        tz = tzinfo or timezone.get_current_timezone()
+        first, last = (timezone.localtime(bounds[k], tz) for k in ("first", "last"))
+        out = []
+        cur = _truncate(first, kind)
+        while cur <= last:
+            nxt = _next(cur, kind)
+            if self.filter(**{f"{field_name}__gte": cur, f"{field_name}__lt": nxt}).exists():
+                out.append(cur)
+            cur = nxt
+        return out if order == "ASC" else out[::-1]
+
+
+def _truncate(dt, kind):
+    dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if kind in ("month", "year"):
+        dt = dt.replace(day=1)
+    if kind == "year":
+        dt = dt.replace(month=1)
+    return dt
+
+
+def _next(dt, kind):
+    if kind == "day":
+        return dt + timedelta(days=1)
+    if kind == "month":
+        return dt.replace(year=dt.year + dt.month // 12, month=dt.month % 12 + 1)
+    return dt.replace(year=dt.year + 1)
+
+
+class ReadingChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        rows = list(self.result_list)
+        self.newest_url = self.get_query_string(remove=[BeforeFilter.parameter_name, "p"])
+        self.older_url = None
+        if len(rows) == self.list_per_page:
+            cursor = f"{rows[-1].created_at.isoformat()}_{rows[-1].pk}"
+            self.older_url = self.get_query_string({BeforeFilter.parameter_name: cursor}, ["p"])
+
+
+class BeforeFilter(admin.SimpleListFilter):
+    """
+    Keyset cursor behind the "Older" link, "<created_at>_<id>" of the last
+    row shown (rows sharing a time are told apart by id); listed only while
+    it is set.
+    """
+    title = "older than"
+    parameter_name = "before"
+
+    def cursor(self):
+        at, _, pk = (self.value() or "").rpartition("_")
+        try:
+            return parse_datetime(at), int(pk)
+        except ValueError:
+            return None, None
+
+    def lookups(self, request, model_admin):
+        cursor, _ = self.cursor()
+        if cursor is None:
+            return ()
+        return [(self.value(), timezone.localtime(cursor).strftime("%Y-%m-%d %H:%M:%S"))]
+
+    def queryset(self, request, queryset):
+        cursor, pk = self.cursor()
+        if cursor is None:
+            return queryset
+        return queryset.filter(Q(created_at__lt=cursor) | Q(created_at=cursor, id__lt=pk))
+
+
+class RecentFilter(admin.SimpleListFilter):
+    title = "period"
+    parameter_name = "recent"
+    SPANS = {"1h": timedelta(hours=1), "6h": timedelta(hours=6), "24h": timedelta(days=1), "7d": timedelta(days=7)}
+
+    def lookups(self, request, model_admin):
+        return [(k, f"Last {k}") for k in self.SPANS]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.SPANS:
+            return queryset.filter(created_at__gte=timezone.now() - self.SPANS[self.value()])
+        return queryset
+
+
+class ReadingAdmin(admin.ModelAdmin):
+    list_display = ("created_at", *FIELDS)
+    list_filter = (RecentFilter, BeforeFilter)
+    date_hierarchy = "created_at"
+    ordering = ("-created_at", "-id")
+    sortable_by = ("created_at",)
+    list_per_page = 100
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/sensor/reading_change_list.html"
+
+    def get_queryset(self, request):
+        # read-only rows: skip the date/time columns nobody looks at here
+        qs = ProbedDatesQuerySet(self.model)
+        return qs.only("id", "created_at", *FIELDS).order_by(*self.get_ordering(request))
+
+    def get_changelist(self, request, **kwargs):
+        return ReadingChangeList
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+for _Model in MODEL_BY_CH.values():
+    admin.site.register(_Model, ReadingAdmin)
@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .readings import source_for
+
+# ---------------- Read admission control ----------------
+# Before a read or export is computed its size is estimated:
+#
+#   points ≈ window / max(step, native interval)
+#
+# where the window is clipped to the chamber's first reading and to now, and
+# the native interval is the chamber's span over its (approximate) row count
+# -- one aggregate over the created_at/id index edges, cached for
+# SENSOR_ADMISSION_TTL seconds. With ?fill=, which makes a row for every
+# bucket, data or not, it is window / step.
+#
+# A request over SENSOR_READ_BUDGET[kind] is served at the finest step of
+# STEPS that fits and says so (X-Resolution header, "every" in JSON bodies,
+# export file names); with ?coarsen=0, or when even the coarsest step is
+# too much, it is refused with a 413. Steps finer than the finest of STEPS
+# count as over budget.
+#
+# Requests over SENSOR_HEAVY_POINTS also take one of
+# SENSOR_HEAVY_CONCURRENCY slots of this process for the time they compute;
+# one that waits SENSOR_HEAVY_WAIT seconds for a slot gets a 503.
+
+STEPS = {
+    "1m": timedelta(minutes=1), "5m": timedelta(minutes=5), "15m": timedelta(minutes=15),
+    "30m": timedelta(minutes=30), "1h": timedelta(hours=1), "3h": timedelta(hours=3),
+    "6h": timedelta(hours=6), "12h": timedelta(hours=12),
+}
+BUDGETS = {"range": 20_000, "chart": 20_000, "csv": 500_000, "pdf": 20_000}
+
+
+class Rejected(Exception):
+    """A read refused before any work was done."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def response(self):
+        resp = JsonResponse({"error": str(self)}, status=self.status)
+        if self.retry_after is not None:
+            resp["Retry-After"] = str(self.retry_after)
+        return resp
+
+
+def budget(kind):
+    budgets = {**BUDGETS, **getattr(settings, "SENSOR_READ_BUDGET", {})}
+    # export formats registered later are bulk downloads like csv
+    return budgets.get(kind, budgets["csv"])
+
+
+def _cache():
+    return caches[getattr(settings, "SENSOR_ADMISSION_CACHE", "default")]
+
+
+def span_stats(ch):
+    """(first reading, native interval) of `ch`, cached; (None, None) without data."""
+    key = f"admission:{ch}:span"
+    found = _cache().get(key)
+    if found is None:
+        first, last, n = source_for(ch).span_stats()
+        native = (last - first) / (n - 1) if first is not None and n > 1 else None
+        found = (first, native)
+        _cache().set(key, found, timeout=getattr(settings, "SENSOR_ADMISSION_TTL", 300))
+    return found
+
+
+def invalidate(ch):
+    """Re-read the span of `ch` on the next request (rows loaded into the past)."""
+    _cache().delete(f"admission:{ch}:span")
+
+
+def estimate(ch, start, end, step=None, fill="none"):
+    """Rows a read of [start, end] at `step` (None = raw) and `fill` would return."""
+    first, native = span_stats(ch)
+    if first is None:
+        return 0
+    now = timezone.now()
+    lo = first if start is None else max(start, first)
+    hi = now if end is None else min(end, now)
+    if hi <= lo:
+        return 0
+    if step and fill != "none":
+        per = step
+    else:
+        per = max(step or timedelta(0), native or timedelta(0))
+    if not per:
+        return 1
+    return int((hi - lo) / per) + 1
+
+
+def plan(ch, kind, start, end, every=None, step=None, coarsen=True, fill="none"):
+    """
+    (every, step, points) to serve a read of `ch` with: the requested
+    resolution (every/step None = raw rows) when it fits the budget of
+    `kind`, otherwise the finest coarser step of STEPS that does. Raises
+    Rejected.
+    """
+    limit = budget(kind)
+    finest = min(STEPS.values())
+    too_fine = step is not None and step < finest
+    points = estimate(ch, start, end, step, fill)
+    if points <= limit and not too_fine:
+        return every, step, points
+    if not coarsen:
+        if too_fine:
+            raise Rejected(413, f"?every= finer than {min(STEPS, key=STEPS.get)} is not served")
+        raise Rejected(413, f"about {points} points requested, over the limit of {limit}; "
+                            f"use a coarser ?every= or a shorter window")
+    for candidate, cstep in STEPS.items():
+        if step is not None and cstep <= step:
+            continue
+        points = estimate(ch, start, end, cstep, fill)
+        if points <= limit:
+            return candidate, cstep, points
+    raise Rejected(413, f"about {points} points even at {candidate}, over the limit of {limit}; "
+                        f"use a shorter window")
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _semaphore():
+    global _slots
+    n = getattr(settings, "SENSOR_HEAVY_CONCURRENCY", 2)
+    with _slots_lock:
+        if _slots is None or _slots[0] != n:
+            _slots = (n, threading.BoundedSemaphore(n))
+        return _slots[1]
+
+
+@contextmanager
+def heavy_slot(points):
+    """Hold one of this process's heavy-read slots while a big read runs."""
+    if points <= getattr(settings, "SENSOR_HEAVY_POINTS", 5_000):
+        yield
+        return
+    slots = _semaphore()
+    wait = getattr(settings, "SENSOR_HEAVY_WAIT", 5)
+    if not slots.acquire(timeout=wait):
+        raise Rejected(503, "too many large reads in progress, try again shortly",
+                       retry_after=max(1, round(wait)))
+    try:
+        yield
+    finally:
+        slots.release()
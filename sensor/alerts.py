@@ -0,0 +1,168 @@
+import logging
+
+from django.db import transaction
+
+from .models import AlertRule, Excursion
+
+logger = logging.getLogger("sensor.alerts")
+
+# ---------------- Incremental alert evaluation ----------------
+# Each AlertRule carries its own running state (last value/time, when the
+# current breach began, the open Excursion), so a reading is evaluated in
+# O(1) per rule without looking at history:
+#
+#   band  -- value outside [low, high]
+#   rate  -- |change| per minute since the previous reading above max_rate
+#
+# A breach opens an Excursion once it has lasted min_duration seconds and
+# closes it at the first reading back within limits.
+
+STATE_FIELDS = ["last_value", "last_at", "breach_since", "open_excursion"]
+
+
+def _severity(rule, ts, value):
+    """How bad this sample is, or None when the rule is satisfied."""
+    if rule.kind == AlertRule.RATE:
+        if rule.max_rate is None or rule.last_value is None or rule.last_at is None or ts <= rule.last_at:
+            return None
+        rate = abs(value - rule.last_value) / ((ts - rule.last_at).total_seconds() / 60)
+        return rate if rate > rule.max_rate else None
+    if rule.low is not None and value < rule.low:
+        return value
+    if rule.high is not None and value > rule.high:
+        return value
+    return None
+
+
+def _worse(rule, a, b):
+    """True if severity a is worse than b."""
+    if rule.kind == AlertRule.RATE:
+        return a > b
+
+    def outside(v):
+        below = (rule.low - v) if rule.low is not None else 0
+        above = (v - rule.high) if rule.high is not None else 0
+        return max(below, above)
+    return outside(a) > outside(b)
+
+
+def advance(rule, excursion, ts, value):
+    """
+    Feed one reading to `rule`. Mutates the rule state and `excursion`
+    (the rule's open Excursion or None) and returns (action, excursion)
+    where action is None, "open", "update" or "close".
+    """
+    if value is None:
+        return None, excursion
+    sev = _severity(rule, ts, value)
+    rule.last_value, rule.last_at = value, ts
+
+    if sev is None:
+        rule.breach_since = None
+        if excursion is not None:
+            excursion.ended_at = ts
+            return "close", excursion
+        return None, None
+
+    if rule.breach_since is None:
+        rule.breach_since = ts
+    if excursion is not None:
+        excursion.samples += 1
+        if _worse(rule, sev, excursion.peak):
+            excursion.peak = sev
+        return "update", excursion
+    if (ts - rule.breach_since).total_seconds() >= rule.min_duration:
+        return "open", Excursion(
+            rule=rule, chamber=rule.chamber, channel=rule.channel,
+            started_at=rule.breach_since, peak=sev,
+        )
+    return None, None
+
+
+def evaluate(ch, ts, values):
+    """Run every enabled rule of chamber `ch` on one ingested reading."""
+    if not AlertRule.objects.filter(chamber=ch, enabled=True).exists():
+        return
+    with transaction.atomic():
+        # lock the rules so concurrent ingests of this chamber apply in turn
+        rules = list(AlertRule.objects.select_for_update().filter(chamber=ch, enabled=True))
+        open_ids = [r.open_excursion_id for r in rules if r.open_excursion_id]
+        open_by_id = Excursion.objects.in_bulk(open_ids) if open_ids else {}
+        for rule in rules:
+            action, exc = advance(rule, open_by_id.get(rule.open_excursion_id), ts, values.get(rule.channel))
+            if action == "open":
+                exc.save()
+                rule.open_excursion = exc
+            elif action == "update":
+                exc.save(update_fields=["peak", "samples"])
+            elif action == "close":
+                exc.save(update_fields=["ended_at"])
+                rule.open_excursion = None
+        AlertRule.objects.bulk_update(rules, STATE_FIELDS)
+
+
+def evaluate_batch(ch, readings):
+    """
+    evaluate() for (ts, values) readings of one batch, in time order: the
+    rules are locked and saved once; only excursions that open or close on
+    the way are written before the last reading.
+    """
+    if not readings or not AlertRule.objects.filter(chamber=ch, enabled=True).exists():
+        return
+    with transaction.atomic():
+        rules = list(AlertRule.objects.select_for_update().filter(chamber=ch, enabled=True))
+        open_ids = [r.open_excursion_id for r in rules if r.open_excursion_id]
+        open_by_id = Excursion.objects.in_bulk(open_ids) if open_ids else {}
+        current = {r.pk: open_by_id.get(r.open_excursion_id) for r in rules}
+        touched = {}
+        for ts, values in readings:
+            for rule in rules:
+                action, exc = advance(rule, current[rule.pk], ts, values.get(rule.channel))
+                if action == "open":
+                    exc.save()
+                    rule.open_excursion = current[rule.pk] = exc
+                elif action == "update":
+                    touched[exc.pk] = exc
+                elif action == "close":
+                    exc.save(update_fields=["ended_at", "peak", "samples"])
+                    touched.pop(exc.pk, None)
+                    rule.open_excursion = current[rule.pk] = None
+        if touched:
+            Excursion.objects.bulk_update(list(touched.values()), ["peak", "samples"])
+        AlertRule.objects.bulk_update(rules, STATE_FIELDS)
+
+
+def evaluate_safely(ch, ts, values):
+    # a broken rule must never cost us the reading itself
+    try:
+        evaluate(ch, ts, values)
+    except Exception:
+        logger.exception("alert evaluation failed for %s", ch)
+
+
+def evaluate_batch_safely(ch, readings):
+    try:
+        evaluate_batch(ch, readings)
+    except Exception:
+        logger.exception("alert evaluation failed for %s", ch)
+
+
+def replay(rules, readings):
+    """
+    Re-evaluate `rules` (fresh state) over (created_at, {channel: value})
+    readings in time order, in memory. Returns the Excursions produced;
+    ones still open at the end are left on rule.open_excursion unsaved.
+    """
+    found = []
+    open_exc = {r.pk: None for r in rules}
+    for ts, values in readings:
+        for rule in rules:
+            action, exc = advance(rule, open_exc[rule.pk], ts, values.get(rule.channel))
+            if action == "open":
+                found.append(exc)
+                open_exc[rule.pk] = exc
+            elif action == "close":
+                open_exc[rule.pk] = None
+    for rule in rules:
+        rule.open_excursion = open_exc[rule.pk]
+    return found
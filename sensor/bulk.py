@@ -0,0 +1,117 @@
+from django.db import connections, transaction
+from django.utils import timezone
+
+# ---------------- Bulk reading writes ----------------
+# Generated and historical rows keep their own timestamps and come in
+# large batches, so they skip model instances (and bulk_create()'s per-field
+# work) and are written with plain multi-row INSERTs.
+
+_ADAPTERS = {
+    "DateField": "adapt_datefield_value",
+    "TimeField": "adapt_timefield_value",
+    "DateTimeField": "adapt_datetimefield_value",
+}
+
+READING_COLUMNS = ["date", "time", "temperature", "pressure", "humidity", "co2", "created_at"]
+
+
+def reading_row(created_at, temperature, pressure, humidity, co2, tz=None):
+    """Build one INSERT tuple; date/time are the local wall clock of created_at."""
+    loc = timezone.localtime(created_at, tz or timezone.get_current_timezone())
+    return (
+        loc.date(), loc.time().replace(microsecond=0),
+        temperature, pressure, humidity, co2,
+        created_at,
+    )
+
+
+def insert_readings(Model, rows, batch_size=5000, using="default"):
+    """
+    Insert an iterable of reading_row() tuples into Model's table.
+    Returns the number of rows written.
+    """
+    return insert_rows(Model, READING_COLUMNS, rows, batch_size, using)
+
+
+def insert_rows(Model, columns, rows, batch_size=5000, using="default"):
+    """Insert tuples of `columns` values into Model's table; returns the number written."""
+    conn = connections[using]
+    ops = conn.ops
+    table = ops.quote_name(Model._meta.db_table)
+    cols = ", ".join(ops.quote_name(c) for c in columns)
+    one = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    # adapt python values with the backend's own adapters (what the ORM
+    # ends up calling, minus the per-field overhead); floats pass through
+    fields = [Model._meta.get_field(c) for c in columns]
+    prep = [_ADAPTERS.get(f.get_internal_type()) for f in fields]
+    prep = [getattr(ops, p) if p else None for p in prep]
+
+    def adapt(row):
+        return [v if p is None or v is None else p(v) for p, v in zip(prep, row)]
+
+    # SQLite caps the number of bound parameters per statement
+    batch_size = max(1, min(batch_size, ops.bulk_batch_size(fields, [None] * batch_size)))
+
+    written = 0
+    batch = []
+    with transaction.atomic(using=using), conn.cursor() as cur, conn.wrap_database_errors:
+        # the backend cursor directly: with DEBUG on, logging every statement
+        # with thousands of parameters costs more than the insert itself
+        raw = cur.cursor
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += _flush(raw, table, cols, one, batch, adapt)
+                batch = []
+        if batch:
+            written += _flush(raw, table, cols, one, batch, adapt)
+    return written
+
+
+def _flush(cur, table, cols, one, batch, adapt):
+    params = []
+    for row in batch:
+        params.extend(adapt(row))
+    cur.execute(f"INSERT INTO {table} ({cols}) VALUES " + ", ".join([one] * len(batch)), params)
+    return len(batch)
+
+
+def load_readings_infile(Model, rows, using="default"):
+    """
+    MySQL only: write reading_row() tuples to a temporary tab-separated file
+    and load it with LOAD DATA LOCAL INFILE, the server's fastest bulk path.
+    Needs local_infile enabled on both server and client (OPTIONS).
+    Returns the number of rows written.
+    """
+    import os
+    import tempfile
+
+    conn = connections[using]
+    if conn.vendor != "mysql":
+        raise NotImplementedError("LOAD DATA is MySQL only")
+    ops = conn.ops
+    prep = [_ADAPTERS.get(Model._meta.get_field(c).get_internal_type()) for c in READING_COLUMNS]
+    prep = [getattr(ops, p) if p else str for p in prep]
+
+    def cell(p, v):
+        return "\\N" if v is None else str(p(v))
+
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    written = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as out:
+            for row in rows:
+                out.write("\t".join(cell(p, v) for p, v in zip(prep, row)))
+                out.write("\n")
+                written += 1
+        cols = ", ".join(ops.quote_name(c) for c in READING_COLUMNS)
+        with transaction.atomic(using=using), conn.cursor() as cur:
+            cur.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE {ops.quote_name(Model._meta.db_table)} "
+                f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({cols})",
+                [path],
+            )
+    finally:
+        os.unlink(path)
+    return written
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import gaps
+
+# ---------------- Device timestamps ----------------
+# A device may send the time it took a reading ("ts", "timestamp" or
+# "created_at": ISO 8601 or epoch s/ms). It is trusted within bounds: up to
+# SENSOR_DEVICE_CLOCK_AHEAD seconds in the future (then clamped to now) and
+# SENSOR_DEVICE_MAX_LATE seconds in the past, e.g. readings buffered through
+# an outage. Without one, a reading is stamped on arrival as before.
+#
+# A reading older than the newest stored one is late. It is stored at its
+# own time -- the created_at index keeps range reads ordered whatever the
+# insert order -- and what was derived from its span is patched in place:
+#
+#   gaps      -- the recorded gap it falls into is split or shortened
+#   sketches  -- its settled ReadingSketch bucket gets the value added
+#   series    -- closed series-cache blocks of its day get a new revision
+#   sparklines / ring -- redrawn / slotted in (or re-seeded)
+#
+# Live alert state only moves forward in time, so late readings skip it;
+# manage.py replay_alerts re-evaluates history.
+
+TS_KEYS = ("ts", "timestamp", "created_at")
+
+
+def parse_ts(value, tz=None):
+    """A datetime from ISO 8601 (naive: in `tz`, default the current zone) or epoch s/ms."""
+    if isinstance(value, (int, float)):
+        num = value
+    else:
+        value = str(value).strip()
+        try:
+            num = float(value)
+        except ValueError:
+            dt = datetime.fromisoformat(value)
+            return dt if dt.tzinfo else timezone.make_aware(dt, tz or timezone.get_current_timezone())
+    # epoch seconds, or milliseconds for anything past year 5138
+    return datetime.fromtimestamp(num / 1000 if num > 1e11 else num, dt_timezone.utc)
+
+
+def device_time(payload, now=None):
+    """
+    The reading time a device sent, bounded and clamped, or None when it sent
+    none. Raises ValueError for an unreadable time or one out of bounds.
+    """
+    key = next((k for k in TS_KEYS if payload.get(k) not in (None, "")), None)
+    if key is None:
+        return None
+    try:
+        ts = parse_ts(payload[key])
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError(f"{key} is not an ISO 8601 time or epoch seconds/milliseconds")
+
+    now = now or timezone.now()
+    ahead = timedelta(seconds=getattr(settings, "SENSOR_DEVICE_CLOCK_AHEAD", 60))
+    late = timedelta(seconds=getattr(settings, "SENSOR_DEVICE_MAX_LATE", 7 * 86400))
+    if ts > now + ahead:
+        raise ValueError(f"{key} is more than {ahead.total_seconds():.0f}s ahead of the server clock")
+    if ts < now - late:
+        raise ValueError(f"{key} is older than {late}; load history with manage.py import_readings")
+    return min(ts, now)
+
+
+def repair_late(ch, created_at, values):
+    """Patch what was derived from the span a late reading was inserted into."""
+    from . import seriescache, sparklines, stats
+
+    gaps.split_at(ch, created_at)
+    stats.add_late(ch, created_at, values)
+    seriescache.revise(ch, created_at)
+    if timezone.now() - created_at < timedelta(hours=getattr(settings, "SENSOR_SPARK_HOURS", 24)):
+        sparklines.invalidate(ch)
@@ -0,0 +1,16 @@
+import csv
+
+from django.http import HttpResponse
+
+from .exporters import HEADERS, filename, fmt_cells
+
+
+def render(rows, ch, start_dt, end_dt, every):
+    response = HttpResponse(content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename(ch, start_dt, end_dt, every, "csv")}"'
+    response.write("\ufeff")  # BOM for Excel
+
+    writer = csv.writer(response)
+    writer.writerow(HEADERS)
+    writer.writerows(fmt_cells(r) for r in rows)
+    return response
@@ -0,0 +1,33 @@
+from django.http import HttpResponse
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .exporters import HEADERS, filename, fmt_cells
+
+
+def render(rows, ch, start_dt, end_dt, every):
+    response = HttpResponse(content_type="application/pdf")
+    response["Content-Disposition"] = f'attachment; filename="{filename(ch, start_dt, end_dt, every, "pdf")}"'
+
+    doc = SimpleDocTemplate(response, pagesize=landscape(A4),
+                            rightMargin=18, leftMargin=18, topMargin=24, bottomMargin=18)
+    styles = getSampleStyleSheet()
+    title = Paragraph(f"Chamber {ch.upper()} — Sensor Data (every {every})", styles["Heading3"])
+
+    data = [HEADERS] + [fmt_cells(r) for r in rows]
+
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#f1f5f9")),
+        ("TEXTCOLOR",  (0,0), (-1,0), colors.HexColor("#111827")),
+        ("FONTNAME",   (0,0), (-1,0), "Helvetica-Bold"),
+        ("FONTSIZE",   (0,0), (-1,0), 10),
+        ("FONTSIZE",   (0,1), (-1,-1), 9),
+        ("ALIGN",      (0,0), (-1,-1), "CENTER"),
+        ("GRID",       (0,0), (-1,-1), 0.5, colors.HexColor("#111111")),
+        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#f7fafc")]),
+    ]))
+    doc.build([title, Spacer(1, 8), table])
+    return response
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# ---------------- Export engine registry ----------------
+# Export formats map to dotted paths and are imported on first use, so
+# workers that only serve ingest and JSON never load the PDF stack.
+# Projects can add formats with settings.SENSOR_EXPORT_ENGINES.
+#
+# An engine is a callable:
+#     render(rows, ch, start_dt, end_dt, every) -> HttpResponse
+# where rows are dicts of date, time and the four channels, one per
+# resampled bucket (views._export).
+
+EXPORT_ENGINES = {
+    "csv": "sensor.export_csv.render",
+    "pdf": "sensor.export_pdf.render",
+}
+
+HEADERS = ["Date", "Time", "Temperature (°C)", "Temperature1 (°C)", "Humidity (%)", "Humidity1 (%)"]
+
+_loaded = {}
+
+
+def engines():
+    return {**EXPORT_ENGINES, **getattr(settings, "SENSOR_EXPORT_ENGINES", {})}
+
+
+def get_engine(fmt):
+    engine = _loaded.get(fmt)
+    if engine is None:
+        engine = _loaded[fmt] = import_string(engines()[fmt])
+    return engine
+
+
+def fmt_cells(r):
+    """One export row: date, time and the four channels to 2 decimals."""
+    return [
+        r["date"], r["time"],
+        "" if r["temperature"] is None else f'{r["temperature"]:.2f}',
+        "" if r["pressure"] is None else f'{r["pressure"]:.2f}',
+        "" if r["humidity"] is None else f'{r["humidity"]:.2f}',
+        "" if r["co2"] is None else f'{r["co2"]:.2f}',
+    ]
+
+
+def filename(ch, start_dt, end_dt, every, ext):
+    return f"Chamber_{ch}_{start_dt.date()}_{end_dt.date()}_{every}.{ext}"
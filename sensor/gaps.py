@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DataGap
+from .readings import from_ms, source_for
+
+# ---------------- Data gaps ----------------
+# A gap is recorded whenever two consecutive readings of a chamber are more
+# than SENSOR_GAP_SECONDS apart. Ingest checks the new reading against the
+# previous one; backfill() finds the same gaps with one ordered scan of the
+# created_at index. Readers then get outages from the small DataGap table.
+
+
+def threshold():
+    return timedelta(seconds=getattr(settings, "SENSOR_GAP_SECONDS", 300))
+
+
+def note_reading(ch, previous_at, created_at):
+    """Record a gap if `created_at` arrives long after `previous_at`."""
+    if previous_at is None or created_at - previous_at <= threshold():
+        return None
+    DataGap.objects.bulk_create([DataGap(
+        chamber=ch, started_at=previous_at, ended_at=created_at,
+        seconds=(created_at - previous_at).total_seconds(),
+    )], ignore_conflicts=True)
+
+
+def split_at(ch, created_at):
+    """A late reading inside a recorded gap splits it; parts under the threshold go."""
+    with transaction.atomic():
+        gap = DataGap.objects.select_for_update().filter(
+            chamber=ch, started_at__lt=created_at, ended_at__gt=created_at,
+        ).first()
+        if gap is None:
+            return
+        gap.delete()
+        DataGap.objects.bulk_create([
+            DataGap(chamber=ch, started_at=a, ended_at=b, seconds=(b - a).total_seconds())
+            for a, b in ((gap.started_at, created_at), (created_at, gap.ended_at))
+            if b - a > threshold()
+        ], ignore_conflicts=True)
+
+
+def backfill(ch, start=None, end=None):
+    """Find every gap in [start, end] from stored timestamps; returns the number found."""
+    import numpy as np
+
+    ts = source_for(ch).timestamps(start, end)
+    if len(ts) < 2:
+        return 0
+    limit = int(threshold().total_seconds() * 1000)
+    idx = np.flatnonzero(np.diff(ts) > limit)
+    DataGap.objects.bulk_create([
+        DataGap(
+            chamber=ch, started_at=from_ms(int(ts[i])), ended_at=from_ms(int(ts[i + 1])),
+            seconds=(int(ts[i + 1]) - int(ts[i])) / 1000,
+        )
+        for i in idx
+    ], batch_size=1000, ignore_conflicts=True)
+    return len(idx)
+
+
+def gaps_between(ch, start=None, end=None):
+    """Closed gaps overlapping [start, end], oldest first."""
+    qs = DataGap.objects.filter(chamber=ch)
+    if start is not None:
+        qs = qs.filter(ended_at__gte=start)
+    if end is not None:
+        qs = qs.filter(started_at__lte=end)
+    return list(qs.values_list("started_at", "ended_at", "seconds"))
+
+
+def offline_since(last_at):
+    """The time of the last reading when the chamber is currently silent, else None."""
+    if last_at is None or timezone.now() - last_at <= threshold():
+        return None
+    return last_at
+
+
+def as_json(started_at, ended_at, seconds):
+    return {
+        "from": timezone.localtime(started_at).isoformat(timespec="seconds"),
+        "to": timezone.localtime(ended_at).isoformat(timespec="seconds"),
+        "seconds": round(seconds, 1),
+    }
@@ -0,0 +1,107 @@
+import logging
+import math
+from operator import itemgetter
+
+from .alerts import evaluate_batch_safely
+from .devicetime import device_time, repair_late
+from . import gaps
+from .readings import FIELDS, source_for
+
+logger = logging.getLogger("sensor.ingest")
+
+# ---------------- Reading intake ----------------
+# What every ingest path shares -- the HTTP endpoint (views.ingest_sensor_data)
+# and the socket listener (sensor.listener): one validation of a reading
+# payload, and record_batch() to store a batch of validated readings of one
+# chamber with a single bulk write and keep the derived data (gaps, alert
+# state, late-reading repairs) exactly as one-by-one ingest would.
+
+# the chamber tables' check constraints: a value outside them would fail a whole batch
+LIMITS = {"temperature": (-50.0, 150.0), "humidity": (0.0, 100.0)}
+
+
+def validate(payload, now=None):
+    """
+    (created_at or None, {channel: float}) from a decoded reading payload.
+    Raises ValueError with a message fit for the sender.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object")
+    missing = [f for f in FIELDS if f not in payload]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    values = {}
+    for f in FIELDS:
+        try:
+            v = float(payload[f])
+        except (TypeError, ValueError):
+            raise ValueError(f"{f} must be a number")
+        if not math.isfinite(v):
+            raise ValueError(f"{f} must be a finite number")
+        lo, hi = LIMITS.get(f, (-math.inf, math.inf))
+        if not lo <= v <= hi:
+            raise ValueError(f"{f} must be between {lo:g} and {hi:g}")
+        values[f] = v
+    # optional device time ("ts"), see sensor.devicetime
+    return device_time(payload, now), values
+
+
+def record_batch(ch, readings):
+    """
+    Store validated (created_at or None, values) readings of `ch` with one
+    bulk write; readings without a device time are stamped now. Ones whose
+    device time is already stored are dropped (resends after a lost
+    acknowledgement), and so are late ones on an append-only backend
+    (sensor.tsstore). Returns the number stored.
+    """
+    from django.utils import timezone
+
+    if not readings:
+        return 0
+    source = source_for(ch)
+    sent = [t for t, _ in readings if t is not None]
+    if sent:
+        stored = source.stored(sent)
+        fresh = []
+        for t, v in readings:
+            if t is not None:
+                if t in stored:
+                    continue
+                stored.add(t)
+            fresh.append((t, v))
+        readings = fresh
+    now = timezone.now()
+    batch = sorted(((t or now, v) for t, v in readings), key=itemgetter(0))
+    if not batch:
+        return 0
+
+    refused = ()
+    append_only = getattr(source, "append_only", False)
+    if append_only:
+        from .tsstore import OutOfOrder as refused
+    while True:
+        previous_at = source.last_timestamp()
+        if append_only and previous_at is not None:
+            kept = [r for r in batch if r[0] >= previous_at]
+            if len(kept) < len(batch):
+                logger.warning("%s: %d readings older than the newest stored one dropped",
+                               ch, len(batch) - len(kept))
+            batch = kept
+            if not batch:
+                return 0
+        try:
+            source.append_many(batch)
+            break
+        except refused:
+            continue        # another process appended newer readings meanwhile: filter again
+    in_order = []
+    last = previous_at
+    for created_at, values in batch:
+        if previous_at is not None and created_at < previous_at:
+            repair_late(ch, created_at, values)
+        else:
+            gaps.note_reading(ch, last, created_at)
+            last = created_at
+            in_order.append((created_at, values))
+    evaluate_batch_safely(ch, in_order)
+    return len(batch)
@@ -0,0 +1,372 @@
+import asyncio
+import hmac
+import json
+import logging
+import struct
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import spool
+from .ingest import record_batch, validate
+from .readings import FIELDS, MODEL_BY_CH
+
+logger = logging.getLogger("sensor.listener")
+
+# ---------------- Socket ingest ----------------
+# For devices that can't afford HTTP per reading: a standalone asyncio
+# server (manage.py run_listener) taking readings over persistent TCP
+# connections or UDP datagrams. Readings get the same checks as the HTTP
+# endpoint (sensor.ingest.validate) and are stored per chamber in bulk
+# (ingest.record_batch), every SENSOR_LISTENER_BATCH readings or
+# SENSOR_LISTENER_FLUSH_MS, by one writer thread -- the event loop never
+# touches the database. With SENSOR_SPOOL_DIR set, stored means written to
+# the local spool (sensor.spool).
+#
+# A connection is text, one command or reading per line:
+#
+#   AUTH <device> <key>          -> OK | ERR auth
+#   <chamber> <temperature> <pressure> <humidity> <co2> [ts]
+#   {"ch": "ch1", "temperature": ..., "ts": ...}      (the HTTP payload + "ch")
+#   SYNC                         -> OK <accepted> <rejected>, once stored
+#   BINARY                       -> OK, then fixed records to the end
+#
+# Chambers are "ch1" or "1"; ts is optional, as over HTTP (epoch s/ms or
+# ISO 8601). A bad line gets "ERR <line> <reason>" and the connection goes
+# on; readings are only answered in bulk by SYNC. After BINARY each reading
+# is a 25-byte little-endian record (RECORD): chamber number (uint8), epoch
+# ms (int64, 0 = arrival time) and the four channels as float32; chamber 0
+# is a SYNC.
+#
+# A UDP datagram starts with an AUTH line, followed by reading lines or by
+# BINARY and records. Nothing is answered, so it suits senders that can
+# lose a reading now and then.
+#
+# Devices and their keys are SENSOR_DEVICE_KEYS: {device: {"key": ...,
+# "chambers": ["ch1", ...]}} (a bare key string allows every chamber).
+# Authenticated devices are not held to the HTTP rate limits.
+
+RECORD = struct.Struct("<Bq4f")
+MAX_LINE = 4096
+MAX_IN_FLIGHT = 4       # flushes queued for the writer before connections wait
+
+
+# ---------------- Parsing ----------------
+def chamber(name):
+    ch = str(name).strip()
+    ch = ch if ch.startswith("ch") else f"ch{ch}"
+    if ch not in MODEL_BY_CH:
+        raise ValueError(f"unknown chamber {name}")
+    return ch
+
+
+def parse_line(line):
+    """(chamber, payload) from a text reading line."""
+    if line.startswith("{"):
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            raise ValueError("Invalid JSON")
+        if not isinstance(payload, dict):
+            raise ValueError("Expected a JSON object")
+        return chamber(payload.get("ch")), payload
+    parts = line.split()
+    if len(parts) not in (5, 6):
+        raise ValueError("expected <chamber> temperature pressure humidity co2 [ts]")
+    payload = dict(zip(FIELDS, parts[1:5]))
+    if len(parts) == 6:
+        payload["ts"] = parts[5]
+    return chamber(parts[0]), payload
+
+
+def parse_record(buf):
+    """(chamber, payload) from one binary record; chamber 0 (SYNC) is not a reading."""
+    n, ts, *values = RECORD.unpack(buf)
+    payload = dict(zip(FIELDS, values))
+    if ts:
+        payload["ts"] = ts
+    return chamber(n), payload
+
+
+def authenticate(device, key):
+    """The chambers `device` may send for, or None when the key is wrong."""
+    entry = getattr(settings, "SENSOR_DEVICE_KEYS", {}).get(device)
+    if isinstance(entry, str):
+        entry = {"key": entry}
+    expected = (entry or {}).get("key") or ""
+    # compared even for an unknown device, so the answer takes as long
+    if not hmac.compare_digest(expected.encode(), key.encode()) or not entry:
+        return None
+    return set(entry.get("chambers") or MODEL_BY_CH)
+
+
+# ---------------- Writer ----------------
+def store(pending):
+    """
+    Writer thread: record_batch() per chamber, or one spool write with
+    SENSOR_SPOOL_DIR set (sensor.spool). Readings arrive stamped
+    (Batcher.stamp). Returns (stored, failed).
+    """
+    if spool.enabled():
+        readings = [(ch, t, values) for ch, rows in pending.items() for t, values in rows]
+        try:
+            spool.append(readings)
+        except OSError:
+            logger.exception("spooling %d readings failed", len(readings))
+            return 0, len(readings)
+        return len(readings), 0
+
+    close_old_connections()
+    stored = failed = 0
+    for ch, readings in pending.items():
+        try:
+            stored += record_batch(ch, readings)
+        except Exception:
+            logger.exception("storing %d readings of %s failed", len(readings), ch)
+            failed += len(readings)
+    return stored, failed
+
+
+class Batcher:
+    """Readings waiting for the writer thread, per chamber."""
+
+    def __init__(self, batch_size, flush_ms):
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.pending = defaultdict(list)
+        self.size = 0
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="sensor-listener")
+        self.last = None
+        self.in_flight = 0
+        self.stored = self.failed = 0
+        self.stamped = None
+
+    def stamp(self):
+        """
+        Arrival time for a reading sent without one. Every reading gets its
+        own: record_batch() and the spool drain take equal times for resends.
+        """
+        now = timezone.now()
+        if self.stamped is not None and now <= self.stamped:
+            now = self.stamped + timedelta(microseconds=1)
+        self.stamped = now
+        return now
+
+    def add(self, ch, created_at, values):
+        self.pending[ch].append((created_at, values))
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand the pending readings to the writer. Returns a future that is
+        done once they -- and everything handed over before -- are stored.
+        """
+        loop = asyncio.get_running_loop()
+        if self.size:
+            pending, self.pending, self.size = self.pending, defaultdict(list), 0
+            self.in_flight += 1
+            self.last = loop.run_in_executor(self.executor, store, pending)
+            self.last.add_done_callback(self._done)
+        elif self.last is None:
+            self.last = loop.create_future()
+            self.last.set_result((0, 0))
+        return self.last
+
+    def _done(self, fut):
+        self.in_flight -= 1
+        stored, failed = fut.result()
+        self.stored += stored
+        self.failed += failed
+
+    @property
+    def busy(self):
+        return self.in_flight >= MAX_IN_FLIGHT
+
+    async def tick(self):
+        while True:
+            await asyncio.sleep(self.flush_ms / 1000)
+            self.flush()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+# ---------------- Protocol ----------------
+class Session:
+    """
+    One TCP connection or UDP datagram: feed() it bytes, then take the
+    replies from `out` -- strings, and futures a SYNC answer waits for.
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.chambers = None
+        self.binary = False
+        self.buf = b""
+        self.n = 0
+        self.accepted = self.rejected = 0
+        self.out = []
+
+    def feed(self, data):
+        buf = self.buf + data if self.buf else data
+        now = timezone.now()
+        pos = 0
+        while True:
+            if self.binary:
+                if len(buf) - pos < RECORD.size:
+                    break
+                rec = buf[pos:pos + RECORD.size]
+                pos += RECORD.size
+                self.n += 1
+                if rec[0] == 0:
+                    self._sync()
+                else:
+                    self._reading(parse_record, rec, now)
+                continue
+            end = buf.find(b"\n", pos)
+            if end < 0:
+                if len(buf) - pos > MAX_LINE:
+                    raise ValueError("line too long")
+                break
+            line = buf[pos:end]
+            pos = end + 1
+            self._line(line.decode("utf-8", "replace").strip(), now)
+        self.buf = buf[pos:]
+
+    def finish(self):
+        """A datagram's last line needs no newline."""
+        if self.buf and not self.binary:
+            line, self.buf = self.buf, b""
+            self._line(line.decode("utf-8", "replace").strip(), timezone.now())
+
+    def _line(self, line, now):
+        if not line:
+            return
+        self.n += 1
+        word = line.split(None, 1)[0].upper()
+        if word == "AUTH":
+            parts = line.split()
+            self.chambers = authenticate(parts[1], parts[2]) if len(parts) == 3 else None
+            self.out.append("OK" if self.chambers else "ERR auth")
+        elif self.chambers is None:
+            self.out.append(f"ERR {self.n} AUTH first")
+        elif word == "SYNC":
+            self._sync()
+        elif word == "BINARY":
+            self.binary = True
+            self.out.append("OK")
+        else:
+            self._reading(parse_line, line, now)
+
+    def _reading(self, parse, raw, now):
+        if self.chambers is None:
+            self.out.append(f"ERR {self.n} AUTH first")
+            return
+        try:
+            ch, payload = parse(raw)
+            if ch not in self.chambers:
+                raise ValueError(f"not allowed to send for {ch}")
+            created_at, values = validate(payload, now)
+        except ValueError as exc:
+            self.rejected += 1
+            self.out.append(f"ERR {self.n} {exc}")
+            return
+        self.accepted += 1
+        self.batcher.add(ch, created_at or self.batcher.stamp(), values)
+
+    def _sync(self):
+        self.out.append(self.batcher.flush())
+
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    def datagram_received(self, data, addr):
+        session = Session(self.batcher)
+        try:
+            session.feed(data)
+            session.finish()
+        except ValueError:
+            pass
+        if session.rejected or session.chambers is None:
+            logger.debug("datagram from %s: %d rejected%s", addr[0], session.rejected,
+                         "" if session.chambers else ", not authenticated")
+
+
+class Listener:
+    def __init__(self, host="0.0.0.0", tcp_port=None, udp_port=None, batch_size=2000, flush_ms=200):
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.batcher = Batcher(batch_size, flush_ms)
+        self.servers = []
+        self.connections = set()
+
+    async def start(self):
+        """Bind the sockets; returns the (tcp, udp) ports bound, None for one that is off."""
+        loop = asyncio.get_running_loop()
+        tcp = udp = None
+        if self.tcp_port is not None:
+            server = await asyncio.start_server(self._connection, self.host, self.tcp_port)
+            self.servers.append(server)
+            tcp = server.sockets[0].getsockname()[1]
+        if self.udp_port is not None:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: DatagramProtocol(self.batcher), local_addr=(self.host, self.udp_port))
+            self.servers.append(transport)
+            udp = transport.get_extra_info("sockname")[1]
+        self.ticker = asyncio.ensure_future(self.batcher.tick())
+        return tcp, udp
+
+    async def stop(self):
+        self.ticker.cancel()
+        for server in self.servers:
+            server.close()
+        for task in self.connections:
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.batcher.flush()
+        self.batcher.close()
+
+    async def _connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        session = Session(self.batcher)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                try:
+                    session.feed(data)
+                except ValueError as exc:
+                    writer.write(f"ERR {exc}\n".encode())
+                    break
+                await self._answer(session, writer)
+                if self.batcher.busy:
+                    # the writer is behind: stop reading, the device's sends block
+                    await self.batcher.last
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def _answer(self, session, writer):
+        out, session.out = session.out, []
+        for item in out:
+            if isinstance(item, str):
+                writer.write(item.encode() + b"\n")
+                continue
+            _, failed = await item
+            # failures are only known per batch, which may hold other senders' readings
+            line = "ERR store" if failed else f"OK {session.accepted} {session.rejected}"
+            writer.write(line.encode() + b"\n")
+        await writer.drain()
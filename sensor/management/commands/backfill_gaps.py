@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from sensor.gaps import backfill
+from sensor.readings import MODEL_BY_CH
+
+
+class Command(BaseCommand):
+    help = "Scan stored readings once and record every data gap (SENSOR_GAP_SECONDS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+
+    def handle(self, *args, **opts):
+        for ch in opts["chambers"]:
+            self.stdout.write(self.style.SUCCESS(f"{ch}: {backfill(ch)} gaps"))
@@ -0,0 +1,175 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from sensor.bulk import insert_readings
+from sensor.management.commands.generate_readings import synthetic_rows
+from sensor.readings import invalidate_recent
+from sensor.views import MODEL_BY_CH
+
+ENDPOINTS = ["range_rows", "chart_data", "download_csv", "download_pdf", "ingest_sensor_data"]
+BENCH_USER = "bench-superuser"
+
+
+def _parse_size(s):
+    s = s.strip().lower()
+    mult = 1
+    if s.endswith("k"):
+        mult, s = 1_000, s[:-1]
+    elif s.endswith("m"):
+        mult, s = 1_000_000, s[:-1]
+    return int(float(s) * mult)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the sensor hot paths at several table sizes and report latency, "
+        "peak memory and query count as JSON. DELETES all rows of the chosen chamber."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", default=["10k", "100k", "1m"])
+        parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+        parser.add_argument("--chamber", default="ch1", choices=list(MODEL_BY_CH))
+        parser.add_argument("--every", default="1m")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--label", default="", help="free-form version label stored in the results")
+        parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+        parser.add_argument("--compare", help="previous JSON results to report median latency ratios against")
+        parser.add_argument("--noinput", action="store_true")
+
+    def handle(self, *args, **opts):
+        ch = opts["chamber"]
+        Model = MODEL_BY_CH[ch]
+        if not opts["noinput"]:
+            answer = input(f"This deletes every row in {Model._meta.db_table} on "
+                           f"{connection.vendor}:{connection.settings_dict['NAME']}. Continue? [y/N] ")
+            if answer.strip().lower() != "y":
+                raise CommandError("Aborted.")
+
+        user, _ = User.objects.get_or_create(username=BENCH_USER, defaults={"is_superuser": True, "is_staff": True})
+        client = Client()
+        client.force_login(user)
+
+        results = {
+            "label": opts["label"],
+            "started_at": timezone.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "db_vendor": connection.vendor,
+            "chamber": ch,
+            "every": opts["every"],
+            "repeat": opts["repeat"],
+            "runs": [],
+        }
+
+        for size in [_parse_size(s) for s in opts["sizes"]]:
+            Model.objects.all().delete()
+            end = timezone.now().replace(microsecond=0)
+            t0 = time.perf_counter()
+            insert_readings(Model, synthetic_rows(size, end, 1.0, seed=opts["seed"]))
+            invalidate_recent(ch)
+            self.stderr.write(f"[bench] {size} rows loaded in {time.perf_counter() - t0:.1f}s")
+
+            first = Model.objects.order_by("created_at").values_list("created_at", flat=True).first()
+            local_start = timezone.localtime(first) if first else timezone.localtime(end)
+            local_end = timezone.localtime(end) + timedelta(minutes=1)
+            window = {
+                "start": local_start.strftime("%Y-%m-%dT%H:%M"),
+                "end": local_end.strftime("%Y-%m-%dT%H:%M"),
+                "every": opts["every"],
+            }
+
+            for name in opts["endpoints"]:
+                run = self._bench(client, name, ch, window, opts["repeat"])
+                run["rows"] = size
+                results["runs"].append(run)
+                self.stderr.write(
+                    f"[bench] {name:<20} rows={size:<8} median={run['latency_ms']['median']:.1f}ms "
+                    f"peak={run['peak_mem_kb']}KB queries={run['queries']}"
+                )
+
+        if opts["compare"]:
+            self._compare(opts["compare"], results)
+
+        payload = json.dumps(results, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+        else:
+            sys.stdout.write(payload + "\n")
+
+    def _request(self, client, name, ch, window):
+        url = reverse(name, kwargs={"ch": ch})
+        if name == "ingest_sensor_data":
+            body = json.dumps({"temperature": 25.0, "pressure": 25.1, "humidity": 55.0, "co2": 55.2})
+            return client.post(url, data=body, content_type="application/json")
+        if name == "range_rows":
+            return client.get(url, {"every": window["every"]})
+        if name == "chart_data":
+            return client.get(url)
+        return client.get(url, window)
+
+    def _bench(self, client, name, ch, window, repeat):
+        # latency: uninstrumented runs
+        timings = []
+        status = None
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            resp = self._request(client, name, ch, window)
+            # streaming responses are only "done" once fully consumed
+            if getattr(resp, "streaming", False):
+                b"".join(resp.streaming_content)
+            timings.append((time.perf_counter() - t0) * 1000)
+            status = resp.status_code
+
+        # memory + queries: one instrumented run
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self._request(client, name, ch, window)
+            if getattr(resp, "streaming", False):
+                b"".join(resp.streaming_content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "endpoint": name,
+            "status": status,
+            "latency_ms": {
+                "min": round(min(timings), 2),
+                "median": round(statistics.median(timings), 2),
+                "max": round(max(timings), 2),
+            },
+            "peak_mem_kb": peak // 1024,
+            "queries": len(ctx.captured_queries),
+        }
+
+    def _compare(self, path, results):
+        with open(path, encoding="utf-8") as fh:
+            base = json.load(fh)
+        before = {(r["endpoint"], r["rows"]): r for r in base.get("runs", [])}
+        for run in results["runs"]:
+            old = before.get((run["endpoint"], run["rows"]))
+            if not old or not old["latency_ms"]["median"]:
+                continue
+            ratio = run["latency_ms"]["median"] / old["latency_ms"]["median"]
+            run["vs_baseline"] = {
+                "label": base.get("label", ""),
+                "latency_ratio": round(ratio, 3),
+                "queries_delta": run["queries"] - old["queries"],
+            }
+            self.stderr.write(f"[bench] {run['endpoint']:<20} rows={run['rows']:<8} x{ratio:.2f} vs baseline")
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sensor.readings import MODEL_BY_CH
+from sensor.stats import bucket_floor, bucket_size, build_buckets, store_buckets
+
+
+class Command(BaseCommand):
+    help = "Pre-build the per-bucket quantile sketches used by the window statistics API."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--chunk-buckets", type=int, default=168, help="buckets per raw read")
+
+    def handle(self, *args, **opts):
+        end = bucket_floor(timezone.now())
+        start = bucket_floor(end - timedelta(days=opts["days"]))
+        step = bucket_size() * opts["chunk_buckets"]
+        for ch in opts["chambers"]:
+            n = 0
+            lo = start
+            while lo < end:
+                hi = min(lo + step, end)
+                built = build_buckets(ch, lo, hi)
+                store_buckets(ch, built)
+                n += len(built)
+                lo = hi
+            self.stdout.write(self.style.SUCCESS(f"{ch}: sketched {n} buckets"))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sensor import rollups
+from sensor.readings import MODEL_BY_CH
+
+# ---------------- History compaction ----------------
+# Applies SENSOR_ROLLUP_POLICY (see sensor.rollups): readings past each
+# tier's age are replaced by per-bucket min/max/mean/count rows, one short
+# transaction per chunk, oldest first. Safe to stop at any point and to run
+# from cron: every run resumes from the oldest row not yet compacted.
+
+
+class Command(BaseCommand):
+    help = "Replace readings older than SENSOR_ROLLUP_POLICY allows with downsampled aggregates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--chunk-hours", type=float, default=24.0, help="span folded per transaction")
+        parser.add_argument("--sleep", type=float, default=0.0, help="seconds to pause between chunks")
+
+    def handle(self, *args, **opts):
+        try:
+            if not rollups.policy():
+                raise CommandError("SENSOR_ROLLUP_POLICY is empty, nothing to do")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        chunk = timedelta(hours=opts["chunk_hours"])
+        for ch in opts["chambers"]:
+            total = 0
+            try:
+                for res, lo, hi, n in rollups.compact(ch, chunk=chunk, pause=opts["sleep"]):
+                    total += n
+                    self.stdout.write(f"{ch}: {n} rows → {res}s buckets, {lo:%Y-%m-%d %H:%M} – {hi:%Y-%m-%d %H:%M}")
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"{ch}: {total} rows compacted")
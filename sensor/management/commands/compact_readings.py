@@ -0,0 +1,105 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+
+from sensor.readings import COMPACT_BY_CH, FIELDS, MODEL_BY_CH, from_us, invalidate_recent, to_us
+
+# ---------------- Compact schema conversion ----------------
+# Copies chamberN_data into chamberN_compact (models.CompactSensorData) in
+# created_at order, one short transaction per batch, so the legacy table
+# stays online for ingest and reads the whole time. A re-run resumes after
+# the newest copied reading: run it once more after switching
+# SENSOR_READING_BACKEND to "compact" to pick up what arrived in between.
+# The legacy table is left as it is. Readings sharing a microsecond
+# collapse into one row.
+
+
+def table_size(conn, table):
+    """(bytes including indexes, rows) of `table`; bytes is None where the backend can't tell."""
+    with conn.cursor() as cur:
+        if conn.vendor == "mysql":
+            cur.execute(f"ANALYZE TABLE {conn.ops.quote_name(table)}")
+            cur.fetchall()
+            cur.execute(
+                "SELECT data_length + index_length, table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s", [table],
+            )
+            size, rows = cur.fetchone()
+            return int(size), int(rows)      # InnoDB's row estimate
+        cur.execute(f"SELECT COUNT(*) FROM {conn.ops.quote_name(table)}")
+        rows = cur.fetchone()[0]
+        if conn.vendor == "postgresql":
+            cur.execute("SELECT pg_total_relation_size(%s)", [table])
+            return cur.fetchone()[0], rows
+        if conn.vendor == "sqlite":
+            try:
+                cur.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE tbl_name = %s)", [table],
+                )
+            except DatabaseError:
+                return None, rows            # built without the dbstat table
+            return cur.fetchone()[0] or 0, rows
+    return None, rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy readings into the compact tables (SENSOR_READING_BACKEND=compact) in small "
+        "batches while the old tables stay in use, then report bytes per row of both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--sleep", type=float, default=0.0, help="seconds to pause between batches")
+        parser.add_argument("--report-only", action="store_true", help="only print the size report")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **opts):
+        using = opts["database"]
+        for ch in opts["chambers"]:
+            if not opts["report_only"]:
+                self._copy(ch, using, opts["batch_size"], opts["sleep"])
+            self._report(ch, using)
+
+    def _copy(self, ch, using, size, pause):
+        Legacy, Compact = MODEL_BY_CH[ch], COMPACT_BY_CH[ch]
+        scale = Compact.SCALE
+        last = Compact.objects.using(using).order_by("-id").values_list("id", flat=True).first()
+        cursor = None if last is None else from_us(last)
+        qs = Legacy.objects.using(using).order_by("created_at").values_list("created_at", *FIELDS)
+
+        read = 0
+        started = time.perf_counter()
+        while True:
+            batch = list((qs if cursor is None else qs.filter(created_at__gt=cursor))[:size])
+            if not batch:
+                break
+            objs = [
+                Compact(id=to_us(created_at), **{
+                    f: None if v is None else round(v * scale) for f, v in zip(FIELDS, vals)
+                })
+                for created_at, *vals in batch
+            ]
+            with transaction.atomic(using=using):
+                Compact.objects.using(using).bulk_create(objs, ignore_conflicts=True)
+            read += len(batch)
+            cursor = batch[-1][0]
+            rate = read / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f"{ch}: {read} rows copied, up to {cursor:%Y-%m-%d %H:%M:%S} ({rate:,.0f}/s)")
+            if len(batch) < size:
+                break
+            if pause:
+                time.sleep(pause)
+        if read:
+            invalidate_recent(ch)
+
+    def _report(self, ch, using):
+        conn = connections[using]
+        for Model in (MODEL_BY_CH[ch], COMPACT_BY_CH[ch]):
+            table = Model._meta.db_table
+            size, rows = table_size(conn, table)
+            per_row = "n/a" if size is None or not rows else f"{size / rows:,.1f}"
+            self.stdout.write(f"{table}: {rows} rows, {size if size is not None else 'n/a'} bytes, {per_row} bytes/row")
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+
+from sensor import spool
+
+# ---------------- Spool drainer ----------------
+# Loads what ingest spooled under SENSOR_SPOOL_DIR (see sensor.spool) into
+# the database. Run it once, e.g. from cron, or with --follow as a service
+# next to the web workers; while the database is down it retries with
+# growing pauses, up to --max-backoff seconds, and resumes where it stopped.
+
+
+class Command(BaseCommand):
+    help = "Load readings spooled under SENSOR_SPOOL_DIR into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="records per transaction")
+        parser.add_argument("--follow", action="store_true", help="keep draining until stopped")
+        parser.add_argument("--interval", type=float, default=1.0, help="seconds between passes with --follow")
+        parser.add_argument("--max-backoff", type=float, default=60.0)
+
+    def handle(self, *args, **opts):
+        if not spool.enabled():
+            raise CommandError("SENSOR_SPOOL_DIR is not set")
+        backoff = opts["interval"]
+        while True:
+            try:
+                n = spool.drain(batch=max(1, opts["batch"]))
+            except DatabaseError as exc:
+                if not opts["follow"]:
+                    raise CommandError(f"database unavailable: {exc}")
+                self.stderr.write(f"database unavailable ({exc}), retrying in {backoff:.0f}s")
+                close_old_connections()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, opts["max_backoff"])
+                continue
+            backoff = opts["interval"]
+            if n or not opts["follow"]:
+                self.stdout.write(f"{n} readings loaded, {spool.backlog()} bytes left in {settings.SENSOR_SPOOL_DIR}")
+            if not opts["follow"]:
+                return
+            time.sleep(opts["interval"])
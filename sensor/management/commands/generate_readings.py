@@ -0,0 +1,84 @@
+import math
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sensor.bulk import insert_readings, reading_row
+from sensor.readings import invalidate_recent
+from sensor.views import MODEL_BY_CH
+
+
+def synthetic_rows(n, end, interval, gap_rate=0.001, gap_max=3600, outlier_rate=0.0005, seed=None):
+    """
+    Yield n reading_row() tuples ending at `end`, oldest first.
+
+    Channels follow a daily cycle around a chamber setpoint with noise.
+    Devices go offline now and then (`gap_rate` per reading, up to `gap_max`
+    seconds) and sensors occasionally spike (`outlier_rate`), always within
+    the table check constraints.
+    """
+    rnd = random.Random(seed)
+    tz = timezone.get_current_timezone()
+
+    # walk backwards from `end` to place the gaps, then emit oldest first
+    offsets = []
+    t = 0.0
+    for _ in range(n):
+        offsets.append(t)
+        t += interval
+        if rnd.random() < gap_rate:
+            t += rnd.uniform(interval, gap_max)
+    offsets.reverse()
+
+    for off in offsets:
+        ts = end - timedelta(seconds=off)
+        day = 2 * math.pi * (ts.hour * 3600 + ts.minute * 60 + ts.second) / 86400
+        temp = 25.0 + 1.5 * math.sin(day) + rnd.gauss(0, 0.15)
+        temp1 = temp + rnd.gauss(0.2, 0.1)
+        hum = 60.0 + 5.0 * math.cos(day) + rnd.gauss(0, 0.8)
+        hum1 = hum + rnd.gauss(-0.5, 0.5)
+        if rnd.random() < outlier_rate:
+            temp = rnd.choice([-40.0, 140.0])
+        if rnd.random() < outlier_rate:
+            hum = rnd.choice([0.0, 100.0])
+        yield reading_row(
+            ts,
+            round(temp, 2), round(temp1, 2),
+            round(min(100.0, max(0.0, hum)), 2), round(min(100.0, max(0.0, hum1)), 2),
+            tz,
+        )
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate synthetic chamber readings (with gaps and outliers) for local testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--rows", type=int, default=100_000, help="rows per chamber")
+        parser.add_argument("--interval", type=float, default=1.0, help="seconds between readings")
+        parser.add_argument("--gap-rate", type=float, default=0.001)
+        parser.add_argument("--outlier-rate", type=float, default=0.0005)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--clear", action="store_true", help="delete existing rows first")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **opts):
+        if opts["rows"] <= 0 or opts["interval"] <= 0:
+            raise CommandError("--rows and --interval must be positive")
+
+        end = timezone.now().replace(microsecond=0)
+        for ch in opts["chambers"]:
+            Model = MODEL_BY_CH[ch]
+            if opts["clear"]:
+                Model.objects.using(opts["database"]).all().delete()
+            rows = synthetic_rows(
+                opts["rows"], end, opts["interval"],
+                gap_rate=opts["gap_rate"], outlier_rate=opts["outlier_rate"],
+                seed=None if opts["seed"] is None else opts["seed"] + int(ch[-1]),
+            )
+            n = insert_readings(Model, rows, batch_size=opts["batch_size"], using=opts["database"])
+            invalidate_recent(ch)
+            self.stdout.write(self.style.SUCCESS(f"{ch}: inserted {n} rows"))
@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+import time
+from zoneinfo import ZoneInfo
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from sensor import gaps
+from sensor.bulk import insert_readings, load_readings_infile, reading_row
+from sensor.devicetime import parse_ts
+from sensor.models import DataGap, ReadingSketch
+from sensor.readings import FIELDS, MODEL_BY_CH, invalidate_recent
+from sensor.stats import bucket_floor, bucket_size
+
+# ---------------- Historical backfill ----------------
+# Logger exports are CSV (header row) or NDJSON with a timestamp -- created_at,
+# timestamp, ts or separate date + time columns; ISO 8601 or epoch s/ms --
+# and the four channels. Rows keep their logged time. Each chunk is sorted
+# by time (so the created_at/date/time indexes are appended to in order),
+# written in one transaction and then checkpointed by byte offset, so an
+# interrupted run resumes where it stopped.
+
+TS_KEYS = ("created_at", "timestamp", "ts", "datetime")
+LIMITS = {"temperature": (-50, 150), "humidity": (0, 100)}   # table check constraints
+
+
+def _value(v):
+    if v is None or v == "":
+        return None
+    return float(v)
+
+
+def parse_record(rec, tz, site_tz=None):
+    """One reading_row() tuple from a {column: value} mapping; raises ValueError."""
+    key = next((k for k in TS_KEYS if rec.get(k) not in (None, "")), None)
+    if key is not None:
+        created_at = parse_ts(rec[key], tz)
+    elif rec.get("date") and rec.get("time"):
+        created_at = parse_ts(f"{rec['date']}T{rec['time']}", tz)
+    else:
+        raise ValueError("no timestamp")
+    values = [_value(rec.get(f)) for f in FIELDS]
+    for f, v in zip(FIELDS, values):
+        lo, hi = LIMITS.get(f, (None, None))
+        if v is not None and lo is not None and not lo <= v <= hi:
+            raise ValueError(f"{f} out of range")
+    return reading_row(created_at, *values, tz=site_tz)
+
+
+def read_chunks(path, fmt, offset, chunk_lines):
+    """
+    Yield (records, end_offset) for chunks of `chunk_lines` data lines,
+    starting at byte `offset` (0 = start of file). Records are dicts keyed
+    by lower-cased column name.
+    """
+    with open(path, "rb") as f:
+        header = None
+        if fmt == "csv":
+            first = f.readline()
+            header = [h.strip().lower() for h in next(csv.reader([first.decode("utf-8-sig")]))]
+            offset = max(offset, len(first))
+        f.seek(offset)
+        pos = offset
+        while True:
+            lines = []
+            for raw in f:
+                pos += len(raw)
+                if raw.strip():
+                    lines.append(raw.decode("utf-8"))
+                if len(lines) >= chunk_lines:
+                    break
+            if not lines:
+                return
+            if fmt == "csv":
+                records = [dict(zip(header, cells)) for cells in csv.reader(lines)]
+            else:
+                records = [{k.lower(): v for k, v in json.loads(line).items()} for line in lines]
+            yield records, pos
+
+
+def _format_of(path, fmt):
+    if fmt != "auto":
+        return fmt
+    return "ndjson" if path.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load historical logger files (CSV or NDJSON) into a chamber table, keeping "
+        "their timestamps. Resumable: progress is checkpointed next to each file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("chamber", choices=list(MODEL_BY_CH))
+        parser.add_argument("files", nargs="+")
+        parser.add_argument("--format", choices=["auto", "csv", "ndjson"], default="auto")
+        parser.add_argument("--tz", default=None, help="zone of naive timestamps (default TIME_ZONE)")
+        parser.add_argument("--chunk", type=int, default=50_000, help="rows per transaction/checkpoint")
+        parser.add_argument("--method", choices=["auto", "insert", "infile"], default="auto",
+                            help="auto = LOAD DATA LOCAL INFILE on MySQL when permitted, else multi-row INSERT")
+        parser.add_argument("--skip-existing", action="store_true",
+                            help="drop rows whose timestamp is already stored (always done for the first chunk after a resume)")
+        parser.add_argument("--restart", action="store_true", help="ignore existing checkpoints")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **opts):
+        ch = opts["chamber"]
+        Model = MODEL_BY_CH[ch]
+        tz = ZoneInfo(opts["tz"]) if opts["tz"] else timezone.get_current_timezone()
+        using = opts["database"]
+        self.method = opts["method"]
+        if self.method == "auto":
+            self.method = "infile" if connections[using].vendor == "mysql" else "insert"
+
+        lo = hi = None
+        for path in opts["files"]:
+            if not os.path.exists(path):
+                raise CommandError(f"{path}: no such file")
+            first, last = self._load_file(Model, path, _format_of(path, opts["format"]), tz, using, opts)
+            if first is not None:
+                lo = first if lo is None else min(lo, first)
+                hi = last if hi is None else max(hi, last)
+
+        if lo is not None:
+            invalidate_recent(ch)
+            # stored sketches of the loaded span are now stale; gaps get re-scanned
+            size = bucket_size()
+            ReadingSketch.objects.using(using).filter(
+                chamber=ch, bucket_start__gte=bucket_floor(lo), bucket_start__lt=bucket_floor(hi) + size,
+            ).delete()
+            # a gap recorded live across the span (the outage the file fills) goes; the
+            # span is re-scanned from the stored readings on either side of it
+            stored = Model.objects.using(using).values_list("created_at", flat=True)
+            before = stored.filter(created_at__lt=lo).order_by("-created_at").first()
+            after = stored.filter(created_at__gt=hi).order_by("created_at").first()
+            DataGap.objects.using(using).filter(chamber=ch, started_at__lt=hi, ended_at__gt=lo).delete()
+            found = gaps.backfill(ch, before or lo, after or hi)
+            self.stdout.write(f"{ch}: {found} gaps in the loaded span")
+
+    def _load_file(self, Model, path, fmt, tz, using, opts):
+        ckpt_path = path + f".{Model._meta.db_table}.ckpt"
+        stat = os.stat(path)
+        ckpt = {"offset": 0, "rows": 0, "rejected": 0}
+        if not opts["restart"] and os.path.exists(ckpt_path):
+            with open(ckpt_path) as f:
+                ckpt = json.load(f)
+            if ckpt.get("size", 0) > stat.st_size:
+                raise CommandError(f"{path} shrank since the checkpoint; rerun with --restart")
+            if ckpt["offset"] >= stat.st_size:
+                self.stdout.write(f"{path}: already loaded ({ckpt['rows']} rows)")
+                return None, None
+            self.stdout.write(f"{path}: resuming at byte {ckpt['offset']} ({ckpt['rows']} rows loaded)")
+        resumed = ckpt["offset"] > 0
+
+        site_tz = timezone.get_current_timezone()
+        first = last = None
+        started = time.perf_counter()
+        loaded = 0
+        for records, end in read_chunks(path, fmt, ckpt["offset"], opts["chunk"]):
+            rows = []
+            for rec in records:
+                try:
+                    rows.append(parse_record(rec, tz, site_tz))
+                except (ValueError, TypeError):
+                    ckpt["rejected"] += 1
+            rows.sort(key=lambda r: r[-1])
+
+            if rows and (opts["skip_existing"] or resumed):
+                # a crash between commit and checkpoint would otherwise load this chunk twice
+                have = set(Model.objects.using(using).filter(
+                    created_at__range=(rows[0][-1], rows[-1][-1]),
+                ).values_list("created_at", flat=True))
+                rows = [r for r in rows if r[-1] not in have]
+            resumed = False
+
+            if rows:
+                loaded += self._write(Model, rows, using)
+                first = rows[0][-1] if first is None else min(first, rows[0][-1])
+                last = rows[-1][-1] if last is None else max(last, rows[-1][-1])
+
+            ckpt.update(offset=end, rows=ckpt["rows"] + len(rows), size=stat.st_size)
+            tmp = ckpt_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(ckpt, f)
+            os.replace(tmp, ckpt_path)
+
+            rate = loaded / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f"{path}: {end * 100 // max(stat.st_size, 1)}% {ckpt['rows']} rows ({rate:,.0f}/s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: {ckpt['rows']} rows loaded, {ckpt['rejected']} rejected ({self.method})"
+        ))
+        return first, last
+
+    def _write(self, Model, rows, using):
+        if self.method == "infile":
+            try:
+                return load_readings_infile(Model, rows, using=using)
+            except DatabaseError as exc:
+                # local_infile disabled on the server or client
+                self.stderr.write(f"LOAD DATA unavailable ({exc}); using multi-row INSERT")
+                self.method = "insert"
+        return insert_readings(Model, rows, batch_size=5000, using=using)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from sensor.readings import MODEL_BY_CH, OrmReadings, SegmentReadings, from_ms, invalidate_recent
+
+
+class Command(BaseCommand):
+    help = "Copy readings from the database tables into the segment store (SENSOR_READING_BACKEND=segments)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--batch-size", type=int, default=100_000)
+
+    def handle(self, *args, **opts):
+        for ch in opts["chambers"]:
+            target = SegmentReadings(ch)
+            last = target.store.last()
+            start = None
+            if last is not None:
+                # resume after the newest record already in the store
+                start = from_ms(int(last["ts"]) + 1)
+
+            src = OrmReadings(ch).arrays(start)
+            for pos in range(0, len(src), opts["batch_size"]):
+                target.store.append(src[pos:pos + opts["batch_size"]])
+            invalidate_recent(ch)
+            self.stdout.write(self.style.SUCCESS(f"{ch}: copied {len(src)} rows, store holds {target.count()}"))
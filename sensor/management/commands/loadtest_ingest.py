@@ -0,0 +1,239 @@
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from sensor import spool
+from sensor.readings import MODEL_BY_CH, source_for
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.status = {}
+        self.errors = 0
+        self.retries = 0
+        self.acked = {}       # ch -> readings confirmed with a 2xx (202: spooled)
+        self.ambiguous = {}   # ch -> posts whose outcome is unknown (timeout / dropped)
+
+    def record(self, ch, latency, status):
+        with self.lock:
+            self.latencies.append(latency)
+            key = str(status)
+            self.status[key] = self.status.get(key, 0) + 1
+            if status is not None and 200 <= status < 300:
+                self.acked[ch] = self.acked.get(ch, 0) + 1
+            else:
+                self.errors += 1
+            if status is None:
+                # timed out or dropped: stored or not, even if a retry is acknowledged later
+                self.ambiguous[ch] = self.ambiguous.get(ch, 0) + 1
+
+
+class Device(threading.Thread):
+    """One simulated sensor posting readings to its chamber."""
+
+    def __init__(self, idx, host, port, ch, path, rate, deadline, stats, opts, burst_barrier):
+        super().__init__(daemon=True)
+        self.idx, self.host, self.port, self.ch, self.path = idx, host, port, ch, path
+        self.interval = 1.0 / rate
+        self.deadline = deadline
+        self.stats = stats
+        self.opts = opts
+        self.burst_barrier = burst_barrier
+        self.rnd = random.Random(idx)
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.opts["timeout"])
+
+    def _post(self, body):
+        if self.conn is None or not self.opts["keepalive"]:
+            self._connect()
+        t0 = time.perf_counter()
+        try:
+            self.conn.request("POST", self.path, body=body, headers={"Content-Type": "application/json"})
+            resp = self.conn.getresponse()
+            resp.read()
+            status = resp.status
+            retry_after = resp.getheader("Retry-After")
+        except (OSError, http.client.HTTPException):
+            self.conn = None
+            status = retry_after = None
+        latency = (time.perf_counter() - t0) * 1000
+        self.stats.record(self.ch, latency, status)
+        return status, retry_after
+
+    def run(self):
+        # spread device start times over one interval
+        time.sleep(self.rnd.uniform(0, self.interval))
+        next_at = time.perf_counter()
+        sent = 0
+        while time.perf_counter() < self.deadline:
+            body = json.dumps({
+                "temperature": round(25 + self.rnd.gauss(0, 0.5), 2),
+                "pressure": round(25 + self.rnd.gauss(0, 0.5), 2),
+                "humidity": round(60 + self.rnd.gauss(0, 2), 2),
+                "co2": round(60 + self.rnd.gauss(0, 2), 2),
+                "device": f"loadtest-{self.idx}",
+            })
+            status, retry_after = self._post(body)
+
+            # retry storm: failed posts are retried immediately, no backoff,
+            # except that a 429 waits as long as its Retry-After asks
+            tries = 0
+            while not (status and 200 <= status < 300) and tries < self.opts["max_retries"] \
+                    and time.perf_counter() < self.deadline:
+                if status == 429 and retry_after:
+                    try:
+                        wait = float(retry_after)
+                    except ValueError:
+                        wait = 0
+                    time.sleep(max(0.0, min(wait, self.deadline - time.perf_counter())))
+                    if time.perf_counter() >= self.deadline:
+                        break
+                with self.stats.lock:
+                    self.stats.retries += 1
+                tries += 1
+                status, retry_after = self._post(body)
+
+            sent += 1
+            if self.burst_barrier is not None and sent % self.opts["burst_every"] == 0:
+                # reconnect burst: everyone drops the connection and comes back at once
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                try:
+                    self.burst_barrier.wait(timeout=max(0.0, self.deadline - time.perf_counter()))
+                except threading.BrokenBarrierError:
+                    pass
+                next_at = time.perf_counter()
+                continue
+
+            next_at += self.interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_at = time.perf_counter()
+        if self.conn is not None:
+            self.conn.close()
+        if self.burst_barrier is not None:
+            self.burst_barrier.abort()
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a fleet of devices posting to ingest_sensor_data on a local server and report "
+        "throughput, latency percentiles, error rates and stored row counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the running server")
+        parser.add_argument("--devices", type=int, default=20)
+        parser.add_argument("--rate", type=float, default=1.0, help="posts per second per device")
+        parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--max-retries", type=int, default=0, help="immediate retries per failed post")
+        parser.add_argument("--burst-every", type=int, default=0,
+                            help="every N posts all devices drop and reopen their connections together")
+        parser.add_argument("--keepalive", action="store_true", help="reuse one connection per device")
+        parser.add_argument("--timeout", type=float, default=10.0)
+        parser.add_argument("--no-verify", action="store_true", help="skip the stored row count check")
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **opts):
+        parts = urlsplit(opts["url"])
+        if parts.scheme != "http" or not parts.hostname:
+            raise CommandError("--url must be a plain http:// URL of a local server")
+        if opts["devices"] <= 0 or opts["rate"] <= 0:
+            raise CommandError("--devices and --rate must be positive")
+
+        verify = not opts["no_verify"]
+        if verify and spool.enabled():
+            # acknowledged readings wait in the spool: load what is there now and after the run
+            self.stderr.write(f"draining {settings.SENSOR_SPOOL_DIR} before counting stored readings")
+            spool.drain()
+        before = {ch: source_for(ch).count() for ch in opts["chambers"]} if verify else {}
+
+        stats = Stats()
+        barrier = threading.Barrier(opts["devices"]) if opts["burst_every"] > 0 else None
+        deadline = time.perf_counter() + opts["duration"]
+        devices = []
+        for i in range(opts["devices"]):
+            ch = opts["chambers"][i % len(opts["chambers"])]
+            path = reverse("ingest_sensor_data", kwargs={"ch": ch})
+            devices.append(Device(i, parts.hostname, parts.port or 80, ch, path,
+                                  opts["rate"], deadline, stats, opts, barrier))
+
+        t0 = time.perf_counter()
+        for d in devices:
+            d.start()
+        for d in devices:
+            d.join()
+        elapsed = time.perf_counter() - t0
+
+        lat = sorted(stats.latencies)
+        total = len(lat)
+        report = {
+            "devices": opts["devices"],
+            "rate_per_device": opts["rate"],
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "retries": stats.retries,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0,
+            "acked_rps": round(sum(stats.acked.values()) / elapsed, 1) if elapsed else 0,
+            "error_rate": round(stats.errors / total, 4) if total else 0,
+            "status": stats.status,
+            "latency_ms": {
+                "p50": percentile(lat, 50),
+                "p95": percentile(lat, 95),
+                "p99": percentile(lat, 99),
+                "max": lat[-1] if lat else None,
+            },
+            "chambers": {},
+        }
+
+        ok = True
+        if verify and spool.enabled():
+            spool.drain()
+        for ch in opts["chambers"]:
+            entry = {"acked": stats.acked.get(ch, 0), "unknown": stats.ambiguous.get(ch, 0)}
+            if verify:
+                stored = source_for(ch).count() - before[ch]
+                entry["stored"] = stored
+                # readings whose response was lost may or may not have been written
+                entry["match"] = entry["acked"] <= stored <= entry["acked"] + entry["unknown"]
+                ok = ok and entry["match"]
+            report["chambers"][ch] = entry
+        report["verified"] = ok if verify else None
+
+        for key in ("p50", "p95", "p99", "max"):
+            if report["latency_ms"][key] is not None:
+                report["latency_ms"][key] = round(report["latency_ms"][key], 2)
+
+        payload = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+        self.stdout.write(payload)
+        if verify and not ok:
+            raise CommandError("Stored row counts do not match the acknowledged readings.")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sensor.alerts import STATE_FIELDS, replay
+from sensor.models import AlertRule, Excursion
+from sensor.readings import FIELDS, MODEL_BY_CH, source_for
+
+
+class Command(BaseCommand):
+    help = "Re-evaluate alert rules over the stored readings and rebuild their excursions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chambers", nargs="+", default=list(MODEL_BY_CH), choices=list(MODEL_BY_CH))
+        parser.add_argument("--rules", nargs="+", type=int, help="only these rule ids")
+
+    def handle(self, *args, **opts):
+        for ch in opts["chambers"]:
+            rules = AlertRule.objects.filter(chamber=ch, enabled=True)
+            if opts["rules"]:
+                rules = rules.filter(pk__in=opts["rules"])
+            rules = list(rules)
+            if not rules:
+                continue
+            for rule in rules:
+                rule.last_value = rule.last_at = rule.breach_since = rule.open_excursion = None
+
+            readings = (
+                (created_at, dict(zip(FIELDS, vals)))
+                for created_at, *vals in source_for(ch).rows()
+            )
+            found = replay(rules, readings)
+            still_open = {id(r.open_excursion) for r in rules if r.open_excursion is not None}
+
+            with transaction.atomic():
+                AlertRule.objects.filter(pk__in=[r.pk for r in rules]).update(open_excursion=None)
+                Excursion.objects.filter(rule__in=rules).delete()
+                Excursion.objects.bulk_create(
+                    [e for e in found if id(e) not in still_open], batch_size=1000
+                )
+                for rule in rules:
+                    if rule.open_excursion is not None:
+                        rule.open_excursion.save()
+                AlertRule.objects.bulk_update(rules, STATE_FIELDS)
+            self.stdout.write(self.style.SUCCESS(
+                f"{ch}: {len(rules)} rules, {len(found)} excursions ({len(still_open)} open)"
+            ))
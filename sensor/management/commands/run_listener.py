@@ -0,0 +1,50 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sensor.listener import Listener
+
+# ---------------- Socket ingest server ----------------
+# Runs sensor.listener next to (not instead of) the web app: one process
+# per host is plenty, its writer thread batches every device's readings.
+# Stops on SIGINT/SIGTERM after storing what it already accepted.
+
+
+class Command(BaseCommand):
+    help = "Accept sensor readings over persistent TCP connections and UDP (see sensor.listener)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default=getattr(settings, "SENSOR_LISTENER_HOST", "0.0.0.0"))
+        parser.add_argument("--tcp-port", type=int, default=getattr(settings, "SENSOR_LISTENER_TCP_PORT", 7070),
+                            help="0 to turn TCP off")
+        parser.add_argument("--udp-port", type=int, default=getattr(settings, "SENSOR_LISTENER_UDP_PORT", 7071),
+                            help="0 to turn UDP off")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "SENSOR_LISTENER_BATCH", 2000))
+        parser.add_argument("--flush-ms", type=int, default=getattr(settings, "SENSOR_LISTENER_FLUSH_MS", 200))
+
+    def handle(self, *args, **opts):
+        if not getattr(settings, "SENSOR_DEVICE_KEYS", {}):
+            raise CommandError("SENSOR_DEVICE_KEYS is empty: no device could authenticate")
+        if not opts["tcp_port"] and not opts["udp_port"]:
+            raise CommandError("both TCP and UDP are off")
+        listener = Listener(
+            host=opts["host"], tcp_port=opts["tcp_port"] or None, udp_port=opts["udp_port"] or None,
+            batch_size=max(1, opts["batch_size"]), flush_ms=max(10, opts["flush_ms"]),
+        )
+        asyncio.run(self.serve(listener))
+
+    async def serve(self, listener):
+        try:
+            tcp, udp = await listener.start()
+        except OSError as exc:
+            raise CommandError(f"can't bind: {exc}")
+        self.stdout.write(f"listening on {listener.host}: tcp {tcp or 'off'}, udp {udp or 'off'}")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        await listener.stop()
+        self.stdout.write(f"stopped: {listener.batcher.stored} readings stored, {listener.batcher.failed} failed")
@@ -0,0 +1,106 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# ---------------- Icon font subset ----------------
+# The pages use a couple of dozen Font Awesome (solid) icons out of ~1400.
+# This writes static/vendor/fontawesome/icons.css and a WOFF2 holding only
+# the glyphs the templates name (class="fa-solid fa-xyz"), taken from a Font
+# Awesome Free 6 distribution, e.g. the unpacked fontawesomefree wheel
+# (fontawesomefree/static/fontawesomefree) or npm @fortawesome/fontawesome-free.
+# Re-run it after using a new icon; IconSubsetTests catches a forgotten one.
+
+ICON_RE = re.compile(r"\bfa-([a-z0-9]+(?:-[a-z0-9]+)*)")
+RULE_RE = re.compile(r"([^{}]+)\{\s*content:\s*\"\\([0-9a-f]+)\";?\s*\}")
+
+BASE_CSS = """\
+@font-face {
+  font-family: "Font Awesome 6 Free";
+  font-style: normal;
+  font-weight: 900;
+  font-display: block;
+  src: url("fa-solid-900.woff2") format("woff2"); }
+
+.fa, .fas, .fa-solid {
+  -moz-osx-font-smoothing: grayscale;
+  -webkit-font-smoothing: antialiased;
+  display: var(--fa-display, inline-block);
+  font-family: "Font Awesome 6 Free";
+  font-weight: 900;
+  font-style: normal;
+  font-variant: normal;
+  line-height: 1;
+  text-rendering: auto; }
+"""
+
+
+def template_dirs():
+    dirs = [Path(d) for t in settings.TEMPLATES for d in t.get("DIRS", [])]
+    return dirs + [Path(__file__).resolve().parents[2] / "templates"]
+
+
+def used_icons(dirs=None):
+    """Icon names (without "fa-") appearing in the templates."""
+    names = set()
+    for d in dirs or template_dirs():
+        for path in Path(d).rglob("*.html"):
+            names.update(ICON_RE.findall(path.read_text(encoding="utf-8")))
+    return names
+
+
+def codepoints(css):
+    """{icon name: codepoint} from Font Awesome's all.css, aliases included."""
+    found = {}
+    for selectors, hexcode in RULE_RE.findall(css):
+        for sel in selectors.split(","):
+            m = re.fullmatch(r"\s*\.fa-([a-z0-9-]+)::?before\s*", sel)
+            if m:
+                found[m.group(1)] = int(hexcode, 16)
+    return found
+
+
+class Command(BaseCommand):
+    help = "Write a Font Awesome CSS + WOFF2 subset with just the icons the templates use."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", required=True,
+                            help="Font Awesome Free 6 directory containing css/all.css and webfonts/")
+        parser.add_argument("--out", default=str(Path(settings.BASE_DIR) / "static" / "vendor" / "fontawesome"))
+
+    def handle(self, *args, **opts):
+        from fontTools import subset
+
+        source, out = Path(opts["source"]), Path(opts["out"])
+        try:
+            css = (source / "css" / "all.css").read_text(encoding="utf-8")
+        except OSError as exc:
+            raise CommandError(f"can't read Font Awesome CSS: {exc}")
+        known = codepoints(css)
+        # the rest of the fa- classes are styles and sizes (fa-solid, fa-2x)
+        icons = {name: known[name] for name in sorted(used_icons()) if name in known}
+        if not icons:
+            raise CommandError("no Font Awesome icons found in the templates")
+
+        options = subset.Options()
+        options.flavor = "woff2"
+        options.layout_features = []
+        options.name_IDs = ["*"]        # keep the copyright and license records
+        font = subset.load_font(str(source / "webfonts" / "fa-solid-900.ttf"), options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=icons.values())
+        subsetter.subset(font)
+        out.mkdir(parents=True, exist_ok=True)
+        subset.save_font(font, str(out / "fa-solid-900.woff2"), options)
+
+        banner = re.match(r"/\*!.*?\*/", css, re.S)
+        rules = "".join(f'\n.fa-{name}::before {{ content: "\\{cp:x}"; }}' for name, cp in icons.items())
+        (out / "icons.css").write_text(
+            (banner.group(0) + "\n" if banner else "")
+            + "/* Subset written by manage.py subset_icons -- do not edit */\n"
+            + BASE_CSS + rules + "\n",
+            encoding="utf-8",
+        )
+        size = (out / "fa-solid-900.woff2").stat().st_size
+        self.stdout.write(f"{len(icons)} icons, {size} bytes of font: {', '.join(icons)}")
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.3 on 2026-10-19 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0012_alter_chamber1data_humidity_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chamber', models.CharField(choices=[('ch1', 'Chamber 1'), ('ch2', 'Chamber 2'), ('ch3', 'Chamber 3')], max_length=3)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sketches', models.JSONField(default=dict)),
+            ],
+            options={
+                'db_table': 'reading_sketch',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='readingsketch',
+            constraint=models.UniqueConstraint(fields=('chamber', 'bucket_start'), name='uniq_sketch_bucket'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.3 on 2026-10-19 11:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0013_readingsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('chamber', models.CharField(choices=[('ch1', 'Chamber 1'), ('ch2', 'Chamber 2'), ('ch3', 'Chamber 3')], max_length=3)),
+                ('channel', models.CharField(choices=[('temperature', 'Temperature'), ('pressure', 'Temperature 1'), ('humidity', 'Humidity'), ('co2', 'Humidity 1')], max_length=12)),
+                ('kind', models.CharField(choices=[('band', 'Outside band'), ('rate', 'Rate of change')], default='band', max_length=4)),
+                ('low', models.FloatField(blank=True, null=True)),
+                ('high', models.FloatField(blank=True, null=True)),
+                ('max_rate', models.FloatField(blank=True, help_text='absolute change per minute', null=True)),
+                ('min_duration', models.PositiveIntegerField(default=0, help_text='seconds the condition must hold before an excursion opens')),
+                ('enabled', models.BooleanField(default=True)),
+                ('last_value', models.FloatField(blank=True, editable=False, null=True)),
+                ('last_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('breach_since', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+            options={
+                'db_table': 'alert_rule',
+            },
+        ),
+        migrations.CreateModel(
+            name='Excursion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chamber', models.CharField(choices=[('ch1', 'Chamber 1'), ('ch2', 'Chamber 2'), ('ch3', 'Chamber 3')], max_length=3)),
+                ('channel', models.CharField(choices=[('temperature', 'Temperature'), ('pressure', 'Temperature 1'), ('humidity', 'Humidity'), ('co2', 'Humidity 1')], max_length=12)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('peak', models.FloatField(help_text='worst value (band) or rate per minute (rate)')),
+                ('samples', models.PositiveIntegerField(default=1)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excursions', to='sensor.alertrule')),
+            ],
+            options={
+                'db_table': 'alert_excursion',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='alertrule',
+            name='open_excursion',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sensor.excursion'),
+        ),
+        migrations.AddIndex(
+            model_name='excursion',
+            index=models.Index(fields=['chamber', 'started_at'], name='alert_excur_chamber_07a897_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alertrule',
+            index=models.Index(fields=['chamber', 'enabled'], name='alert_rule_chamber_9e5bda_idx'),
+        ),
+    ]
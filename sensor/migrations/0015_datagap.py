@@ -0,0 +1,31 @@
+# Generated by Django 5.0.3 on 2026-10-19 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0014_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataGap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chamber', models.CharField(choices=[('ch1', 'Chamber 1'), ('ch2', 'Chamber 2'), ('ch3', 'Chamber 3')], max_length=3)),
+                ('started_at', models.DateTimeField(help_text='last reading before the gap')),
+                ('ended_at', models.DateTimeField(help_text='first reading after the gap')),
+                ('seconds', models.FloatField()),
+            ],
+            options={
+                'db_table': 'data_gap',
+                'ordering': ['started_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='datagap',
+            constraint=models.UniqueConstraint(fields=('chamber', 'started_at'), name='uniq_gap_start'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.3 on 2026-10-19 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0015_datagap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chamber1Compact',
+            fields=[
+                ('id', models.BigIntegerField(help_text='UTC epoch microseconds', primary_key=True, serialize=False)),
+                ('temperature', models.SmallIntegerField(blank=True, null=True)),
+                ('pressure', models.IntegerField(blank=True, null=True)),
+                ('humidity', models.SmallIntegerField(blank=True, null=True)),
+                ('co2', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'chamber1_compact',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Chamber2Compact',
+            fields=[
+                ('id', models.BigIntegerField(help_text='UTC epoch microseconds', primary_key=True, serialize=False)),
+                ('temperature', models.SmallIntegerField(blank=True, null=True)),
+                ('pressure', models.IntegerField(blank=True, null=True)),
+                ('humidity', models.SmallIntegerField(blank=True, null=True)),
+                ('co2', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'chamber2_compact',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Chamber3Compact',
+            fields=[
+                ('id', models.BigIntegerField(help_text='UTC epoch microseconds', primary_key=True, serialize=False)),
+                ('temperature', models.SmallIntegerField(blank=True, null=True)),
+                ('pressure', models.IntegerField(blank=True, null=True)),
+                ('humidity', models.SmallIntegerField(blank=True, null=True)),
+                ('co2', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'chamber3_compact',
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chamber1compact',
+            constraint=models.CheckConstraint(check=models.Q(('temperature__gte', -5000), ('temperature__lte', 15000)), name='chamber1compact_temp_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='chamber1compact',
+            constraint=models.CheckConstraint(check=models.Q(('humidity__gte', 0), ('humidity__lte', 10000)), name='chamber1compact_hum_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='chamber2compact',
+            constraint=models.CheckConstraint(check=models.Q(('temperature__gte', -5000), ('temperature__lte', 15000)), name='chamber2compact_temp_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='chamber2compact',
+            constraint=models.CheckConstraint(check=models.Q(('humidity__gte', 0), ('humidity__lte', 10000)), name='chamber2compact_hum_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='chamber3compact',
+            constraint=models.CheckConstraint(check=models.Q(('temperature__gte', -5000), ('temperature__lte', 15000)), name='chamber3compact_temp_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='chamber3compact',
+            constraint=models.CheckConstraint(check=models.Q(('humidity__gte', 0), ('humidity__lte', 10000)), name='chamber3compact_hum_range'),
+        ),
+    ]
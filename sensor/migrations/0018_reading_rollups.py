@@ -0,0 +1,42 @@
+# Generated by Django 5.0.3 on 2026-10-19 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sensor', '0017_reading_time_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chamber', models.CharField(choices=[('ch1', 'Chamber 1'), ('ch2', 'Chamber 2'), ('ch3', 'Chamber 3')], max_length=3)),
+                ('resolution', models.PositiveIntegerField()),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('temperature_min', models.FloatField(null=True)),
+                ('temperature_max', models.FloatField(null=True)),
+                ('temperature_mean', models.FloatField(null=True)),
+                ('pressure_min', models.FloatField(null=True)),
+                ('pressure_max', models.FloatField(null=True)),
+                ('pressure_mean', models.FloatField(null=True)),
+                ('humidity_min', models.FloatField(null=True)),
+                ('humidity_max', models.FloatField(null=True)),
+                ('humidity_mean', models.FloatField(null=True)),
+                ('co2_min', models.FloatField(null=True)),
+                ('co2_max', models.FloatField(null=True)),
+                ('co2_mean', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'reading_rollup',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='readingrollup',
+            constraint=models.UniqueConstraint(fields=('chamber', 'bucket_start', 'resolution'), name='uniq_rollup_bucket'),
+        ),
+    ]
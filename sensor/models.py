@@ -12,7 +12,8 @@ class BaseSensorData(models.Model):
     humidity    = models.FloatField(null=True, blank=True)
     co2         = models.FloatField(null=True, blank=True)
 
-    created_at  = models.DateTimeField(auto_now_add=True, db_index=True)
+    # arrival time, or the device's own time when it sends one (sensor.devicetime)
+    created_at  = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         abstract = True
@@ -29,9 +30,9 @@ class BaseSensorData(models.Model):
         ]
 
     def save(self, *args, **kwargs):
-        # auto-fill if missing
+        # auto-fill if missing, from the reading's own time
         if not self.date or not self.time:
-            now = timezone.localtime()
+            now = timezone.localtime(self.created_at)
             if not self.date:
                 self.date = now.date()
             if not self.time:
@@ -60,6 +61,51 @@ class Chamber3Data(BaseSensorData):
         verbose_name_plural = "Chamber 3 Readings"
 
 
+class CompactSensorData(models.Model):
+    """
+    Compact layout of a reading (SENSOR_READING_BACKEND = "compact", see
+    sensor.readings.CompactReadings). The primary key is the UTC time in
+    microseconds -- the clustered key and the only index --, date/time are
+    derived from it when read, and channels are integers in hundredths.
+    A row is 8 + 12 bytes of fields instead of 8 + 3 + 3 + 8 + 32.
+    """
+    SCALE = 100
+
+    id = models.BigIntegerField(primary_key=True, help_text="UTC epoch microseconds")
+    temperature = models.SmallIntegerField(null=True, blank=True)   # -50.00 .. 150.00
+    pressure = models.IntegerField(null=True, blank=True)
+    humidity = models.SmallIntegerField(null=True, blank=True)      # 0.00 .. 100.00
+    co2 = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+        constraints = [
+            CheckConstraint(
+                check=Q(temperature__gte=-5000) & Q(temperature__lte=15000),
+                name="%(class)s_temp_range"
+            ),
+            CheckConstraint(
+                check=Q(humidity__gte=0) & Q(humidity__lte=10000),
+                name="%(class)s_hum_range"
+            ),
+        ]
+
+
+class Chamber1Compact(CompactSensorData):
+    class Meta(CompactSensorData.Meta):
+        db_table = "chamber1_compact"
+
+
+class Chamber2Compact(CompactSensorData):
+    class Meta(CompactSensorData.Meta):
+        db_table = "chamber2_compact"
+
+
+class Chamber3Compact(CompactSensorData):
+    class Meta(CompactSensorData.Meta):
+        db_table = "chamber3_compact"
+
+
 from django.contrib.auth.models import User
 
 class ChamberAccess(models.Model):
@@ -73,3 +119,128 @@ class ChamberAccess(models.Model):
 
     def __str__(self):
         return f"{self.user.username} → {self.get_chamber_display()}"
+
+
+class ReadingSketch(models.Model):
+    """Per-bucket quantile sketches of each channel (see sensor.stats)."""
+    chamber = models.CharField(max_length=3, choices=ChamberAccess.CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    sketches = models.JSONField(default=dict)
+
+    class Meta:
+        db_table = "reading_sketch"
+        constraints = [
+            models.UniqueConstraint(fields=["chamber", "bucket_start"], name="uniq_sketch_bucket"),
+        ]
+
+
+class ReadingRollup(models.Model):
+    """
+    Aggregates of one `resolution`-second bucket that replaced the raw
+    readings (or finer rollups) in it once they aged past the retention
+    policy (see sensor.rollups).
+    """
+    chamber = models.CharField(max_length=3, choices=ChamberAccess.CHOICES)
+    resolution = models.PositiveIntegerField()     # seconds
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField()          # readings folded in
+    temperature_min = models.FloatField(null=True)
+    temperature_max = models.FloatField(null=True)
+    temperature_mean = models.FloatField(null=True)
+    pressure_min = models.FloatField(null=True)
+    pressure_max = models.FloatField(null=True)
+    pressure_mean = models.FloatField(null=True)
+    humidity_min = models.FloatField(null=True)
+    humidity_max = models.FloatField(null=True)
+    humidity_mean = models.FloatField(null=True)
+    co2_min = models.FloatField(null=True)
+    co2_max = models.FloatField(null=True)
+    co2_mean = models.FloatField(null=True)
+
+    class Meta:
+        db_table = "reading_rollup"
+        constraints = [
+            models.UniqueConstraint(fields=["chamber", "bucket_start", "resolution"], name="uniq_rollup_bucket"),
+        ]
+
+
+CHANNEL_CHOICES = [
+    ("temperature", "Temperature"),
+    ("pressure", "Temperature 1"),
+    ("humidity", "Humidity"),
+    ("co2", "Humidity 1"),
+]
+
+
+class AlertRule(models.Model):
+    """
+    A per-chamber condition evaluated on every ingested reading (sensor.alerts).
+    The last_* / breach_since / open_excursion fields are the rule's running state.
+    """
+    BAND = "band"
+    RATE = "rate"
+    KINDS = [
+        (BAND, "Outside band"),
+        (RATE, "Rate of change"),
+    ]
+
+    name = models.CharField(max_length=100)
+    chamber = models.CharField(max_length=3, choices=ChamberAccess.CHOICES)
+    channel = models.CharField(max_length=12, choices=CHANNEL_CHOICES)
+    kind = models.CharField(max_length=4, choices=KINDS, default=BAND)
+    low = models.FloatField(null=True, blank=True)
+    high = models.FloatField(null=True, blank=True)
+    max_rate = models.FloatField(null=True, blank=True, help_text="absolute change per minute")
+    min_duration = models.PositiveIntegerField(
+        default=0, help_text="seconds the condition must hold before an excursion opens"
+    )
+    enabled = models.BooleanField(default=True)
+
+    last_value = models.FloatField(null=True, blank=True, editable=False)
+    last_at = models.DateTimeField(null=True, blank=True, editable=False)
+    breach_since = models.DateTimeField(null=True, blank=True, editable=False)
+    open_excursion = models.ForeignKey(
+        "Excursion", null=True, blank=True, editable=False, on_delete=models.SET_NULL, related_name="+"
+    )
+
+    class Meta:
+        db_table = "alert_rule"
+        indexes = [models.Index(fields=["chamber", "enabled"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.chamber} {self.channel})"
+
+
+class Excursion(models.Model):
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE, related_name="excursions")
+    chamber = models.CharField(max_length=3, choices=ChamberAccess.CHOICES)
+    channel = models.CharField(max_length=12, choices=CHANNEL_CHOICES)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+    peak = models.FloatField(help_text="worst value (band) or rate per minute (rate)")
+    samples = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = "alert_excursion"
+        ordering = ["-started_at"]
+        indexes = [models.Index(fields=["chamber", "started_at"])]
+
+    @property
+    def duration(self):
+        return None if self.ended_at is None else (self.ended_at - self.started_at).total_seconds()
+
+
+class DataGap(models.Model):
+    """A stretch with no readings longer than SENSOR_GAP_SECONDS (see sensor.gaps)."""
+    chamber = models.CharField(max_length=3, choices=ChamberAccess.CHOICES)
+    started_at = models.DateTimeField(help_text="last reading before the gap")
+    ended_at = models.DateTimeField(help_text="first reading after the gap")
+    seconds = models.FloatField()
+
+    class Meta:
+        db_table = "data_gap"
+        ordering = ["started_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["chamber", "started_at"], name="uniq_gap_start"),
+        ]
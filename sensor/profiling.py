@@ -0,0 +1,151 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+# ---------------- On-demand profiling ----------------
+# A superuser adds ?_profile=1 (or sends "X-Profile: 1") to any request and
+# it runs under cProfile with every SQL statement timed. The capture --
+# <stamp>-<path>.prof (pstats) plus a .json with the request, the SQL
+# timeline and the hottest functions -- lands in SENSOR_PROFILE_DIR; the
+# newest SENSOR_PROFILE_KEEP are kept and listed at /profiles/.
+# Requests without the flag only pay for one substring test.
+
+FLAG = "_profile"
+HEADER = "HTTP_X_PROFILE"
+TOP_FUNCTIONS = 40
+
+
+def profile_dir():
+    return str(getattr(settings, "SENSOR_PROFILE_DIR", settings.BASE_DIR / "profiles"))
+
+
+def _requested(request):
+    if FLAG in request.META.get("QUERY_STRING", ""):
+        return request.GET.get(FLAG) not in (None, "", "0")
+    return request.META.get(HEADER, "0") not in ("", "0")
+
+
+class SqlTimeline:
+    def __init__(self, t0):
+        self.t0 = t0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                "alias": context["connection"].alias,
+                "at_ms": round((start - self.t0) * 1000, 3),
+                "ms": round((end - start) * 1000, 3),
+                "sql": sql,
+                "params": repr(params)[:500],
+            })
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _requested(request) or not request.user.is_superuser:
+            return self.get_response(request)
+
+        t0 = time.perf_counter()
+        timeline = SqlTimeline(t0)
+        prof = cProfile.Profile()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timeline))
+            prof.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming:
+                    # exports stream; producing the body is part of the cost
+                    body = b"".join(response.streaming_content)
+                    response.streaming_content = [body]
+            finally:
+                prof.disable()
+        total_ms = (time.perf_counter() - t0) * 1000
+
+        name = save_capture(request, response, prof, timeline.queries, total_ms)
+        response["X-Profile-Id"] = name
+        return response
+
+
+def save_capture(request, response, prof, queries, total_ms):
+    root = profile_dir()
+    os.makedirs(root, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", request.path).strip("-")[:60] or "root"
+    name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{slug}"
+
+    prof.dump_stats(os.path.join(root, name + ".prof"))
+    meta = {
+        "name": name,
+        "at": timezone.localtime().isoformat(timespec="seconds"),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "status": response.status_code,
+        "total_ms": round(total_ms, 1),
+        "sql_ms": round(sum(q["ms"] for q in queries), 1),
+        "queries": queries,
+        "top": top_functions(prof),
+    }
+    with open(os.path.join(root, name + ".json"), "w") as fh:
+        json.dump(meta, fh)
+    _prune(root, getattr(settings, "SENSOR_PROFILE_KEEP", 50))
+    return name
+
+
+def top_functions(prof, limit=TOP_FUNCTIONS):
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def _prune(root, keep):
+    names = sorted(f[:-5] for f in os.listdir(root) if f.endswith(".json"))
+    for name in names[:-keep] if keep else names:
+        for ext in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(root, name + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures():
+    """Newest first, without the bulky timeline and stats."""
+    root = profile_dir()
+    if not os.path.isdir(root):
+        return []
+    out = []
+    for f in sorted(os.listdir(root), reverse=True):
+        if f.endswith(".json"):
+            meta = load_capture(f[:-5])
+            if meta:
+                meta["query_count"] = len(meta.pop("queries"))
+                meta.pop("top")
+                out.append(meta)
+    return out
+
+
+def load_capture(name):
+    if not re.fullmatch(r"[A-Za-z0-9-]+", name):
+        return None
+    try:
+        with open(os.path.join(profile_dir(), name + ".json")) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -0,0 +1,101 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("sensor.querybudget")
+
+# ---------------- Query budgets ----------------
+# Views declare how many SQL statements one request may run:
+#
+#     @query_budget(3)
+#     def range_rows(request, ch): ...
+#
+# QueryBudgetMiddleware records every statement of the request and, per
+# settings.QUERY_BUDGET_MODE, logs ("warn"), raises ("raise") or ignores
+# ("off") requests that go over. Statements repeated with the same shape
+# (same SQL, different parameters) are reported as likely N+1 loops.
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the number of queries a view (sync or async) may execute per request."""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER = re.compile(r"\b\d+\b")
+
+
+def query_shape(sql):
+    """SQL with parameter lists and literal numbers folded, for grouping."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _NUMBER.sub("N", sql)
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "alias": context["connection"].alias,
+                "sql": sql,
+                "ms": round((time.perf_counter() - t0) * 1000, 3),
+            })
+
+    def repeated_shapes(self, threshold):
+        counts = Counter(query_shape(q["sql"]) for q in self.queries)
+        return [(shape, n) for shape, n in counts.most_common() if n >= threshold]
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = getattr(settings, "QUERY_BUDGET_MODE", "warn")
+        if mode == "off":
+            return self.get_response(request)
+
+        log = QueryLog()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(log))
+            response = self.get_response(request)
+
+        response["X-Query-Count"] = str(len(log.queries))
+        self._check(request, log, mode)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, "query_budget", None)
+        return None
+
+    def _check(self, request, log, mode):
+        budget = getattr(request, "_query_budget", None)
+        threshold = getattr(settings, "QUERY_BUDGET_REPEAT_THRESHOLD", 5)
+        repeated = log.repeated_shapes(threshold)
+        for shape, n in repeated:
+            logger.warning("%s ran the same query %d times: %s", request.path, n, shape)
+
+        if budget is None or len(log.queries) <= budget:
+            return
+        msg = f"{request.path} ran {len(log.queries)} queries (budget {budget})"
+        if mode == "raise":
+            raise QueryBudgetExceeded(msg + "\n" + "\n".join(q["sql"] for q in log.queries))
+        logger.warning(msg)
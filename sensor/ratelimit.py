@@ -0,0 +1,112 @@
+import math
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+# ---------------- Ingest rate limiting ----------------
+# Token buckets per device and per chamber, SENSOR_INGEST_RATE[scope] =
+# (tokens per second, bucket size), off unless configured. A device is
+# named by the "device" field of its reading, else its X-Device-Id header,
+# else its address (which every device behind one NAT shares).
+#
+# A bucket is kept as the single time at which it will be full again
+# (GCRA), so a check is one get_many and, when the reading is admitted, one
+# set_many on CACHES[SENSOR_INGEST_RATE_CACHE] -- which must be shared
+# (Redis, Memcached, database) for the limits to hold across workers;
+# check_shared_cache() fails `manage.py check` otherwise. Two workers
+# racing on the same bucket can both take its last token; the limit is a
+# guard against runaway senders, not a quota.
+#
+# Refusals are counted per chamber and scope in the same cache (stats()).
+
+SCOPES = ("device", "chamber")
+# per-process backends: every worker would keep buckets of its own
+LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache", "django.core.cache.backends.dummy.DummyCache")
+
+
+def _cache():
+    return caches[getattr(settings, "SENSOR_INGEST_RATE_CACHE", "default")]
+
+
+def _rates():
+    rates = getattr(settings, "SENSOR_INGEST_RATE", None)
+    return {scope: rate for scope, rate in (rates or {}).items() if rate}
+
+
+def device_id(request, payload=None):
+    sent = payload.get("device") if isinstance(payload, dict) else None
+    return (str(sent or "").strip() or (request.headers.get("X-Device-Id") or "").strip())[:64] \
+        or request.META.get("REMOTE_ADDR", "?")
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs=None, **kwargs):
+    if not _rates():
+        return []
+    alias = getattr(settings, "SENSOR_INGEST_RATE_CACHE", "default")
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    if backend in LOCAL_CACHES:
+        return [checks.Error(
+            f"SENSOR_INGEST_RATE is set but CACHES[{alias!r}] ({backend.rsplit('.', 1)[-1]}) is per process",
+            hint="Point SENSOR_INGEST_RATE_CACHE at a shared cache (Redis, Memcached, database) or unset the limits.",
+            id="sensor.E001",
+        )]
+    return []
+
+
+def take(ch, device, now=None):
+    """
+    Take a token from the buckets of `device` and `ch`. Returns 0 when the
+    reading may go in, else the seconds until it may be retried.
+    """
+    rates = _rates()
+    if not rates:
+        return 0
+    now = time.time() if now is None else now
+    keys = {"device": f"ingest:rate:{ch}:dev:{device}", "chamber": f"ingest:rate:{ch}"}
+    keys = {scope: key for scope, key in keys.items() if scope in rates}
+    cache = _cache()
+    found = cache.get_many(keys.values())
+
+    full_at, wait = {}, {}
+    for scope, key in keys.items():
+        per_second, size = rates[scope]
+        interval = 1.0 / per_second
+        at = max(found.get(key, now), now) + interval
+        over = at - now - size * interval
+        if over > 0:
+            wait[scope] = over
+        full_at[key] = at
+    if wait:
+        _count_refusal(ch, device, wait)
+        return max(1, math.ceil(max(wait.values())))
+    # an idle bucket is full again once its deadline passes, so it can expire then
+    timeout = math.ceil(max(at - now for at in full_at.values())) + 1
+    cache.set_many(full_at, timeout=timeout)
+    return 0
+
+
+def _count_refusal(ch, device, wait):
+    cache = _cache()
+    for scope in wait:
+        key = f"ingest:throttled:{ch}:{scope}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    cache.set(f"ingest:throttled:{ch}:last", {"device": device, "at": time.time(), "scopes": sorted(wait)}, timeout=None)
+
+
+def stats(chambers):
+    """{chamber: {scope: refusals, "last": last refused device}} from the shared cache."""
+    scopes = list(SCOPES)
+    keys = [f"ingest:throttled:{ch}:{s}" for ch in chambers for s in scopes + ["last"]]
+    found = _cache().get_many(keys)
+    return {
+        ch: {s: found.get(f"ingest:throttled:{ch}:{s}", 0) for s in scopes}
+        | {"last": found.get(f"ingest:throttled:{ch}:last")}
+        for ch in chambers
+    }
@@ -0,0 +1,571 @@
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, Max, Min, StdDev
+from django.utils import timezone
+
+from .models import (
+    Chamber1Compact, Chamber1Data, Chamber2Compact, Chamber2Data, Chamber3Compact, Chamber3Data,
+)
+
+# ---------------- Reading sources ----------------
+# Read APIs and exports go through a source instead of the models directly:
+#
+#   source_for("ch1").rows(start, end)    -> (created_at, temperature, pressure, humidity, co2)
+#   source_for("ch1").arrays(start, end)  -> numpy RECORD array (ts = UTC epoch ms)
+#   source_for("ch1").moments(start, end) -> {"count", channel: {min, max, mean, stddev}}
+#   source_for("ch1").timestamps(start, end) -> numpy int64 UTC epoch ms, ascending
+#
+# settings.SENSOR_READING_BACKEND picks the storage: "orm" (MySQL tables,
+# the default), "compact" (the chamberN_compact tables, filled by the
+# compact_readings command) or "segments" (sensor.tsstore files under
+# SENSOR_SEGMENT_ROOT).
+# Readings compacted by the retention policy are served from their rollups
+# (sensor.rollups, HistoryReadings). With SENSOR_RING_RECORDS set, the
+# source is also fronted by the host's shared ring buffer (sensor.ring),
+# which answers recent windows and the latest reading.
+# numpy and the segment store are imported on first use to keep worker
+# start-up light.
+
+FIELDS = ("temperature", "pressure", "humidity", "co2")
+
+MODEL_BY_CH = {
+    "ch1": Chamber1Data,
+    "ch2": Chamber2Data,
+    "ch3": Chamber3Data,
+}
+
+COMPACT_BY_CH = {
+    "ch1": Chamber1Compact,
+    "ch2": Chamber2Compact,
+    "ch3": Chamber3Compact,
+}
+
+
+def to_ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def from_ms(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_us(dt):
+    return (dt - EPOCH) // MICROSECOND
+
+
+def from_us(us):
+    return EPOCH + us * MICROSECOND
+
+
+class OrmReadings:
+    def __init__(self, ch):
+        self.ch = ch
+        self.Model = MODEL_BY_CH[ch]
+
+    def _qs(self, start=None, end=None):
+        qs = self.Model.objects.order_by("created_at")
+        if start is not None:
+            qs = qs.filter(created_at__gte=start)
+        if end is not None:
+            qs = qs.filter(created_at__lte=end)
+        return qs
+
+    def rows(self, start=None, end=None):
+        return self._qs(start, end).values_list("created_at", *FIELDS).iterator(chunk_size=5000)
+
+    def arrays(self, start=None, end=None):
+        import numpy as np
+        from .tsstore import RECORD
+
+        def _records():
+            nan = float("nan")
+            for created_at, *vals in self.rows(start, end):
+                yield (to_ms(created_at), *(nan if v is None else v for v in vals))
+        return np.fromiter(_records(), dtype=RECORD)
+
+    def moments(self, start=None, end=None):
+        aggs = {"count": Count("id")}
+        for f in FIELDS:
+            aggs.update({
+                f"{f}__min": Min(f), f"{f}__max": Max(f),
+                f"{f}__mean": Avg(f), f"{f}__stddev": StdDev(f),
+            })
+        res = self._qs(start, end).order_by().aggregate(**aggs)
+        out = {"count": res["count"]}
+        for f in FIELDS:
+            out[f] = {k: res[f"{f}__{k}"] for k in ("min", "max", "mean", "stddev")}
+        return out
+
+    def timestamps(self, start=None, end=None):
+        import numpy as np
+
+        # created_at only, so the scan stays on its index
+        qs = self._qs(start, end).values_list("created_at", flat=True).iterator(chunk_size=20000)
+        return np.fromiter((to_ms(t) for t in qs), dtype="i8")
+
+    def recent(self, start):
+        """(ts ms, id, *channels) tuples since `start`, for seeding the ring."""
+        nan = float("nan")
+        qs = self._qs(start).values_list("created_at", "id", *FIELDS).iterator(chunk_size=5000)
+        for created_at, pk, *vals in qs:
+            yield (to_ms(created_at), pk, *(nan if v is None else v for v in vals))
+
+    def first_timestamp(self):
+        return self.Model.objects.order_by("created_at").values_list("created_at", flat=True).first()
+
+    def last_timestamp(self):
+        return self.Model.objects.order_by("-created_at").values_list("created_at", flat=True).first()
+
+    def latest(self):
+        return self.Model.objects.order_by("-created_at").first()
+
+    def count(self):
+        return self.Model.objects.count()
+
+    def has_reading(self, created_at):
+        return self._qs(created_at, created_at).exists()
+
+    def stored(self, times):
+        """The ones of `times` already stored, compared exactly, in one query."""
+        found = set(self._qs(min(times), max(times)).values_list("created_at", flat=True))
+        return {t for t in times if t in found}
+
+    def span_stats(self):
+        """(first, last, approximate row count) from the index edges, one query."""
+        res = self.Model.objects.aggregate(
+            first=Min("created_at"), last=Max("created_at"), lo=Min("id"), hi=Max("id"),
+        )
+        # deleted rows make the id range an overestimate, which only errs towards caution
+        n = 0 if res["hi"] is None else res["hi"] - res["lo"] + 1
+        return res["first"], res["last"], n
+
+    def append(self, created_at=None, **values):
+        """Store one reading at `created_at` (default now); returns it."""
+        return self.Model.objects.create(created_at=created_at or timezone.now(), **values)
+
+    def append_many(self, rows):
+        """Store (created_at, values) readings with one bulk write (sensor.ingest)."""
+        from .bulk import insert_readings, reading_row
+
+        tz = timezone.get_current_timezone()
+        return insert_readings(self.Model, (
+            reading_row(t, *(values.get(f) for f in FIELDS), tz=tz) for t, values in rows
+        ))
+
+    def delete_range(self, start, end):
+        """Delete the readings in [start, end) (sensor.rollups compaction)."""
+        return self.Model.objects.filter(created_at__gte=start, created_at__lt=end).delete()[0]
+
+
+class CompactReadings(OrmReadings):
+    """
+    The compact tables (models.CompactSensorData): keyed by UTC microseconds,
+    channels in hundredths. Rows, aggregates and the latest reading come
+    back in the same shape and units as OrmReadings.
+    """
+
+    def __init__(self, ch):
+        self.ch = ch
+        self.Model = COMPACT_BY_CH[ch]
+        self.scale = self.Model.SCALE
+
+    def _qs(self, start=None, end=None):
+        qs = self.Model.objects.order_by("id")
+        if start is not None:
+            qs = qs.filter(id__gte=to_us(start))
+        if end is not None:
+            qs = qs.filter(id__lte=to_us(end))
+        return qs
+
+    def _value(self, v):
+        return None if v is None else v / self.scale
+
+    def rows(self, start=None, end=None):
+        for us, *vals in self._qs(start, end).values_list("id", *FIELDS).iterator(chunk_size=5000):
+            yield (from_us(us), *(self._value(v) for v in vals))
+
+    def moments(self, start=None, end=None):
+        out = super().moments(start, end)
+        for f in FIELDS:
+            out[f] = {k: self._value(v) for k, v in out[f].items()}
+        return out
+
+    def timestamps(self, start=None, end=None):
+        import numpy as np
+
+        qs = self._qs(start, end).values_list("id", flat=True).iterator(chunk_size=20000)
+        return np.fromiter(qs, dtype="i8") // 1000
+
+    def stored(self, times):
+        found = set(self._qs(min(times), max(times)).values_list("id", flat=True))
+        return {t for t in times if to_us(t) in found}
+
+    def recent(self, start):
+        nan = float("nan")
+        for us, *vals in self._qs(start).values_list("id", *FIELDS).iterator(chunk_size=5000):
+            yield (us // 1000, us, *(nan if v is None else v / self.scale for v in vals))
+
+    def first_timestamp(self):
+        us = self.Model.objects.order_by("id").values_list("id", flat=True).first()
+        return None if us is None else from_us(us)
+
+    def delete_range(self, start, end):
+        return self.Model.objects.filter(id__gte=to_us(start), id__lt=to_us(end)).delete()[0]
+
+    def span_stats(self):
+        res = self.Model.objects.aggregate(first=Min("id"), last=Max("id"), n=Count("id"))
+        if res["first"] is None:
+            return None, None, 0
+        return from_us(res["first"]), from_us(res["last"]), res["n"]
+
+    def last_timestamp(self):
+        us = self.Model.objects.order_by("-id").values_list("id", flat=True).first()
+        return None if us is None else from_us(us)
+
+    def latest(self):
+        row = self.Model.objects.order_by("-id").values_list("id", *FIELDS).first()
+        return None if row is None else CompactRow(row[0], [self._value(v) for v in row[1:]])
+
+    def append(self, created_at=None, **values):
+        scaled = {f: None if values.get(f) is None else round(values[f] * self.scale) for f in FIELDS}
+        us = to_us(created_at or timezone.now())
+        while True:
+            try:
+                with transaction.atomic():
+                    self.Model.objects.create(id=us, **scaled)
+                break
+            except IntegrityError:
+                # the key is the arrival time: a reading in the same microsecond
+                # takes the next one; anything else (check constraints) is raised
+                if not self.Model.objects.filter(id=us).exists():
+                    raise
+                us += 1
+        return CompactRow(us, [self._value(scaled[f]) for f in FIELDS])
+
+    def append_many(self, rows):
+        objs = []
+        taken = set()
+        for t, values in rows:
+            us = to_us(t)
+            while us in taken:
+                us += 1
+            taken.add(us)
+            objs.append(self.Model(id=us, **{
+                f: None if values.get(f) is None else round(values[f] * self.scale) for f in FIELDS
+            }))
+        try:
+            with transaction.atomic():
+                self.Model.objects.bulk_create(objs, batch_size=5000)
+        except IntegrityError:
+            # a key already stored: one by one, each moving up as append() does
+            for obj in objs:
+                self.append(from_us(obj.id), **{f: self._value(getattr(obj, f)) for f in FIELDS})
+        return len(objs)
+
+
+class SegmentReadings:
+    append_only = True
+
+    def __init__(self, ch):
+        from .tsstore import SegmentStore
+
+        self.ch = ch
+        root = getattr(settings, "SENSOR_SEGMENT_ROOT", settings.BASE_DIR / "tsdata")
+        self.store = SegmentStore(
+            f"{root}/{ch}", getattr(settings, "SENSOR_SEGMENT_RECORDS", 1 << 20)
+        )
+
+    @staticmethod
+    def _bound(dt):
+        return None if dt is None else to_ms(dt)
+
+    def arrays(self, start=None, end=None):
+        return self.store.read(self._bound(start), self._bound(end))
+
+    def moments(self, start=None, end=None):
+        import numpy as np
+
+        arr = self.arrays(start, end)
+        out = {"count": int(len(arr))}
+        for f in FIELDS:
+            col = arr[f][~np.isnan(arr[f])].astype("f8")
+            if not len(col):
+                out[f] = {"min": None, "max": None, "mean": None, "stddev": None}
+                continue
+            out[f] = {
+                "min": float(col.min()), "max": float(col.max()),
+                "mean": float(col.mean()), "stddev": float(col.std()),
+            }
+        return out
+
+    def rows(self, start=None, end=None):
+        for part in self.store.views(self._bound(start), self._bound(end)):
+            for rec in part.tolist():
+                yield (from_ms(rec[0]), *(None if v != v else round(v, 4) for v in rec[1:]))
+
+    def timestamps(self, start=None, end=None):
+        return self.arrays(start, end)["ts"]
+
+    def recent(self, start):
+        arr = self.arrays(start)
+        first = self.count() - len(arr) + 1
+        for i, rec in enumerate(arr.tolist()):
+            yield (rec[0], first + i, *rec[1:])
+
+    def first_timestamp(self):
+        for part in self.store.views():
+            return from_ms(int(part["ts"][0]))
+        return None
+
+    def last_timestamp(self):
+        rec = self.store.last()
+        return None if rec is None else from_ms(int(rec["ts"]))
+
+    def latest(self):
+        rec = self.store.last()
+        return None if rec is None else SegmentRow(self.count(), rec)
+
+    def count(self):
+        return self.store.count()
+
+    def has_reading(self, created_at):
+        return len(self.arrays(created_at, created_at)) > 0
+
+    def stored(self, times):
+        # the store keeps milliseconds
+        found = set(self.timestamps(min(times), max(times)).tolist())
+        return {t for t in times if to_ms(t) in found}
+
+    def span_stats(self):
+        return self.first_timestamp(), self.last_timestamp(), self.count()
+
+    def append(self, created_at=None, **values):
+        # append-only: a reading older than the newest stored one raises tsstore.OutOfOrder
+        rec = (to_ms(created_at or timezone.now()), *(values.get(f, float("nan")) for f in FIELDS))
+        n = self.store.append([rec])
+        return SegmentRow(n, self.store.last())
+
+    def append_many(self, rows):
+        nan = float("nan")
+        self.store.append([
+            (to_ms(t), *(nan if values.get(f) is None else values[f] for f in FIELDS)) for t, values in rows
+        ])
+        return len(rows)
+
+
+class SegmentRow:
+    """Quacks like a reading model instance for the views that show one row."""
+
+    def __init__(self, seq, rec):
+        self.id = seq
+        self.created_at = from_ms(int(rec["ts"]))
+        loc = timezone.localtime(self.created_at)
+        self.date = loc.date()
+        self.time = loc.time().replace(microsecond=0)
+        for f in FIELDS:
+            v = float(rec[f])
+            setattr(self, f, None if v != v else round(v, 4))
+
+
+class CompactRow:
+    """A compact-table row shaped like a reading model instance."""
+
+    def __init__(self, us, values):
+        self.id = us
+        self.created_at = from_us(us)
+        loc = timezone.localtime(self.created_at)
+        self.date = loc.date()
+        self.time = loc.time().replace(microsecond=0)
+        for f, v in zip(FIELDS, values):
+            setattr(self, f, v)
+
+
+class RingRow:
+    """A ring record shaped like a reading model instance."""
+
+    def __init__(self, rec):
+        self.id = int(rec["id"])
+        self.created_at = from_ms(int(rec["ts"]))
+        loc = timezone.localtime(self.created_at)
+        self.date = loc.date()
+        self.time = loc.time().replace(microsecond=0)
+        for f in FIELDS:
+            v = float(rec[f])
+            setattr(self, f, None if v != v else v)
+
+
+class RingReadings:
+    """
+    Front for a reading source: windows starting inside the ring's coverage
+    and the latest reading come from shared memory, everything else from
+    `inner`. Appends go to both.
+    """
+
+    def __init__(self, inner, ring):
+        self.inner = inner
+        self.ring = ring
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def _ensure(self):
+        if not self.ring.ready:
+            start = timezone.now() - timedelta(hours=getattr(settings, "SENSOR_RING_HOURS", 6))
+            self.ring.seed(to_ms(start), self.inner.recent(start))
+
+    def rows(self, start=None, end=None, agg="mean"):
+        if start is not None:
+            self._ensure()
+            arr = self.ring.window(to_ms(start), None if end is None else to_ms(end))
+            if arr is not None:
+                return (
+                    (from_ms(rec[0]), *(None if v != v else v for v in rec[2:]))
+                    for rec in arr.tolist()
+                )
+        return self.inner.rows(start, end, agg)
+
+    def _last(self):
+        self._ensure()
+        return self.ring.last()
+
+    def last_timestamp(self):
+        rec = self._last()
+        return self.inner.last_timestamp() if rec is None else from_ms(int(rec["ts"]))
+
+    def latest(self):
+        rec = self._last()
+        return self.inner.latest() if rec is None else RingRow(rec)
+
+    def append(self, created_at=None, **values):
+        row = self.inner.append(created_at, **values)
+        # a late reading is slotted into place, or the ring is re-seeded
+        self.ring.append((
+            to_ms(row.created_at), row.id,
+            *(float("nan") if values.get(f) is None else values[f] for f in FIELDS),
+        ))
+        return row
+
+    def append_many(self, rows):
+        n = self.inner.append_many(rows)
+        nan = float("nan")
+        for t, values in rows:
+            # no row ids from a bulk write: id 0 skips the ring's duplicate check
+            self.ring.append((to_ms(t), 0, *(nan if values.get(f) is None else values[f] for f in FIELDS)))
+        return n
+
+
+class HistoryReadings:
+    """
+    Front for a reading source whose oldest readings were compacted into
+    rollups (sensor.rollups): windows reaching below the compacted horizon
+    get the rollups there, merged with `inner`'s rows. `agg` picks the
+    rollup column (mean, min or max) that stands in for the readings.
+    """
+
+    def __init__(self, inner, ch):
+        self.inner = inner
+        self.ch = ch
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def _span(self, start):
+        from .rollups import raw_since, span
+
+        since = raw_since()
+        if start is not None and since is not None and start >= since:
+            return None         # recent windows, the common case: no lookup at all
+        first, horizon, n = span(self.ch)
+        if horizon is None or (start is not None and start >= horizon):
+            return None
+        return first, horizon, n
+
+    def rows(self, start=None, end=None, agg="mean"):
+        if self._span(start) is None:
+            return self.inner.rows(start, end)
+        from .rollups import rows as rollup_rows
+
+        # raw rows below the horizon are late loads the next compaction folds in
+        return heapq.merge(rollup_rows(self.ch, start, end, agg), self.inner.rows(start, end),
+                           key=itemgetter(0))
+
+    def arrays(self, start=None, end=None):
+        if self._span(start) is None:
+            return self.inner.arrays(start, end)
+        import numpy as np
+        from .tsstore import RECORD
+
+        nan = float("nan")
+        return np.fromiter(
+            ((to_ms(t), *(nan if v is None else v for v in vals)) for t, *vals in self.rows(start, end)),
+            dtype=RECORD,
+        )
+
+    def moments(self, start=None, end=None):
+        raw = self.inner.moments(start, end)
+        if self._span(start) is None:
+            return raw
+        from .rollups import moments as rollup_moments
+
+        return rollup_moments(self.ch, start, end, raw)
+
+    def timestamps(self, start=None, end=None):
+        if self._span(start) is None:
+            return self.inner.timestamps(start, end)
+        import numpy as np
+        from .rollups import timestamps as rollup_timestamps
+
+        return np.sort(np.concatenate((rollup_timestamps(self.ch, start, end), self.inner.timestamps(start, end))))
+
+    def first_timestamp(self):
+        span = self._span(None)
+        return self.inner.first_timestamp() if span is None else span[0]
+
+    def span_stats(self):
+        first, last, n = self.inner.span_stats()
+        span = self._span(None)
+        if span is None:
+            return first, last, n
+        return span[0], last or span[1], n + span[2]
+
+
+BACKENDS = {
+    "orm": OrmReadings,
+    "compact": CompactReadings,
+    "segments": SegmentReadings,
+}
+
+
+def source_for(ch):
+    source = HistoryReadings(BACKENDS[getattr(settings, "SENSOR_READING_BACKEND", "orm")](ch), ch)
+    if getattr(settings, "SENSOR_RING_RECORDS", 0):
+        from .ring import ring_for
+
+        return RingReadings(source, ring_for(ch))
+    return source
+
+
+def invalidate_recent(ch):
+    """
+    Drop this host's ring, the cached series blocks, sparklines and read
+    size estimates for `ch` after rows were written around ingest (bulk loads).
+    """
+    from .admission import invalidate as invalidate_estimates
+    from .seriescache import invalidate as invalidate_series
+    from .sparklines import invalidate as invalidate_sparklines
+
+    invalidate_series(ch)
+    invalidate_sparklines(ch)
+    invalidate_estimates(ch)
+    if getattr(settings, "SENSOR_RING_RECORDS", 0):
+        from .ring import ring_for
+
+        ring_for(ch).invalidate()
@@ -0,0 +1,122 @@
+import numpy as np
+from django.utils import timezone
+
+from .readings import FIELDS, from_ms, to_ms
+
+# ---------------- Resampling ----------------
+# One definition of ?every= for every read and export path: readings are cut
+# into buckets of `step` on a grid aligned to the local wall clock (5m
+# buckets start at :00, :05, ...; 1h buckets on the hour) and each bucket
+# becomes one row, labelled with its start:
+#
+#   first / last      -- the bucket's first / last reading
+#   mean / min / max  -- per channel, ignoring missing values
+#   count             -- number of readings per channel
+#
+# Empty buckets between two filled ones are left out, or filled with
+# fill="ffill" (previous bucket) or fill="linear" (interpolated).
+# Everything is a handful of numpy passes over the time-sorted array.
+
+MODES = ("first", "last", "mean", "min", "max", "count")
+FILLS = ("none", "ffill", "linear")
+
+SERIES = np.dtype([("ts", "<i8")] + [(f, "<f8") for f in FIELDS])
+
+
+def from_rows(rows):
+    """SERIES array from (created_at, *channels) tuples in time order."""
+    nan = float("nan")
+    return np.fromiter(
+        ((to_ms(created_at), *(nan if v is None else v for v in vals)) for created_at, *vals in rows),
+        dtype=SERIES,
+    )
+
+
+def grid_origin(tz=None, at=None):
+    """Epoch ms of a local midnight, so buckets line up with the wall clock."""
+    tz = tz or timezone.get_current_timezone()
+    offset = timezone.localtime(at or timezone.now(), tz).utcoffset()
+    return -int(offset.total_seconds() * 1000)
+
+
+def resample(arr, step, mode="first", fill="none", origin=None):
+    """
+    Resample a time-sorted SERIES array into one row per `step` (timedelta)
+    bucket. Returns a SERIES array whose ts are the bucket starts.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}")
+    if fill not in FILLS:
+        raise ValueError(f"unknown fill {fill!r}")
+    n = len(arr)
+    if not n:
+        return np.empty(0, dtype=SERIES)
+    step_ms = max(1, int(step.total_seconds() * 1000))
+    if origin is None:
+        origin = grid_origin(at=from_ms(int(arr["ts"][0])))
+
+    bucket = (arr["ts"] - origin) // step_ms
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    ends = np.concatenate((starts[1:], [n]))
+
+    out = np.empty(len(starts), dtype=SERIES)
+    out["ts"] = bucket[starts] * step_ms + origin
+    for f in FIELDS:
+        col = arr[f]
+        if mode == "first":
+            out[f] = col[starts]
+        elif mode == "last":
+            out[f] = col[ends - 1]
+        elif mode == "min":
+            out[f] = np.fmin.reduceat(col, starts)
+        elif mode == "max":
+            out[f] = np.fmax.reduceat(col, starts)
+        else:
+            have = ~np.isnan(col)
+            counts = np.add.reduceat(have, starts)
+            if mode == "count":
+                out[f] = counts
+            else:
+                sums = np.add.reduceat(np.where(have, col, 0.0), starts)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[f] = np.round(sums / counts, 4)
+
+    if fill == "none" or len(out) < 2:
+        return out
+    return _fill(out, step_ms, fill)
+
+
+def fill_gaps(arr, step, fill):
+    """Apply `fill` to an array resample() returned with fill="none"."""
+    if fill not in FILLS:
+        raise ValueError(f"unknown fill {fill!r}")
+    if fill == "none" or len(arr) < 2:
+        return arr
+    return _fill(arr, max(1, int(step.total_seconds() * 1000)), fill)
+
+
+def _fill(out, step_ms, fill):
+    """Insert the empty buckets between the first and last filled one."""
+    index = (out["ts"] - out["ts"][0]) // step_ms
+    full = np.empty(int(index[-1]) + 1, dtype=SERIES)
+    full["ts"] = out["ts"][0] + np.arange(len(full)) * step_ms
+    for f in FIELDS:
+        if fill == "ffill":
+            # position of the last filled bucket at or before each grid bucket
+            pos = np.searchsorted(index, np.arange(len(full)), side="right") - 1
+            full[f] = out[f][pos]
+        else:
+            known = ~np.isnan(out[f])
+            if known.sum() < 2:
+                full[f] = np.nan
+                full[f][index] = out[f]
+                continue
+            full[f] = np.round(np.interp(np.arange(len(full)), index[known], out[f][known]), 4)
+            full[f][index] = out[f]
+    return full
+
+
+def to_rows(arr):
+    """(created_at, *channels) tuples, missing values as None."""
+    for rec in arr.tolist():
+        yield (from_ms(rec[0]), *(None if v != v else v for v in rec[1:]))
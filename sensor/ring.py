@@ -0,0 +1,216 @@
+import fcntl
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+# ---------------- Shared ring buffer of recent readings ----------------
+# One memory-mapped file per chamber (under /dev/shm by default) holding the
+# newest SENSOR_RING_RECORDS readings, shared by every worker on the host.
+#
+# Writers serialise on a flock and bump `seq` around every change -- odd
+# while a change is in progress -- so readers never lock: they copy what
+# they need and retry if `seq` was odd or moved meanwhile (a seqlock).
+#
+# A ring is seeded from the database on first use and again after bulk
+# loads (invalidate()); from then on ingest appends to it. It answers any
+# window starting at or after `covered_from`. Only readings ingested on this
+# host reach it, so leave it off when ingest is spread over several hosts.
+
+RING_RECORD = np.dtype([
+    ("ts", "<i8"),            # UTC epoch ms
+    ("id", "<i8"),            # row id in the reading source
+    ("temperature", "<f8"),
+    ("pressure", "<f8"),
+    ("humidity", "<f8"),
+    ("co2", "<f8"),
+])
+HEADER = np.dtype([
+    ("magic", "<u4"),
+    ("version", "<u4"),
+    ("capacity", "<i8"),
+    ("seq", "<i8"),
+    ("count", "<i8"),         # records ever appended since the last seed
+    ("covered_from", "<i8"),  # every reading with ts >= this is in the ring
+    ("ready", "<i8"),
+])
+HEADER_SIZE = 64
+MAGIC = 0x474E5253            # "SRNG"
+VERSION = 1
+
+# a late reading is slotted into place if it is at most this many records
+# behind the newest one; anything older invalidates the ring
+REORDER_WINDOW = 64
+READ_RETRIES = 1000
+
+
+def default_root():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "sensor-ring")
+
+
+class Ring:
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self._tlock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = HEADER_SIZE + capacity * RING_RECORD.itemsize
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            head = os.pread(self.fd, HEADER.itemsize, 0)
+            fresh = len(head) < HEADER.itemsize or os.fstat(self.fd).st_size != size
+            if not fresh:
+                h = np.frombuffer(head, dtype=HEADER)[0]
+                fresh = (h["magic"], h["version"], h["capacity"]) != (MAGIC, VERSION, capacity)
+            if fresh:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+            self.mm = mmap.mmap(self.fd, size)
+            self.head = np.ndarray((), dtype=HEADER, buffer=self.mm)
+            self.recs = np.ndarray((capacity,), dtype=RING_RECORD, buffer=self.mm, offset=HEADER_SIZE)
+            if fresh:
+                self.head["magic"], self.head["version"], self.head["capacity"] = MAGIC, VERSION, capacity
+
+    # ---------- writer side ----------
+    @contextmanager
+    def _locked(self):
+        # flock excludes other processes, the thread lock other threads of this one
+        with self._tlock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _changing(self):
+        self.head["seq"] += 1
+        try:
+            yield
+        finally:
+            self.head["seq"] += 1
+
+    @property
+    def ready(self):
+        return bool(self.head["ready"])
+
+    def seed(self, covered_from, records):
+        """
+        Fill an unready ring with `records` (RING_RECORD tuples, any order)
+        covering every reading since `covered_from` (epoch ms).
+        """
+        with self._locked():
+            if self.ready:
+                return
+            arr = np.fromiter(records, dtype=RING_RECORD)
+            arr.sort(order="ts", kind="stable")
+            if len(arr) > self.capacity:
+                covered_from = int(arr["ts"][-self.capacity - 1]) + 1
+                arr = arr[-self.capacity:]
+            with self._changing():
+                self.recs[:len(arr)] = arr
+                self.head["count"] = len(arr)
+                self.head["covered_from"] = covered_from
+                self.head["ready"] = 1
+
+    def invalidate(self):
+        """Forget the contents; the next reader re-seeds from the database."""
+        with self._locked(), self._changing():
+            self.head["ready"] = 0
+            self.head["count"] = 0
+
+    def append(self, rec):
+        """Add one RING_RECORD tuple. A no-op while the ring is unready."""
+        rec = np.array(rec, dtype=RING_RECORD)
+        with self._locked():
+            if not self.ready:
+                return
+            if rec["ts"] < self.head["covered_from"]:
+                return
+            cap = self.capacity
+            n = int(self.head["count"])
+            held = min(n, cap)
+            # find where it goes among the newest records; skip a row the
+            # seed already picked up
+            back = 0
+            while back < held and back < REORDER_WINDOW:
+                prev = self.recs[(n - 1 - back) % cap]
+                if rec["id"] and prev["id"] == rec["id"]:
+                    return
+                if prev["ts"] <= rec["ts"]:
+                    break
+                back += 1
+            if back and (back == REORDER_WINDOW or back == held and n >= cap):
+                # too far out of order to slot in cheaply
+                with self._changing():
+                    self.head["ready"] = 0
+                    self.head["count"] = 0
+                return
+
+            with self._changing():
+                if n >= cap:
+                    dropped = self.recs[n % cap]
+                    self.head["covered_from"] = max(int(self.head["covered_from"]), int(dropped["ts"]) + 1)
+                for i in range(n, n - back, -1):
+                    self.recs[i % cap] = self.recs[(i - 1) % cap]
+                self.recs[(n - back) % cap] = rec
+                self.head["count"] = n + 1
+
+    # ---------- reader side ----------
+    def _consistent(self, read):
+        """Run read() until no writer interfered; None if the ring can't answer."""
+        for _ in range(READ_RETRIES):
+            before = int(self.head["seq"])
+            if before & 1:
+                os.sched_yield()
+                continue
+            out = read() if self.head["ready"] else None
+            if int(self.head["seq"]) == before:
+                return out
+        return None
+
+    def _parts(self):
+        n, cap = int(self.head["count"]), self.capacity
+        if n <= cap:
+            return [self.recs[:n]]
+        head = n % cap
+        return [self.recs[head:], self.recs[:head]]
+
+    def window(self, start, end=None):
+        """Copy of the records with start <= ts <= end (epoch ms), or None if not covered."""
+        def read():
+            if start < int(self.head["covered_from"]):
+                return None
+            out = []
+            for part in self._parts():
+                lo = np.searchsorted(part["ts"], start, side="left")
+                hi = len(part) if end is None else np.searchsorted(part["ts"], end, side="right")
+                if hi > lo:
+                    out.append(part[lo:hi].copy())
+            return np.concatenate(out) if out else np.empty(0, dtype=RING_RECORD)
+        return self._consistent(read)
+
+    def last(self):
+        """Copy of the newest record, or None when empty or unready."""
+        def read():
+            n = int(self.head["count"])
+            return self.recs[(n - 1) % self.capacity].copy() if n else None
+        return self._consistent(read)
+
+
+_rings = {}
+
+
+def ring_for(ch):
+    root = getattr(settings, "SENSOR_RING_ROOT", None) or default_root()
+    capacity = settings.SENSOR_RING_RECORDS
+    path = os.path.join(str(root), f"{ch}.ring")
+    ring = _rings.get((path, capacity))
+    if ring is None:
+        ring = _rings[(path, capacity)] = Ring(path, capacity)
+    return ring
@@ -0,0 +1,290 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .bulk import insert_rows
+from .models import ReadingRollup
+from .readings import BACKENDS, FIELDS, from_ms, to_ms
+
+# ---------------- Downsampled history ----------------
+# SENSOR_ROLLUP_POLICY = ((days, seconds), ...): readings older than `days`
+# are kept as one ReadingRollup per `seconds` bucket (count, min, max and
+# mean of each channel), e.g. ((90, 60), (730, 3600)) keeps 90 days raw,
+# minutes for two years and hours after that. Buckets sit on the local
+# wall-clock grid that ?every= uses (resample.grid_origin) and each
+# resolution divides the next, so coarse buckets are unions of fine ones.
+#
+# compact() works oldest first, one chunk per transaction: the chunk's
+# aggregates are written and the rows they summarise deleted together, so
+# a stopped run leaves every reading in exactly one place and the next one
+# carries on from the oldest row left. A late reading that lands in an
+# already compacted span is folded into its bucket on the next run.
+#
+# Reads go through readings.HistoryReadings, which serves the rollups
+# below the compacted horizon and raw rows above it: a rollup row stands in
+# as one reading at its bucket start, holding the bucket's mean (min or max
+# for ?mode=min/max). Downsampled spans therefore come back at their stored
+# resolution at best, and ?mode=count counts stored rows. Window moments
+# (/api/stats) fold in the buckets' counts, means and extremes, and gap
+# scans see a bucket as readings across its span.
+
+TICK = timedelta(microseconds=1)
+AGGS = ("min", "max", "mean")
+COLUMNS = ["chamber", "resolution", "bucket_start", "count", *(f"{f}_{a}" for f in FIELDS for a in AGGS)]
+
+
+def policy():
+    """[(age, resolution seconds)] from SENSOR_ROLLUP_POLICY, youngest tier first."""
+    tiers = sorted((timedelta(days=days), int(seconds)) for days, seconds in
+                   getattr(settings, "SENSOR_ROLLUP_POLICY", ()))
+    for (_, fine), (_, coarse) in zip(tiers, tiers[1:]):
+        if coarse <= fine or coarse % fine:
+            raise ValueError(f"rollup resolution {coarse}s is not a multiple of {fine}s")
+    return tiers
+
+
+# ---------------- Reads ----------------
+def raw_since():
+    """Readings after this are never compacted (the youngest tier's age); None without a policy."""
+    days = min((d for d, _ in getattr(settings, "SENSOR_ROLLUP_POLICY", ())), default=None)
+    return None if days is None else timezone.now() - timedelta(days=days)
+
+
+def span(ch):
+    """(first bucket start, end of the compacted span, rollup rows) of `ch`, cached."""
+    key = f"rollup:{ch}:span"
+    found = cache.get(key)
+    if found is None:
+        first = horizon = None
+        n = 0
+        for res in (ReadingRollup.objects.filter(chamber=ch).order_by()
+                    .values("resolution").annotate(first=Min("bucket_start"), last=Max("bucket_start"),
+                                                   n=Count("id"))):
+            end = res["last"] + timedelta(seconds=res["resolution"])
+            first = res["first"] if first is None else min(first, res["first"])
+            horizon = end if horizon is None else max(horizon, end)
+            n += res["n"]
+        found = (first, horizon, n)
+        cache.set(key, found, timeout=None)
+    return found
+
+
+def invalidate(ch):
+    cache.delete(f"rollup:{ch}:span")
+
+
+def rows(ch, start=None, end=None, agg="mean"):
+    """(bucket_start, *channels) of the rollups starting in [start, end], oldest first."""
+    return _window(ch, start, end).values_list("bucket_start", *(f"{f}_{agg}" for f in FIELDS)).iterator(chunk_size=5000)
+
+
+def _window(ch, start, end):
+    qs = ReadingRollup.objects.filter(chamber=ch).order_by("bucket_start")
+    if start is not None:
+        qs = qs.filter(bucket_start__gte=start)
+    if end is not None:
+        qs = qs.filter(bucket_start__lte=end)
+    return qs
+
+
+def moments(ch, start, end, raw):
+    """
+    `raw` (a source's moments() of [start, end]) with the rollups starting
+    in that window folded in: counts add up, means are weighted by count,
+    min/max are taken over the buckets'. A bucket keeps no spread of its
+    own, so the stddev counts its readings at the bucket mean -- a lower
+    bound where rollups are involved.
+    """
+    import numpy as np
+
+    ts, count, vals = _rollup_parts(_window(ch, start, end))
+    if not len(ts):
+        return raw
+    out = {"count": (raw["count"] or 0) + int(count.sum())}
+    for f in FIELDS:
+        lo, hi, mean = vals[f]
+        have = ~np.isnan(mean)
+        w, m = count[have], mean[have]
+        parts = [(w.sum(), (m * w).sum() / w.sum() if w.sum() else 0.0)]
+        r = raw[f]
+        if r["mean"] is not None and raw["count"]:
+            parts.append((raw["count"], r["mean"]))
+        n = sum(p[0] for p in parts)
+        if not n:
+            out[f] = {"min": None, "max": None, "mean": None, "stddev": None}
+            continue
+        total = sum(c * mu for c, mu in parts) / n
+        spread = (w * (m - total) ** 2).sum()
+        if len(parts) > 1:
+            spread += raw["count"] * ((r["stddev"] or 0.0) ** 2 + (r["mean"] - total) ** 2)
+        mins = [float(np.nanmin(lo))] if have.any() else []
+        maxs = [float(np.nanmax(hi))] if have.any() else []
+        out[f] = {
+            "min": min(mins + ([r["min"]] if r["min"] is not None else [])),
+            "max": max(maxs + ([r["max"]] if r["max"] is not None else [])),
+            "mean": float(total),
+            "stddev": float(np.sqrt(spread / n)),
+        }
+    return out
+
+
+def timestamps(ch, start=None, end=None):
+    """
+    Epoch ms standing in for the rollups starting in [start, end]: one per
+    step of the finest policy resolution across each bucket and its last
+    millisecond, so gap scans see a compacted span as covered.
+    """
+    import numpy as np
+
+    tiers = policy()
+    fine = (tiers[0][1] if tiers else 60) * 1000
+    got = list(_window(ch, start, end).values_list("bucket_start", "resolution"))
+    if not got:
+        return np.empty(0, dtype="i8")
+    starts = np.array([to_ms(t) for t, _ in got], dtype="i8")
+    per = np.array([max(1, r * 1000 // fine) for _, r in got], dtype="i8")
+    offsets = np.arange(per.sum(), dtype="i8") - np.repeat(np.cumsum(per) - per, per)
+    ends = starts + np.array([r * 1000 - 1 for _, r in got], dtype="i8")
+    return np.sort(np.concatenate((np.repeat(starts, per) + offsets * fine, ends)))
+
+
+# ---------------- Compaction ----------------
+def raw_source(ch):
+    """The configured storage of `ch`, without the ring or history in front."""
+    return BACKENDS[getattr(settings, "SENSOR_READING_BACKEND", "orm")](ch)
+
+
+def _grid(dt, seconds, origin):
+    """Start of the `seconds` bucket holding `dt`."""
+    step = seconds * 1000
+    return from_ms(origin + (to_ms(dt) - origin) // step * step)
+
+
+def _oldest(ch, source, resolution):
+    if resolution is None:
+        return source.first_timestamp()
+    return (ReadingRollup.objects.filter(chamber=ch, resolution=resolution)
+            .order_by("bucket_start").values_list("bucket_start", flat=True).first())
+
+
+def _rollup_parts(qs):
+    """(ts ms, count, {field: (min, max, mean)}) arrays of rollup rows."""
+    import numpy as np
+
+    cols = [f"{f}_{a}" for f in FIELDS for a in AGGS]
+    got = list(qs.values_list("bucket_start", "count", *cols))
+    nan = float("nan")
+    ts = np.array([to_ms(r[0]) for r in got], dtype="i8")
+    count = np.array([r[1] for r in got], dtype="f8")
+    vals = np.array([[nan if v is None else v for v in r[2:]] for r in got], dtype="f8").reshape(len(got), len(cols))
+    return ts, count, {f: tuple(vals[:, i * 3 + j] for j in range(3)) for i, f in enumerate(FIELDS)}
+
+
+def aggregate(parts, seconds, origin):
+    """
+    Fold (ts, count, {field: (min, max, mean)}) parts into `seconds` buckets.
+    Means are weighted by count; NaN (a missing channel) carries no weight.
+    Returns the same shape, one entry per bucket.
+    """
+    import numpy as np
+
+    ts = np.concatenate([p[0] for p in parts])
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    count = np.concatenate([p[1] for p in parts])[order]
+    step = seconds * 1000
+    bucket = (ts - origin) // step
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+
+    out = {}
+    for f in FIELDS:
+        lo, hi, mean = (np.concatenate([p[2][f][j] for p in parts])[order] for j in range(3))
+        weight = np.where(np.isnan(mean), 0.0, count)
+        total = np.add.reduceat(weight, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = np.add.reduceat(np.where(weight > 0, mean * weight, 0.0), starts) / total
+        out[f] = (np.fmin.reduceat(lo, starts), np.fmax.reduceat(hi, starts), np.round(avg, 4))
+    return bucket[starts] * step + origin, np.add.reduceat(count, starts), out
+
+
+def _fold(ch, source, from_res, to_res, lo, hi, origin):
+    """Replace everything of `ch` in [lo, hi) at from_res (None = raw) by to_res rollups."""
+    import numpy as np
+    from .resample import from_rows
+
+    in_range = dict(chamber=ch, bucket_start__gte=lo, bucket_start__lt=hi)
+    parts = []
+    if from_res is None:
+        arr = from_rows(source.rows(lo, hi - TICK))
+        if len(arr):
+            parts.append((arr["ts"], np.ones(len(arr)), {f: (arr[f], arr[f], arr[f]) for f in FIELDS}))
+        n = len(arr)
+    else:
+        finer = ReadingRollup.objects.select_for_update().filter(resolution=from_res, **in_range).order_by("bucket_start")
+        part = _rollup_parts(finer)
+        if len(part[0]):
+            parts.append(part)
+        n = len(part[0])
+    # buckets of an earlier run, when late readings were loaded into the span
+    done = ReadingRollup.objects.select_for_update().filter(resolution=to_res, **in_range).order_by("bucket_start")
+    part = _rollup_parts(done)
+    if len(part[0]):
+        parts.append(part)
+    if not n:
+        return 0
+
+    ts, count, vals = aggregate(parts, to_res, origin)
+    cols = [vals[f][j].tolist() for f in FIELDS for j in range(len(AGGS))]
+    done.delete()
+    if from_res is None:
+        source.delete_range(lo, hi)
+    else:
+        finer.delete()
+    insert_rows(ReadingRollup, COLUMNS, (
+        (ch, to_res, from_ms(t), c, *(None if v != v else v for v in row))
+        for t, c, row in zip(ts.tolist(), count.astype("i8").tolist(), zip(*cols))
+    ))
+    return n
+
+
+def compact(ch, now=None, chunk=timedelta(days=1), pause=0.0):
+    """
+    Apply the policy to `ch`, one transaction per `chunk`. Yields
+    (resolution, lo, hi, rows folded) after each one.
+    """
+    from .readings import invalidate_recent
+    from .resample import grid_origin
+
+    source = raw_source(ch)
+    if not hasattr(source, "delete_range"):
+        raise ValueError(f"{type(source).__name__} storage is append-only and can't be compacted")
+    now = now or timezone.now()
+    origin = grid_origin()
+    changed = False
+    try:
+        from_res = None
+        for age, res in policy():
+            cutoff = _grid(now - age, res, origin)
+            size = max(1, round(chunk.total_seconds() / res)) * timedelta(seconds=res)
+            while True:
+                oldest = _oldest(ch, source, from_res)
+                if oldest is None or oldest >= cutoff:
+                    break
+                lo = _grid(oldest, res, origin)
+                hi = min(lo + size, cutoff)
+                with transaction.atomic():
+                    n = _fold(ch, source, from_res, res, lo, hi, origin)
+                changed = True
+                yield res, lo, hi, n
+                if pause:
+                    time.sleep(pause)
+            from_res = res
+    finally:
+        if changed:
+            invalidate(ch)
+            invalidate_recent(ch)
@@ -0,0 +1,123 @@
+import contextvars
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("sensor.routers")
+
+# ---------------- Read replica routing ----------------
+# Views marked with @read_replica (charts, range API, exports) read sensor
+# tables from settings.REPLICA_DATABASE. Everything else -- ingest, the user
+# admin, sessions and auth -- stays on "default", the primary.
+#
+# After a client writes, its reads are pinned to the primary for
+# REPLICA_STICKY_SECONDS (cookie), so it sees its own writes despite lag.
+# A replica that is down or lagging more than REPLICA_MAX_LAG seconds is
+# skipped until the next health check.
+
+PRIMARY = "default"
+STICKY_COOKIE = "db_primary_until"
+
+_use_replica = contextvars.ContextVar("sensor_use_replica", default=False)
+_wrote = contextvars.ContextVar("sensor_wrote", default=False)
+
+_health = {"alias": None, "ok": False, "checked": 0.0}
+
+
+def read_replica(view_func):
+    """Allow a read-only view (sync or async) to serve sensor data from the replica."""
+    view_func.use_replica = True
+    return view_func
+
+
+def replica_alias():
+    alias = getattr(settings, "REPLICA_DATABASE", None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def _replica_lag(conn):
+    """Seconds behind the primary, or None if the backend can't tell."""
+    if conn.vendor != "mysql":
+        return None
+    with conn.cursor() as cur:
+        for stmt in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+            try:
+                cur.execute(stmt)
+            except Exception:
+                continue
+            row = cur.fetchone()
+            if not row:
+                return None
+            cols = [c[0] for c in cur.description]
+            status = dict(zip(cols, row))
+            lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+            # NULL lag means replication is stopped
+            return float("inf") if lag is None else float(lag)
+    return None
+
+
+def replica_healthy(alias):
+    now = time.monotonic()
+    ttl = getattr(settings, "REPLICA_HEALTH_TTL", 5)
+    if _health["alias"] == alias and now - _health["checked"] < ttl:
+        return _health["ok"]
+
+    ok = False
+    try:
+        conn = connections[alias]
+        conn.ensure_connection()
+        lag = _replica_lag(conn)
+        ok = lag is None or lag <= getattr(settings, "REPLICA_MAX_LAG", 10)
+        if not ok:
+            logger.warning("replica %s lagging %.0fs, reading from primary", alias, lag)
+    except Exception as exc:
+        logger.warning("replica %s unavailable (%s), reading from primary", alias, exc)
+    _health.update(alias=alias, ok=ok, checked=now)
+    return ok
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "sensor" or not _use_replica.get() or _wrote.get():
+            return PRIMARY
+        alias = replica_alias()
+        if alias is None or not replica_healthy(alias):
+            return PRIMARY
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        use_token = _use_replica.set(False)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get() and request.method not in ("GET", "HEAD"):
+                ttl = getattr(settings, "REPLICA_STICKY_SECONDS", 5)
+                response.set_cookie(STICKY_COOKIE, str(int(time.time() + ttl)), max_age=ttl, httponly=True)
+            return response
+        finally:
+            _use_replica.reset(use_token)
+            _wrote.reset(wrote_token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, "use_replica", False) or request.method not in ("GET", "HEAD"):
+            return None
+        try:
+            pinned = int(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        _use_replica.set(not pinned)
+        return None
@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .readings import from_ms, source_for, to_ms
+from .resample import SERIES, from_rows, grid_origin, resample
+
+# ---------------- Series cache ----------------
+# Resampled series are cut into blocks of whole buckets, about a day each and
+# aligned to the resampling grid. A block that ended more than
+# SENSOR_SERIES_SETTLE seconds ago is closed: it is computed once, kept under
+# (chamber, step, mode, grid origin, block start) and never recomputed.
+#
+# series() takes closed blocks from an in-process LRU (bounded by
+# SENSOR_SERIES_LRU_BYTES), then from the shared Django cache
+# (CACHES[SENSOR_SERIES_CACHE]), and computes everything else -- the open
+# tail, a partial block at the window start, blocks nobody has cached yet --
+# from raw rows, one read per contiguous stretch. Ingest invalidates
+# nothing. A late reading (sensor.devicetime) gives its UTC day a new
+# revision, which is part of the key of every block touching that day;
+# bulk loads bump the chamber's generation (invalidate(), called from
+# readings.invalidate_recent()), which retires all its blocks.
+
+DAY_MS = 86_400_000
+TICK = timedelta(microseconds=1)
+ENTRY_OVERHEAD = 64          # bytes charged per LRU entry on top of the array
+
+_stats_lock = threading.Lock()
+_counters = {"local_hits": 0, "shared_hits": 0, "misses": 0, "reads": 0}
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _counters[name] += n
+
+
+class LRU:
+    """Least-recently-used arrays, evicted once their total size passes max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            arr = self.items.get(key)
+            if arr is not None:
+                self.items.move_to_end(key)
+            return arr
+
+    def put(self, key, arr):
+        with self.lock:
+            if key in self.items:
+                return
+            self.items[key] = arr
+            self.size += arr.nbytes + ENTRY_OVERHEAD
+            while self.size > self.max_bytes and self.items:
+                _, old = self.items.popitem(last=False)
+                self.size -= old.nbytes + ENTRY_OVERHEAD
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+_lru = None
+
+
+def _local():
+    global _lru
+    limit = getattr(settings, "SENSOR_SERIES_LRU_BYTES", 32 << 20)
+    if _lru is None or _lru.max_bytes != limit:
+        _lru = LRU(limit)
+    return _lru
+
+
+def _shared():
+    return caches[getattr(settings, "SENSOR_SERIES_CACHE", "default")]
+
+
+def stats():
+    """This process's hit/miss counters and LRU size."""
+    lru = _local()
+    with _stats_lock:
+        out = dict(_counters)
+    out.update(local_blocks=len(lru.items), local_bytes=lru.size, local_limit=lru.max_bytes)
+    return out
+
+
+def reset():
+    """Empty the local tier and zero the counters (tests, benchmarks)."""
+    _local().clear()
+    with _stats_lock:
+        for k in _counters:
+            _counters[k] = 0
+
+
+def _generation(ch):
+    return _shared().get_or_set(f"series:{ch}:gen", 0, timeout=None)
+
+
+def invalidate(ch):
+    """Retire every cached block of `ch` (rows were written into the past)."""
+    key = f"series:{ch}:gen"
+    try:
+        _shared().incr(key)
+    except ValueError:
+        _shared().set(key, 1, timeout=None)
+
+
+def revise(ch, created_at):
+    """A reading landed at `created_at` after its block may have been cached."""
+    settle = getattr(settings, "SENSOR_SERIES_SETTLE", 300)
+    if (timezone.now() - created_at).total_seconds() < settle:
+        return          # its block is still open, so nothing cached holds it
+    day = to_ms(created_at) // DAY_MS
+    _shared().set(f"series:{ch}:{_generation(ch)}:rev:{day}", time.time_ns(), timeout=None)
+
+
+def _revisions(prefix, blocks, size):
+    """{block: revision} -- the newest revision of any UTC day the block touches."""
+    days = {b: range(b // DAY_MS, (b + size - 1) // DAY_MS + 1) for b in blocks}
+    found = _shared().get_many({f"{prefix}:rev:{d}" for r in days.values() for d in r})
+    return {b: max((found.get(f"{prefix}:rev:{d}", 0) for d in r), default=0) for b, r in days.items()}
+
+
+def _first_timestamp(ch, source, generation):
+    # only moves when rows are loaded into the past, which bumps the generation
+    key = f"series:{ch}:{generation}:first"
+    first = _shared().get(key)
+    if first is None:
+        first = source.first_timestamp()
+        if first is not None:
+            _shared().set(key, first, timeout=None)
+    return first
+
+
+def block_ms(step_ms):
+    """Block length: the whole number of buckets closest to a day."""
+    return step_ms * max(1, round(DAY_MS / step_ms))
+
+
+def _compute(source, start, end, step, mode, origin):
+    _count("reads")
+    # downsampled history stands in with its bucket extremes for min/max
+    agg = mode if mode in ("min", "max") else "mean"
+    return resample(from_rows(source.rows(start, end, agg)), step, mode, origin=origin)
+
+
+def series(ch, start, end, step, mode="first"):
+    """
+    resample(rows(start, end), step, mode) as a SERIES array, with closed
+    blocks served from the cache. start None = whole history, end None = now.
+    Apply ?fill= afterwards (resample.fill_gaps), it spans blocks.
+    """
+    source = source_for(ch)
+    generation = _generation(ch)
+    whole = start is None
+    if whole:
+        start = _first_timestamp(ch, source, generation)
+        if start is None:
+            return np.empty(0, dtype=SERIES)
+
+    step_ms = max(1, int(step.total_seconds() * 1000))
+    size = block_ms(step_ms)
+    origin = grid_origin(at=start)
+    now_ms = to_ms(timezone.now())
+    s = to_ms(start)
+    e = to_ms(end) if end is not None else now_ms
+    settled = now_ms - getattr(settings, "SENSOR_SERIES_SETTLE", 300) * 1000
+
+    # with no start the first block is whole: nothing precedes the first reading
+    first = origin + ((s - origin) // size if whole else -((origin - s) // size)) * size
+    last_end = origin + (min(e + 1, settled) - origin) // size * size
+    if last_end <= first:
+        return _compute(source, start, end, step, mode, origin)
+
+    blocks = list(range(first, last_end, size))
+    revisions = _revisions(f"series:{ch}:{generation}", blocks, size)
+    prefix = f"series:{ch}:{generation}:{step_ms}:{mode}:{origin}"
+    keys = {b: f"{prefix}:{b}:{revisions[b]}" for b in blocks}
+    found = {}
+    lru = _local()
+    for b in blocks:
+        arr = lru.get(keys[b])
+        if arr is not None:
+            found[b] = arr
+    _count("local_hits", len(found))
+    wanted = [keys[b] for b in blocks if b not in found]
+    if wanted:
+        shared = _shared().get_many(wanted)
+        for b in blocks:
+            if b not in found and keys[b] in shared:
+                arr = np.frombuffer(shared[keys[b]], dtype=SERIES)
+                lru.put(keys[b], arr)
+                found[b] = arr
+        _count("shared_hits", len(shared))
+        _count("misses", len(wanted) - len(shared))
+
+    # walk the window in order: cached blocks as they are, each stretch in
+    # between (edges, missed blocks, the open tail) read and resampled at once
+    parts, fresh = [], {}
+    run = None                  # (from, [blocks to store]) of the pending stretch
+
+    def flush(hi):
+        out = _compute(source, run[0], hi, step, mode, origin)
+        parts.append(out)
+        for b in run[1]:
+            block = out[(out["ts"] >= b) & (out["ts"] < b + size)].copy()
+            lru.put(keys[b], block)
+            fresh[keys[b]] = block.tobytes()
+
+    if s < first:
+        run = (start, [])
+    for b in blocks:
+        if b in found:
+            if run is not None:
+                flush(from_ms(b) - TICK)
+                run = None
+            parts.append(found[b])
+        elif run is None:
+            run = (from_ms(b), [b])
+        else:
+            run[1].append(b)
+    if last_end <= e:
+        run = run or (from_ms(last_end), [])
+        flush(end)
+    elif run is not None:
+        flush(from_ms(last_end) - TICK)
+
+    if fresh:
+        _shared().set_many(fresh, timeout=getattr(settings, "SENSOR_SERIES_TTL", 30 * 86400))
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
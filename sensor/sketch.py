@@ -0,0 +1,70 @@
+import math
+
+# ---------------- Mergeable quantile sketch ----------------
+# A sparse fixed-width histogram: values are counted in bins of width
+# `resolution`, so two sketches merge exactly by adding their counts and
+# any quantile is answered to within resolution / 2. Chamber channels are
+# bounded (table check constraints), which keeps the number of occupied
+# bins small -- an hour of steady readings touches a few dozen.
+
+# guards against 49.9 / 0.1 == 498.999... landing one bin low
+EPS = 1e-9
+
+
+def bin_of(value, resolution):
+    return math.floor(value / resolution + EPS)
+
+
+class QuantileSketch:
+    def __init__(self, resolution=0.05, bins=None):
+        self.resolution = resolution
+        self.bins = dict(bins or {})
+        self.count = sum(self.bins.values())
+
+    def add(self, value, n=1):
+        if value is None or value != value:
+            return
+        key = bin_of(value, self.resolution)
+        self.bins[key] = self.bins.get(key, 0) + n
+        self.count += n
+
+    def add_counts(self, keys, counts):
+        """Bulk add pre-binned counts (e.g. from numpy.unique)."""
+        for k, n in zip(keys, counts):
+            k, n = int(k), int(n)
+            self.bins[k] = self.bins.get(k, 0) + n
+            self.count += n
+
+    def merge(self, other):
+        if other.resolution != self.resolution:
+            raise ValueError("cannot merge sketches with different resolutions")
+        for k, n in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + n
+        self.count += other.count
+        return self
+
+    def quantiles(self, qs):
+        """Values at each quantile in qs (0..1), or None when empty."""
+        if not self.count:
+            return [None for _ in qs]
+        keys = sorted(self.bins)
+        targets = sorted((q * (self.count - 1), i) for i, q in enumerate(qs))
+        out = [None] * len(qs)
+        seen = 0
+        t = 0
+        for k in keys:
+            seen += self.bins[k]
+            while t < len(targets) and targets[t][0] < seen:
+                # bin midpoint
+                out[targets[t][1]] = round((k + 0.5) * self.resolution, 6)
+                t += 1
+            if t == len(targets):
+                break
+        return out
+
+    def to_dict(self):
+        return {"r": self.resolution, "b": {str(k): n for k, n in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["r"], {int(k): n for k, n in data["b"].items()})
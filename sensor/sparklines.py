@@ -0,0 +1,97 @@
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .readings import from_ms, source_for, to_ms
+
+# ---------------- Sparkline thumbnails ----------------
+# A small PNG per chamber and channel with the SENSOR_SPARK_HOURS before
+# the newest reading, at one point per SENSOR_SPARK_BUCKET (the bucket mean).
+# The image only depends on which bucket the newest reading falls in, so
+# it is cached under that bucket and redrawn once a reading lands in the
+# next one; bulk loads bump a per-chamber generation (invalidate()).
+# matplotlib is imported on the first miss, never at worker start-up.
+
+WIDTH, HEIGHT, DPI = 240, 48, 100
+COLORS = {"temperature": "#dc2626", "pressure": "#7c3aed", "humidity": "#2563eb", "co2": "#16a34a"}
+
+
+def _cache():
+    return caches[getattr(settings, "SENSOR_SPARK_CACHE", "default")]
+
+
+def _bucket_ms():
+    return getattr(settings, "SENSOR_SPARK_BUCKET", 900) * 1000
+
+
+def _generation(ch):
+    return _cache().get_or_set(f"spark:{ch}:gen", 0, timeout=None)
+
+
+def invalidate(ch):
+    """Redraw every sparkline of `ch` on next request (rows written into the past)."""
+    key = f"spark:{ch}:gen"
+    try:
+        _cache().incr(key)
+    except ValueError:
+        _cache().set(key, 1, timeout=None)
+
+
+def cache_key(ch, field, last_at):
+    """Key of the image ending with the bucket of `last_at`, or None when there is no data."""
+    if last_at is None:
+        return None
+    return f"spark:{ch}:{field}:{_generation(ch)}:{to_ms(last_at) // _bucket_ms()}"
+
+
+def render_png(values, color="#0f172a"):
+    """PNG bytes of a line through `values` (NaN breaks the line)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(WIDTH / DPI, HEIGHT / DPI), dpi=DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes((0, 0.04, 1, 0.92))
+    ax.axis("off")
+    ax.set_xlim(0, max(len(values) - 1, 1))
+    known = [v for v in values if v == v]
+    if known:
+        ax.plot(values, color=color, linewidth=1.2)
+        ax.fill_between(range(len(values)), values, min(known), color=color, alpha=0.12, linewidth=0)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", transparent=True)
+    return buf.getvalue()
+
+
+def series(ch, field, last_at):
+    """Bucket means over the window ending with the bucket of `last_at`, empty buckets NaN."""
+    import numpy as np
+    from .resample import from_rows, resample
+
+    step = _bucket_ms()
+    end = (to_ms(last_at) // step + 1) * step
+    n = getattr(settings, "SENSOR_SPARK_HOURS", 24) * 3600 * 1000 // step
+    start = end - n * step
+
+    arr = from_rows(source_for(ch).rows(from_ms(start), last_at))
+    out = np.full(n, np.nan)
+    if len(arr):
+        buckets = resample(arr, timedelta(milliseconds=step), "mean", origin=0)
+        out[(buckets["ts"] - start) // step] = buckets[field]
+    return out.tolist()
+
+
+def sparkline(ch, field, last_at):
+    """(png_bytes, key) from the cache, drawing it on a miss; (None, None) without data."""
+    key = cache_key(ch, field, last_at)
+    if key is None:
+        return None, None
+    png = _cache().get(key)
+    if png is None:
+        png = render_png(series(ch, field, last_at), COLORS.get(field, "#0f172a"))
+        # the next bucket's image replaces it; keep it long enough for a quiet chamber
+        _cache().set(key, png, timeout=getattr(settings, "SENSOR_SPARK_HOURS", 24) * 3600)
+    return png, key
+
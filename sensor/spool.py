@@ -0,0 +1,304 @@
+import heapq
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from operator import itemgetter
+from pathlib import Path
+
+from django.conf import settings
+
+from .readings import FIELDS, from_us, to_us
+
+try:
+    import fcntl
+except ImportError:     # Windows: nothing keeps two drainers apart, run one
+    fcntl = None
+
+logger = logging.getLogger("sensor.spool")
+
+# ---------------- Ingest spool ----------------
+# With SENSOR_SPOOL_DIR set, ingest (the HTTP endpoint and sensor.listener)
+# doesn't write the database: an accepted reading is appended to a local
+# log and acknowledged once it is on disk, and manage.py drain_spool loads
+# the log into the database in bulk (ingest.record_batch) whenever the
+# database takes writes. A slow or restarting MySQL then delays the
+# dashboards, but costs no readings and no device sees an error.
+#
+# Each process appends to its own segment, <time_ns>-<pid>.open, renamed
+# to .log once it reaches SENSOR_SPOOL_SEGMENT_BYTES (or its process is
+# gone). Records are fixed size: chamber number, the reading's time (UTC
+# microseconds, fixed at acceptance) and the channels, with a CRC32, so a
+# torn write at the tail is recognisable. Writers share fsyncs: a write
+# waits for the next fsync after it, and whoever runs that one covers all
+# the records written meanwhile.
+#
+# The drainer loads all segments merged by reading time, keeps its position
+# per segment in checkpoint.json, written after each batch is committed,
+# and deletes a sealed segment once it is through. A crash between the
+# commit and the checkpoint replays the batch; record_batch() drops
+# readings whose time is already stored.
+
+RECORD = struct.Struct("<Bq4d")
+CRC = struct.Struct("<I")
+SIZE = RECORD.size + CRC.size
+OPEN, SEALED = ".open", ".log"
+CHECKPOINT = "checkpoint.json"
+
+
+def enabled():
+    return bool(getattr(settings, "SENSOR_SPOOL_DIR", None))
+
+
+def _fsync_dir(path):
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def pack(ch, created_at, values):
+    nan = float("nan")
+    rec = RECORD.pack(int(ch[2:]), to_us(created_at), *(nan if values.get(f) is None else values[f] for f in FIELDS))
+    return rec + CRC.pack(zlib.crc32(rec))
+
+
+def unpack(buf):
+    """(ch, created_at, values) from one record, or None when its CRC is wrong."""
+    rec = buf[:RECORD.size]
+    if CRC.unpack(buf[RECORD.size:SIZE])[0] != zlib.crc32(rec):
+        return None
+    n, us, *vals = RECORD.unpack(rec)
+    return f"ch{n}", from_us(us), {f: None if v != v else v for f, v in zip(FIELDS, vals)}
+
+
+# ---------------- Writing ----------------
+class Spool:
+    def __init__(self, root, segment_bytes):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()            # the file and its counters
+        self.sync_lock = threading.Lock()       # the one fsync in progress; taken first
+        self.fd = None
+        self.path = None
+        self.size = 0
+        self.written = self.synced = 0
+
+    def _open(self):
+        self.path = self.root / f"{time.time_ns():020d}-{os.getpid()}{OPEN}"
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND | getattr(os, "O_BINARY", 0),
+                          0o644)
+        self.size = 0
+        _fsync_dir(self.root)
+
+    def _seal(self):
+        os.fsync(self.fd)
+        os.close(self.fd)
+        os.replace(self.path, self.path.with_suffix(SEALED))
+        _fsync_dir(self.root)
+        self.fd = None
+        self.synced = self.written
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        self.size += len(data)
+        self.written += 1
+        return self.written
+
+    def append(self, readings):
+        """Write (ch, created_at, values) readings; returns once they are on disk."""
+        data = b"".join(pack(ch, t, values) for ch, t, values in readings)
+        if not data:
+            return
+        with self.lock:
+            mine = None if self.fd is None or self.size >= self.segment_bytes else self._write(data)
+        if mine is None:
+            with self.sync_lock, self.lock:
+                if self.fd is not None and self.size >= self.segment_bytes:
+                    self._seal()
+                if self.fd is None:
+                    self._open()
+                mine = self._write(data)
+        self._sync(mine)
+
+    def _sync(self, mine):
+        with self.sync_lock:
+            if self.synced >= mine:
+                return                  # an fsync started after our write covered it
+            with self.lock:
+                upto, fd = self.written, self.fd
+            (getattr(os, "fdatasync", None) or os.fsync)(fd)
+            self.synced = upto
+
+    def close(self):
+        with self.sync_lock, self.lock:
+            if self.fd is not None:
+                self._seal()
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+def spool():
+    """This process's spool (a forked worker gets its own segment)."""
+    key = (str(settings.SENSOR_SPOOL_DIR), os.getpid())
+    with _spools_lock:
+        if key not in _spools:
+            _spools[key] = Spool(key[0], getattr(settings, "SENSOR_SPOOL_SEGMENT_BYTES", 8 << 20))
+        return _spools[key]
+
+
+def append(readings):
+    spool().append(readings)
+
+
+# ---------------- Draining ----------------
+def _alive(pid):
+    if pid == os.getpid() or os.name == "nt":     # os.kill() would terminate it there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def segments(root):
+    """(path, sealed) of the spool's segments, oldest first."""
+    found = []
+    for path in Path(root).iterdir():
+        if path.suffix == SEALED:
+            found.append((path, True))
+        elif path.suffix == OPEN:
+            # a segment left open by a process that is gone is complete
+            found.append((path, not _alive(int(path.stem.rsplit("-", 1)[1]))))
+    return sorted(found, key=lambda p: p[0].stem)
+
+
+def _load_checkpoint(root):
+    try:
+        return json.loads((Path(root) / CHECKPOINT).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(root, positions):
+    tmp = Path(root) / (CHECKPOINT + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(positions, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, Path(root) / CHECKPOINT)
+
+
+def _read(path, offset, limit):
+    """
+    Up to `limit` whole records from `offset`, as (offset after it,
+    (ch, created_at, values) or None for a record whose CRC is wrong).
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(limit * SIZE)
+    data = data[:len(data) - len(data) % SIZE]
+    out = []
+    for pos in range(0, len(data), SIZE):
+        rec = unpack(data[pos:pos + SIZE])
+        if rec is None:
+            logger.warning("%s: bad record at byte %d skipped", path.name, offset + pos)
+        out.append((offset + pos + SIZE, rec))
+    return out
+
+
+def _take(entries, upto):
+    """The leading entries of a segment read that are no newer than `upto` (None: all)."""
+    n = 0
+    for _, rec in entries:
+        if rec is not None and upto is not None and rec[1] > upto:
+            break
+        n += 1
+    return entries[:n]
+
+
+def drain(root=None, batch=5000):
+    """
+    Load everything spooled into the database; returns the readings stored
+    (resends of stored ones don't count). Database errors propagate, with
+    the position kept at the last batch that was committed.
+
+    Every process writes its own segment at the same time, so each round
+    reads up to `batch` records of every segment and loads them merged by
+    time: one segment drained ahead of another would make the other's
+    readings late (no alert evaluation, see ingest.record_batch). A
+    segment with more records waiting holds the others back to the newest
+    time read from it.
+    """
+    from .ingest import record_batch
+
+    root = Path(root or settings.SENSOR_SPOOL_DIR)
+    if not root.is_dir():
+        return 0
+    with open(root / "drain.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        positions = _load_checkpoint(root)
+        total = 0
+        while True:
+            reads = []
+            for path, sealed in segments(root):
+                try:
+                    entries = _read(path, positions.get(path.stem, 0), batch)
+                except FileNotFoundError:
+                    continue        # sealed meanwhile: read again as .log next round
+                reads.append((path, sealed, entries))
+            if not any(entries for _, _, entries in reads):
+                break
+
+            times = [[rec[1] for _, rec in entries if rec is not None] for _, _, entries in reads]
+            held = [max(t) for (_, _, entries), t in zip(reads, times) if len(entries) == batch and t]
+            upto = min(held) if held else None
+            taken = [_take(entries, upto) for _, _, entries in reads]
+            if not any(taken):
+                # out-of-order device times ahead of the mark: take the holding segment whole
+                i = next(i for i, t in enumerate(times) if t and max(t) == upto)
+                taken[i] = reads[i][2]
+
+            by_ch = {}
+            merged = heapq.merge(*(sorted((rec for _, rec in part if rec is not None), key=itemgetter(1))
+                                   for part in taken), key=itemgetter(1))
+            for ch, created_at, values in merged:
+                by_ch.setdefault(ch, []).append((created_at, values))
+            for ch, rows in by_ch.items():
+                total += record_batch(ch, rows)
+            for (path, _, _), part in zip(reads, taken):
+                if part:
+                    positions[path.stem] = part[-1][0]
+            _save_checkpoint(root, positions)
+
+        for path, sealed in segments(root):
+            if sealed and path.exists() and path.stat().st_size - positions.get(path.stem, 0) < SIZE:
+                # a torn record at the end of a finished segment is never completed
+                path.unlink()
+                positions.pop(path.stem, None)
+        _save_checkpoint(root, positions)
+        return total
+
+
+def backlog(root=None):
+    """Bytes spooled and not yet loaded."""
+    root = Path(root or settings.SENSOR_SPOOL_DIR)
+    if not root.is_dir():
+        return 0
+    positions = _load_checkpoint(root)
+    return sum(max(0, path.stat().st_size - positions.get(path.stem, 0)) for path, _ in segments(root))
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ReadingSketch
+from .readings import FIELDS, source_for, to_ms
+from .sketch import EPS, QuantileSketch
+
+# ---------------- Window statistics ----------------
+# Exact moments (min/max/mean/stddev) come from the source's aggregates.
+# Percentiles merge per-bucket QuantileSketches: whole buckets inside the
+# window are read from ReadingSketch (built on first use and kept once the
+# bucket has settled), the partial buckets at the window edges are
+# sketched from raw rows. A 90-day window is ~2k hourly sketches.
+
+QUANTILES = {"p5": 0.05, "p50": 0.5, "p95": 0.95}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+TICK = timedelta(microseconds=1)
+
+
+def bucket_size():
+    return timedelta(seconds=getattr(settings, "SENSOR_SKETCH_BUCKET", 3600))
+
+
+def bucket_floor(dt):
+    size = bucket_size()
+    return EPOCH + ((dt - EPOCH) // size) * size
+
+
+def _settled_before():
+    # buckets ending after this may still receive rows (or be read from a
+    # lagging replica); they are sketched on the fly but not stored
+    return timezone.now() - timedelta(seconds=getattr(settings, "SENSOR_SKETCH_SETTLE", 300))
+
+
+def sketch_records(arr, resolution=None):
+    """{channel: QuantileSketch} for a RECORD array."""
+    import numpy as np
+
+    resolution = resolution or getattr(settings, "SENSOR_SKETCH_RESOLUTION", 0.05)
+    out = {}
+    for f in FIELDS:
+        sk = QuantileSketch(resolution)
+        col = arr[f].astype("f8")
+        col = col[~np.isnan(col)]
+        if len(col):
+            keys, counts = np.unique(np.floor(col / resolution + EPS).astype("i8"), return_counts=True)
+            sk.add_counts(keys, counts)
+        out[f] = sk
+    return out
+
+
+def build_buckets(ch, start, end):
+    """
+    Sketch every whole bucket in [start, end) from raw rows with one read.
+    Returns {bucket_start: (count, {channel: QuantileSketch})}.
+    """
+    import numpy as np
+
+    arr = source_for(ch).arrays(start, end - TICK)
+    size = bucket_size()
+    out = {}
+    b = start
+    while b < end:
+        lo, hi = np.searchsorted(arr["ts"], [to_ms(b), to_ms(b + size)])
+        part = arr[lo:hi]
+        out[b] = (int(len(part)), sketch_records(part))
+        b += size
+    return out
+
+
+def store_buckets(ch, built):
+    settled = _settled_before()
+    ReadingSketch.objects.bulk_create([
+        ReadingSketch(
+            chamber=ch, bucket_start=b, count=n,
+            sketches={f: sk.to_dict() for f, sk in sketches.items()},
+        )
+        for b, (n, sketches) in built.items()
+        if b + bucket_size() <= settled
+    ], ignore_conflicts=True)
+
+
+def add_late(ch, created_at, values):
+    """Count a late reading into its bucket's stored sketch, if that is already stored."""
+    with transaction.atomic():
+        row = ReadingSketch.objects.select_for_update().filter(
+            chamber=ch, bucket_start=bucket_floor(created_at),
+        ).first()
+        if row is None:
+            return
+        for f in FIELDS:
+            sk = QuantileSketch.from_dict(row.sketches[f])
+            sk.add(values.get(f))
+            row.sketches[f] = sk.to_dict()
+        row.count += 1
+        row.save(update_fields=["sketches", "count"])
+
+
+def window_sketches(ch, start, end):
+    """Merged {channel: QuantileSketch} for [start, end] plus the number of stored buckets used."""
+    size = bucket_size()
+    first_full = bucket_floor(start)
+    if first_full < start:
+        first_full += size
+    end_excl = end + TICK
+    last_full = bucket_floor(end_excl)
+
+    merged = {f: QuantileSketch(getattr(settings, "SENSOR_SKETCH_RESOLUTION", 0.05)) for f in FIELDS}
+
+    def _merge(sketches):
+        for f in FIELDS:
+            merged[f].merge(sketches[f])
+
+    if first_full >= last_full:
+        # window inside a single bucket: raw rows only
+        _merge(sketch_records(source_for(ch).arrays(start, end)))
+        return merged, 0
+
+    if start < first_full:
+        _merge(sketch_records(source_for(ch).arrays(start, first_full - TICK)))
+    if last_full < end_excl:
+        _merge(sketch_records(source_for(ch).arrays(last_full, end)))
+
+    stored = ReadingSketch.objects.filter(
+        chamber=ch, bucket_start__gte=first_full, bucket_start__lt=last_full,
+    ).values_list("bucket_start", "sketches")
+    have = set()
+    for b, data in stored.iterator(chunk_size=2000):
+        have.add(b)
+        _merge({f: QuantileSketch.from_dict(data[f]) for f in FIELDS})
+
+    # sketch the missing whole buckets, one raw read per contiguous run
+    run_start = None
+    b = first_full
+    while b <= last_full:
+        missing = b < last_full and b not in have
+        if missing and run_start is None:
+            run_start = b
+        elif not missing and run_start is not None:
+            built = build_buckets(ch, run_start, b)
+            for _, sketches in built.values():
+                _merge(sketches)
+            store_buckets(ch, built)
+            run_start = None
+        b += size
+    return merged, len(have)
+
+
+def window_stats(ch, start, end):
+    moments = source_for(ch).moments(start, end)
+    sketches, stored = window_sketches(ch, start, end)
+    names = list(QUANTILES)
+    channels = {}
+    for f in FIELDS:
+        qs = sketches[f].quantiles([QUANTILES[n] for n in names])
+        channels[f] = {**moments[f], **dict(zip(names, qs))}
+    return {"count": moments["count"], "channels": channels, "sketch_buckets": stored}
@@ -1,3 +1,1438 @@
-from django.test import TestCase
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import admission, alerts, gaps, routers
+from . import resample, ring as ring_mod, seriescache
+from .admin import ProbedDatesQuerySet
+from .bulk import insert_readings
+from .ingest import record_batch
+from .management.commands.generate_readings import synthetic_rows
+from .models import AlertRule, Chamber1Data, Chamber2Data, ChamberAccess, DataGap, Excursion
+from .readings import FIELDS, source_for, to_ms
+from .querybudget import QueryBudgetExceeded, QueryBudgetMiddleware, query_budget, query_shape
+from .sketch import QuantileSketch
+from .tsstore import RECORD, OutOfOrder, SegmentStore
+
+
+class SyntheticReadingsTests(TestCase):
+    def test_insert_keeps_generated_timestamps(self):
+        end = timezone.now().replace(microsecond=0)
+        n = insert_readings(Chamber1Data, synthetic_rows(500, end, 1.0, seed=7), batch_size=120)
+        self.assertEqual(n, 500)
+        qs = Chamber1Data.objects.order_by("created_at")
+        self.assertEqual(qs.count(), 500)
+        self.assertEqual(qs.last().created_at, end)
+        first = qs.first()
+        self.assertEqual(first.date, timezone.localtime(first.created_at).date())
+
+    def test_gaps_stretch_the_window(self):
+        end = timezone.now().replace(microsecond=0)
+        rows = list(synthetic_rows(1000, end, 1.0, gap_rate=0.05, seed=3))
+        self.assertEqual(len(rows), 1000)
+        self.assertGreater(end - rows[0][-1], timedelta(seconds=999))
+        self.assertTrue(all(-50 <= r[2] <= 150 and 0 <= r[4] <= 100 for r in rows))
+
+
+@override_settings(REPLICA_DATABASE=None)
+class ViewQueryCountTests(TestCase):
+    """Every sensor view runs a fixed number of queries, independent of row count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(300, end, 30.0, seed=1))
+        cls.admin = User.objects.create_superuser("boss", password="x")
+        cls.user = User.objects.create_user("op", password="x")
+        ChamberAccess.objects.create(user=cls.user, chamber="ch1")
+        for i in range(3):
+            u = User.objects.create_user(f"op{i}", password="x")
+            ChamberAccess.objects.create(user=u, chamber="ch2")
+        start = timezone.localtime(end - timedelta(hours=3))
+        cls.window = {
+            "start": start.strftime("%Y-%m-%dT%H:%M"),
+            "end": timezone.localtime(end).strftime("%Y-%m-%dT%H:%M"),
+            "every": "5m",
+        }
+
+    def assertQueries(self, n, url, user=None, method="get", **kw):
+        if user is not None:
+            self.client.force_login(user)
+        with self.assertNumQueries(n):
+            resp = getattr(self.client, method)(url, **kw)
+        self.assertLess(resp.status_code, 500)
+        return resp
+
+    def test_pages(self):
+        self.assertQueries(3, "/ch1/", self.user)
+        self.assertQueries(3, "/chart/ch1/", self.user)
+        self.assertQueries(3, "/", self.user)
+        self.assertQueries(2, "/post-login/", self.user)
+
+    def test_read_apis(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        # + the first reading's time, the read size estimate and the compacted
+        # history's extent, once: all three are cached
+        self.assertQueries(8, "/api/range/ch1/", self.user, data={"every": "5m"})
+        self.assertQueries(5, "/api/range/ch1/", self.user, data={"every": "5m"})
+        self.assertQueries(5, "/api/chart_data/ch1/", self.user)
+        self.assertQueries(4, "/api/download_csv/ch1/", self.user, data=self.window)
+        self.assertQueries(4, "/api/download_pdf/ch1/", self.user, data=self.window)
+
+    def test_ingest(self):
+        self.assertQueries(1, "/emb/api/ch1/sensor-data/")
+        body = json.dumps({"temperature": 25, "pressure": 25, "humidity": 50, "co2": 50})
+        # previous reading time + insert + alert rule lookup
+        self.assertQueries(3, "/emb/api/ch1/sensor-data/", method="post",
+                           data=body, content_type="application/json")
+
+    def test_user_admin(self):
+        self.assertQueries(4, "/users/", self.admin)
+        self.assertQueries(2, "/users/create/", self.admin)
+        self.assertQueries(4, f"/users/{self.user.id}/edit/", self.admin)
+        self.assertQueries(5, f"/users/{self.user.id}/edit/", self.admin, method="post",
+                           data={"chambers": ["ch1", "ch2"]})
+
+
+class QueryBudgetTests(TestCase):
+    def _run(self, view):
+        mw = QueryBudgetMiddleware(lambda req: view(req) or HttpResponse())
+        req = RequestFactory().get("/x/")
+        mw.process_view(req, view, (), {})
+        return mw(req)
+
+    def test_over_budget_raises(self):
+        @query_budget(1)
+        def greedy(request):
+            list(Chamber1Data.objects.all()[:1])
+            list(Chamber1Data.objects.all()[:1])
+
+        with override_settings(QUERY_BUDGET_MODE="raise"):
+            with self.assertRaises(QueryBudgetExceeded):
+                self._run(greedy)
+            resp = self._run(query_budget(2)(greedy))
+        self.assertEqual(resp["X-Query-Count"], "2")
+
+    def test_query_shape_folds_parameters(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            query_shape('SELECT * FROM "t" WHERE "id" IN (%s) LIMIT 5'),
+        )
+
+
+class RouterTests(TestCase):
+    def test_writes_and_unmarked_reads_use_primary(self):
+        router = routers.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(Chamber1Data), "default")
+        self.assertEqual(router.db_for_read(Chamber1Data), "default")
+        token = routers._use_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(User), "default")
+        finally:
+            routers._use_replica.reset(token)
+
+
+@skipUnless("replica" in settings.DATABASES, "set DATABASE_REPLICA_NAME to run against two databases")
+class ReplicaRoutingTests(TestCase):
+    """Run with DATABASE_ENGINE=sqlite DATABASE_REPLICA_NAME=/tmp/replica.sqlite3."""
+    databases = {"default", "replica"} & set(settings.DATABASES)
+
+    def setUp(self):
+        end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(3, end, 60.0, seed=1), using="replica")
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+        routers._health.update(alias=None)
+
+    def labels(self):
+        return len(self.client.get("/api/chart_data/ch1/").json()["labels"])
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.labels(), 3)
+
+    def test_read_your_writes_after_ingest(self):
+        body = json.dumps({"temperature": 25, "pressure": 25, "humidity": 50, "co2": 50})
+        resp = self.client.post("/emb/api/ch1/sensor-data/", data=body, content_type="application/json")
+        self.assertIn(routers.STICKY_COOKIE, resp.cookies)
+        self.assertEqual(self.labels(), 1)
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        routers._health.update(alias="replica", ok=False, checked=time.monotonic())
+        self.assertEqual(self.labels(), 0)
+
+
+class SegmentStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = SegmentStore(self.tmp.name, segment_records=10_000)
+
+    def test_range_reads_across_segments(self):
+        recs = np.zeros(25_000, dtype=RECORD)
+        recs["ts"] = np.arange(25_000) * 1000
+        recs["temperature"] = np.arange(25_000) % 50
+        self.store.append(recs[:12_345])
+        self.store.append(recs[12_345:])
+        self.assertEqual(len(self.store.segments()), 3)
+        self.assertEqual(self.store.count(), 25_000)
+
+        out = self.store.read(5_000_000, 15_000_000)
+        self.assertEqual(out["ts"][0], 5_000_000)
+        self.assertEqual(out["ts"][-1], 15_000_000)
+        self.assertEqual(len(out), 10_001)
+
+        inside = self.store.read(21_000_000, 22_000_000)
+        self.assertIsInstance(inside, np.memmap)
+        self.assertEqual(len(inside), 1001)
+
+    def test_late_records_refused(self):
+        self.store.append([(2000, 1, 1, 1, 1)])
+        for recs in ([(1000, 2, 2, 2, 2)], [(3000, 2, 2, 2, 2), (2500, 3, 3, 3, 3)]):
+            with self.assertRaises(OutOfOrder):
+                self.store.append(recs)
+        self.store.append([(2000, 4, 4, 4, 4), (3000, 5, 5, 5, 5)])
+        self.assertEqual(self.store.read()["ts"].tolist(), [2000, 2000, 3000])
+
+
+class SegmentIngestTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(SENSOR_READING_BACKEND="segments", SENSOR_SEGMENT_ROOT=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def post(self, at):
+        body = {"temperature": 20, "pressure": 1, "humidity": 50, "co2": 400, "ts": at.isoformat()}
+        return self.client.post("/emb/api/ch1/sensor-data/", data=json.dumps(body), content_type="application/json")
+
+    def test_late_reading_not_restamped(self):
+        self.assertEqual(self.post(self.now).status_code, 201)
+        self.assertEqual(self.post(self.now - timedelta(minutes=5)).status_code, 409)
+
+        values = {f: 1.0 for f in FIELDS}
+        batch = [(self.now - timedelta(minutes=1), values), (self.now + timedelta(minutes=1), values)]
+        with self.assertLogs("sensor.ingest", "WARNING"):
+            self.assertEqual(record_batch("ch1", batch), 1)
+        times = source_for("ch1").timestamps().tolist()
+        self.assertEqual(times, [to_ms(self.now), to_ms(self.now + timedelta(minutes=1))])
+
+    def test_append_racing_another_worker(self):
+        from unittest import mock
+        from .readings import SegmentReadings
+
+        self.assertEqual(self.post(self.now).status_code, 201)
+        # the newest time was read before another worker's append landed
+        with mock.patch.object(SegmentReadings, "last_timestamp", return_value=None):
+            self.assertEqual(self.post(self.now - timedelta(minutes=5)).status_code, 409)
+
+        values = {f: 1.0 for f in FIELDS}
+        batch = [(self.now - timedelta(minutes=1), values), (self.now + timedelta(minutes=1), values)]
+        with mock.patch.object(SegmentReadings, "last_timestamp", side_effect=[None, self.now]), \
+                self.assertLogs("sensor.ingest", "WARNING"):
+            self.assertEqual(record_batch("ch1", batch), 1)
+        self.assertEqual(len(source_for("ch1").timestamps()), 2)
+
+
+class WorkerStartupTests(SimpleTestCase):
+    """A cold worker (temp.wsgi + URLconf, as on its first request) stays light."""
+
+    BUDGET_MS = int(os.getenv("WSGI_IMPORT_BUDGET_MS", "1500"))
+    PROBE = (
+        "import sys, time\n"
+        "t = time.perf_counter()\n"
+        "import temp.wsgi\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+        "ms = (time.perf_counter() - t) * 1000\n"
+        "heavy = [m for m in ('reportlab', 'pytz', 'numpy', 'matplotlib') if m in sys.modules]\n"
+        "print(round(ms), ','.join(heavy))\n"
+    )
+
+    def test_import_time_budget(self):
+        runs = []
+        for _ in range(3):
+            out = subprocess.run(
+                [sys.executable, "-c", self.PROBE], cwd=settings.BASE_DIR, env=os.environ.copy(),
+                capture_output=True, text=True, check=True,
+            ).stdout.split()
+            runs.append(int(out[0]))
+            self.assertEqual(out[1:], [], "export/analysis stacks loaded at start-up")
+        self.assertLess(min(runs), self.BUDGET_MS, f"temp.wsgi cold start {runs} ms")
+
+
+class WindowStatsTests(TestCase):
+    def setUp(self):
+        self.end = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        insert_readings(Chamber1Data, synthetic_rows(5000, self.end, 10.0, gap_rate=0, outlier_rate=0, seed=5))
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+
+    def test_sketches_merge_exactly(self):
+        a, b, whole = QuantileSketch(0.1), QuantileSketch(0.1), QuantileSketch(0.1)
+        for i in range(1000):
+            (a if i % 2 else b).add(i / 10)
+            whole.add(i / 10)
+        self.assertEqual(a.merge(b).bins, whole.bins)
+        self.assertAlmostEqual(whole.quantiles([0.5])[0], 50.0, delta=0.1)
+
+    def test_stats_match_raw_rows(self):
+        start = timezone.localtime(self.end - timedelta(hours=10))
+        end = timezone.localtime(self.end)
+        params = {"start": start.strftime("%Y-%m-%dT%H:%M"), "end": end.strftime("%Y-%m-%dT%H:%M")}
+        first = self.client.get("/api/stats/ch1/", params).json()
+        again = self.client.get("/api/stats/ch1/", params).json()
+        self.assertEqual(first["channels"], again["channels"])
+        self.assertGreater(again["sketch_buckets"], 5)
+
+        temps = sorted(Chamber1Data.objects.filter(
+            created_at__gte=start.replace(second=0), created_at__lte=end.replace(second=59),
+        ).values_list("temperature", flat=True))
+        self.assertEqual(again["count"], len(temps))
+        t = again["channels"]["temperature"]
+        self.assertEqual(t["min"], temps[0])
+        self.assertEqual(t["max"], temps[-1])
+        self.assertAlmostEqual(t["p50"], temps[(len(temps) - 1) // 2], delta=0.05)
+        self.assertAlmostEqual(t["p95"], temps[int((len(temps) - 1) * 0.95)], delta=0.05)
+
+
+class AlertTests(TestCase):
+    def setUp(self):
+        self.t0 = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        self.band = AlertRule.objects.create(
+            name="temp band", chamber="ch1", channel="temperature", low=20, high=30, min_duration=120,
+        )
+        self.rate = AlertRule.objects.create(
+            name="hum rate", chamber="ch1", channel="humidity", kind=AlertRule.RATE, max_rate=5,
+        )
+
+    def feed(self, temps, hums):
+        for i, (t, h) in enumerate(zip(temps, hums)):
+            alerts.evaluate("ch1", self.t0 + timedelta(minutes=i), {"temperature": t, "humidity": h})
+
+    def test_band_needs_sustained_breach(self):
+        self.feed([25, 31, 32, 25, 31, 33, 35, 34, 25], [50] * 9)
+        exc = Excursion.objects.get(rule=self.band)
+        self.assertEqual(exc.started_at, self.t0 + timedelta(minutes=4))
+        self.assertEqual(exc.ended_at, self.t0 + timedelta(minutes=8))
+        self.assertEqual(exc.peak, 35)
+        self.band.refresh_from_db()
+        self.assertIsNone(self.band.open_excursion)
+
+    def test_rate_excursion_stays_open(self):
+        self.feed([25] * 4, [50, 51, 60, 70])
+        exc = Excursion.objects.get(rule=self.rate)
+        self.assertIsNone(exc.ended_at)
+        self.assertEqual(exc.peak, 10)
+        self.rate.refresh_from_db()
+        self.assertEqual(self.rate.open_excursion, exc)
+
+    def test_replay_matches_live_evaluation(self):
+        temps = [25, 31, 32, 33, 25, 31, 31, 31, 31]
+        hums = [50, 51, 60, 70, 70, 70, 50, 50, 50]
+        self.feed(temps, hums)
+        live = sorted(Excursion.objects.values_list("rule_id", "started_at", "ended_at", "peak"))
+
+        rules = [self.band, self.rate]
+        for r in rules:
+            r.last_value = r.last_at = r.breach_since = r.open_excursion = None
+        readings = [
+            (self.t0 + timedelta(minutes=i), {"temperature": t, "humidity": h})
+            for i, (t, h) in enumerate(zip(temps, hums))
+        ]
+        found = alerts.replay(rules, readings)
+        self.assertEqual(sorted((e.rule_id, e.started_at, e.ended_at, e.peak) for e in found), live)
+
+
+class DataGapTests(TestCase):
+    def setUp(self):
+        self.end = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        insert_readings(Chamber1Data, synthetic_rows(2000, self.end, 10.0, gap_rate=0.01, gap_max=7200, seed=9))
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+
+    def test_backfill_matches_ingest_detection(self):
+        found = gaps.backfill("ch1")
+        self.assertGreater(found, 0)
+        self.assertEqual(DataGap.objects.count(), found)
+        self.assertEqual(gaps.backfill("ch1"), found)  # idempotent
+        self.assertEqual(DataGap.objects.count(), found)
+
+        times = list(Chamber1Data.objects.order_by("created_at").values_list("created_at", flat=True))
+        expected = sum(1 for a, b in zip(times, times[1:]) if b - a > gaps.threshold())
+        self.assertEqual(found, expected)
+
+    def test_range_rows_marks_gaps(self):
+        gaps.backfill("ch1")
+        rows = self.client.get("/api/range/ch1/", {"every": "1m"}).json()
+        markers = [r for r in rows if "gap" in r]
+        self.assertEqual(len(markers), DataGap.objects.count())
+        self.assertTrue(all(r["temperature"] is None for r in markers))
+        plain = self.client.get("/api/range/ch1/", {"every": "1m", "gaps": "0"}).json()
+        self.assertEqual(len(plain), len(rows) - len(markers))
+
+        data = self.client.get("/api/gaps/ch1/").json()
+        self.assertEqual(len(data["gaps"]), len(markers))
+        self.assertIsNotNone(data["offline_since"])
+
+    def test_ingest_records_gap(self):
+        body = json.dumps({"temperature": 25, "pressure": 25, "humidity": 50, "co2": 50})
+        self.client.post("/emb/api/ch1/sensor-data/", data=body, content_type="application/json")
+        gap = DataGap.objects.get()
+        self.assertEqual(gap.started_at, self.end)
+
+
+@override_settings(REPLICA_DATABASE=None)
+class DashboardBundleTests(TestCase):
+    def setUp(self):
+        self.end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(720, self.end, 30.0, gap_rate=0, seed=5))
+        self.user = User.objects.create_user("op", password="x")
+        ChamberAccess.objects.bulk_create([
+            ChamberAccess(user=self.user, chamber="ch1"), ChamberAccess(user=self.user, chamber="ch2"),
+        ])
+        self.client.force_login(self.user)
+
+    def test_one_query_per_chamber(self):
+        # session, user, chamber access, then the window and the latest reading per chamber
+        with self.assertNumQueries(7):
+            data = self.client.get("/api/bundle/", {"hours": 6, "every": "5m"}).json()
+        self.assertEqual(set(data["chambers"]), {"ch1", "ch2"})
+
+        ch1 = data["chambers"]["ch1"]
+        last = Chamber1Data.objects.order_by("created_at").last()
+        self.assertEqual(ch1["latest"]["temperature"], last.temperature)
+        self.assertIsNone(ch1["offline_since"])
+        self.assertEqual(ch1["stats"]["count"], 720)
+        labels = ch1["series"]["labels"]
+        self.assertIn(len(labels), (72, 73))                   # 6 h on the 5-minute grid
+        self.assertTrue(all(int(label[-2:]) % 5 == 0 for label in labels))
+        temps = list(Chamber1Data.objects.values_list("temperature", flat=True))
+        self.assertAlmostEqual(ch1["stats"]["channels"]["temperature"]["max"], max(temps))
+
+        ch2 = data["chambers"]["ch2"]
+        self.assertIsNone(ch2["latest"])
+        self.assertEqual(ch2["stats"]["count"], 0)
+
+    def test_stale_chamber(self):
+        # ch2 went silent two days ago: nothing in the window, but its last reading is known
+        silent_at = self.end - timedelta(days=2)
+        Chamber2Data.objects.create(created_at=silent_at, temperature=21.5, pressure=1.0, humidity=40.0, co2=400.0)
+        ch2 = self.client.get("/api/bundle/", {"hours": 6}).json()["chambers"]["ch2"]
+        self.assertEqual(ch2["stats"]["count"], 0)
+        self.assertEqual(ch2["latest"]["temperature"], 21.5)
+        expected = timezone.localtime(silent_at).isoformat(timespec="seconds")
+        self.assertEqual(ch2["latest"]["created_at"], expected)
+        self.assertEqual(ch2["offline_since"], expected)
+
+    def test_denied_chamber(self):
+        self.assertEqual(self.client.get("/api/bundle/", {"ch": "ch1,ch3"}).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/bundle/").status_code, 401)
+
+
+class ImportReadingsTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_csv_keeps_logged_times_and_resumes(self):
+        lines = ["timestamp,temperature,pressure,humidity,co2"]
+        lines += [f"2025-01-01T00:{m:02d}:00,{20 + m / 10},1.0,{50 + m / 10},400" for m in range(60)]
+        lines.insert(10, "2025-01-01T00:08:30,500,1.0,50,400")    # violates the check constraint
+        path = self._write("log.csv", "\n".join(lines) + "\n")
+
+        out = StringIO()
+        call_command("import_readings", "ch1", path, "--chunk", "25", stdout=out)
+        self.assertIn("60 rows loaded, 1 rejected", out.getvalue())
+        first = Chamber1Data.objects.order_by("created_at").first()
+        self.assertEqual(timezone.localtime(first.created_at).isoformat(), "2025-01-01T00:00:00+05:30")
+        self.assertEqual(str(first.time), "00:00:00")
+
+        # a finished file is skipped; a checkpoint behind the committed rows
+        # (crash before it was written) re-reads without duplicating
+        call_command("import_readings", "ch1", path, stdout=StringIO())
+        with open(path + ".chamber1_data.ckpt", "w") as f:
+            json.dump({"offset": 500, "rows": 0, "rejected": 0}, f)
+        call_command("import_readings", "ch1", path, stdout=StringIO())
+        self.assertEqual(Chamber1Data.objects.count(), 60)
+
+    def test_ndjson_epoch_and_utc(self):
+        path = self._write("log.ndjson", "\n".join([
+            json.dumps({"ts": 1735689600, "temperature": 21, "pressure": 1, "humidity": 40, "co2": 410}),
+            json.dumps({"created_at": "2025-01-01T00:01:00Z", "temperature": 22, "pressure": 1, "humidity": 41, "co2": None}),
+        ]) + "\n")
+        call_command("import_readings", "ch1", path, stdout=StringIO())
+        times = list(Chamber1Data.objects.order_by("created_at").values_list("created_at", "co2"))
+        self.assertEqual([t.isoformat() for t, _ in times], ["2025-01-01T00:00:00+00:00", "2025-01-01T00:01:00+00:00"])
+        self.assertIsNone(times[1][1])
+
+    def test_fills_a_live_gap(self):
+        start = timezone.now().replace(microsecond=0) - timedelta(days=2)
+        end = start + timedelta(hours=6)
+        # the device went silent for 6 h; ingest recorded the outage
+        insert_readings(Chamber1Data, synthetic_rows(60, start, 60.0, gap_rate=0, seed=3))
+        insert_readings(Chamber1Data, synthetic_rows(60, end + timedelta(minutes=59), 60.0, gap_rate=0, seed=4))
+        gaps.backfill("ch1")
+        self.assertEqual([g[:2] for g in gaps.gaps_between("ch1")], [(start, end)])
+
+        # its logger file covers all but the first and last half hour
+        logged = [start + timedelta(minutes=m) for m in range(30, 331, 5)]
+        path = self._write("log.ndjson", "\n".join(
+            json.dumps({"ts": int(t.timestamp()), "temperature": 21, "pressure": 1, "humidity": 40, "co2": 410})
+            for t in logged
+        ) + "\n")
+        call_command("import_readings", "ch1", path, stdout=StringIO())
+        self.assertEqual([g[:2] for g in gaps.gaps_between("ch1")], [(start, logged[0]), (logged[-1], end)])
+
+
+class RingTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "ch1.ring")
+
+    def test_wraps_and_reorders(self):
+        ring = ring_mod.Ring(self.path, 100)
+        self.assertIsNone(ring.window(0))             # unready: caller reads the database
+        ring.seed(1000, [(1000 + i * 10, i + 1, i, 0, 0, 0) for i in range(50)])
+        for i in range(50, 120):
+            ring.append((1000 + i * 10, i + 1, i, 0, 0, 0))
+        ring.append((1000 + 118 * 10 + 5, 500, -1, 0, 0, 0))   # late, slotted into place
+        ring.append((1000 + 119 * 10, 120, 119, 0, 0, 0))      # duplicate id, ignored
+
+        other = ring_mod.Ring(self.path, 100)          # another worker's mapping
+        self.assertIsNone(other.window(1000 + 20 * 10))  # overwritten by newer readings
+        arr = other.window(1000 + 21 * 10)
+        self.assertEqual(len(arr), 100)
+        self.assertEqual(len(other.window(1000 + 30 * 10, 1000 + 39 * 10)), 10)
+        self.assertTrue((np.diff(arr["ts"]) >= 0).all())
+        self.assertEqual(list(arr["temperature"][-3:]), [118, -1, 119])
+        self.assertEqual(int(other.last()["id"]), 120)
+
+        other.invalidate()
+        self.assertFalse(ring.ready)
+
+
+@override_settings(REPLICA_DATABASE=None, SENSOR_RING_RECORDS=5000)
+class RingReadingsTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SENSOR_RING_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        insert_readings(Chamber1Data, synthetic_rows(2000, timezone.now().replace(microsecond=0), 10.0, seed=4))
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+
+    def test_recent_reads_skip_the_database(self):
+        body = json.dumps({"temperature": 25, "pressure": 25, "humidity": 50, "co2": 50})
+        self.client.post("/emb/api/ch1/sensor-data/", data=body, content_type="application/json")
+
+        # session, user, gaps -- the readings come from the ring
+        with self.assertNumQueries(3):
+            from_ring = self.client.get("/api/chart_data/ch1/", {"hours": 2}).json()
+        with self.settings(SENSOR_RING_RECORDS=0):
+            from_db = self.client.get("/api/chart_data/ch1/", {"hours": 2}).json()
+        self.assertEqual(from_ring, from_db)
+        self.assertEqual(from_ring["temperature"][-1], 25)
+
+        with self.assertNumQueries(0):
+            last = self.client.get("/emb/api/ch1/sensor-data/").json()["last"]
+        self.assertEqual(last["id"], Chamber1Data.objects.order_by("created_at").last().id)
+
+
+class ResampleTests(SimpleTestCase):
+    def setUp(self):
+        # 10 s readings over 20 minutes with a 5-minute hole; humidity missing now and then
+        ts = np.concatenate([np.arange(0, 600_000, 10_000), np.arange(900_000, 1_200_000, 10_000)])
+        self.arr = np.zeros(len(ts), dtype=resample.SERIES)
+        self.arr["ts"] = ts
+        self.arr["temperature"] = np.arange(len(ts))
+        self.arr["humidity"] = np.where(np.arange(len(ts)) % 7 == 0, np.nan, 50.0)
+
+    def test_modes_match_a_plain_loop(self):
+        step = timedelta(minutes=2)
+        for mode in resample.MODES:
+            out = resample.resample(self.arr, step, mode, origin=0)
+            buckets = {}
+            for rec in self.arr:
+                buckets.setdefault(int(rec["ts"]) // 120_000 * 120_000, []).append(rec)
+            self.assertEqual(list(out["ts"]), sorted(buckets), mode)
+            for row in out:
+                temps = [float(r["temperature"]) for r in buckets[int(row["ts"])]]
+                hums = [float(r["humidity"]) for r in buckets[int(row["ts"])] if r["humidity"] == r["humidity"]]
+                expected = {
+                    "first": temps[0], "last": temps[-1], "min": min(temps), "max": max(temps),
+                    "mean": round(sum(temps) / len(temps), 4), "count": len(temps),
+                }[mode]
+                self.assertEqual(row["temperature"], expected, mode)
+                if mode == "count":
+                    self.assertEqual(row["humidity"], len(hums))
+
+    def test_fill_and_alignment(self):
+        step = timedelta(minutes=5)
+        plain = resample.resample(self.arr, step, "first", origin=0)
+        self.assertEqual(list(plain["ts"] // 60_000), [0, 5, 15])
+        step = timedelta(minutes=1)
+        self.assertEqual(len(resample.resample(self.arr, step, "first", origin=0)), 15)
+        ffill = resample.resample(self.arr, step, "first", fill="ffill", origin=0)
+        self.assertEqual(len(ffill), 20)
+        self.assertEqual(ffill["temperature"][12], ffill["temperature"][9])
+        linear = resample.resample(self.arr, step, "first", fill="linear", origin=0)
+        self.assertEqual(list(linear["temperature"][9:16]), [54, 55, 56, 57, 58, 59, 60])
+
+        # IST grids line up with the local wall clock, not UTC
+        ist = resample.resample(self.arr, timedelta(hours=1), "first")
+        self.assertEqual(timezone.localtime(resample.from_ms(int(ist["ts"][0]))).minute, 0)
+
+
+class ReadingAdminTests(TestCase):
+    def setUp(self):
+        self.end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(3000, self.end, 600.0, gap_rate=0, seed=2))
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+        self.url = "/admin/sensor/chamber1data/"
+
+    def test_changelist_pages_by_created_at(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        sql = " ".join(q["sql"] for q in ctx.captured_queries).upper()
+        self.assertNotIn("COUNT(", sql)                               # estimated, not counted
+        self.assertNotIn("DISTINCT", sql)                             # no date scans
+        self.assertNotIn("OFFSET", sql)
+
+        seen = []
+        older = resp.context["cl"].older_url
+        for _ in range(3):
+            seen += [r.created_at for r in resp.context["cl"].result_list]
+            resp = self.client.get(self.url + older)
+            older = resp.context["cl"].older_url
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(set(seen)), 300)
+
+        days = ProbedDatesQuerySet(Chamber1Data).datetimes("created_at", "day")
+        expected = {timezone.localtime(t).date() for t in Chamber1Data.objects.values_list("created_at", flat=True)}
+        self.assertEqual([d.date() for d in days], sorted(expected))
+
+    def test_older_pages_split_a_shared_time(self):
+        # 150 readings stamped the same second straddle the first page boundary
+        at = self.end + timedelta(minutes=1)
+        Chamber1Data.objects.bulk_create([
+            Chamber1Data(created_at=at, temperature=20, pressure=1, humidity=50, co2=400) for _ in range(150)
+        ])
+        seen = []
+        resp = self.client.get(self.url)
+        for _ in range(2):
+            seen += [r.pk for r in resp.context["cl"].result_list]
+            resp = self.client.get(self.url + resp.context["cl"].older_url)
+        self.assertEqual(len(set(seen)), 200)
+        self.assertEqual(set(Chamber1Data.objects.filter(created_at=at).values_list("pk", flat=True)) - set(seen), set())
+
+    def test_read_only(self):
+        row = Chamber1Data.objects.first()
+        self.assertEqual(self.client.get(f"{self.url}{row.pk}/delete/").status_code, 403)
+        self.assertEqual(self.client.post(f"{self.url}{row.pk}/change/", {"temperature": 1}).status_code, 403)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SENSOR_PROFILE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.dir = tmp.name
+        insert_readings(Chamber1Data, synthetic_rows(200, timezone.now().replace(microsecond=0), 60.0, seed=5))
+
+    def test_flagged_superuser_request_is_captured(self):
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+        self.client.get("/api/chart_data/ch1/")
+        self.assertEqual(os.listdir(self.dir), [])
+
+        resp = self.client.get("/api/chart_data/ch1/", {"_profile": 1})
+        name = resp["X-Profile-Id"]
+        self.assertEqual(sorted(os.listdir(self.dir)), [name + ".json", name + ".prof"])
+
+        page = self.client.get(f"/profiles/{name}/")
+        self.assertContains(page, "chamber1_data")                  # the SQL timeline
+        self.assertContains(page, "chart_data")                     # the function stats
+        self.assertContains(self.client.get("/profiles/"), name)
+        self.assertEqual(self.client.get(f"/profiles/{name}/", {"download": 1})["Content-Type"],
+                         "application/octet-stream")
+        self.assertEqual(self.client.get("/profiles/..%2Fsecret/").status_code, 404)
+
+    def test_other_users_are_not_profiled(self):
+        user = User.objects.create_user("op", password="x")
+        ChamberAccess.objects.create(user=user, chamber="ch1")
+        self.client.force_login(user)
+        resp = self.client.get("/api/chart_data/ch1/", {"_profile": 1})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Profile-Id", resp)
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+class SparklineTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        insert_readings(Chamber1Data, synthetic_rows(3000, timezone.now().replace(microsecond=0), 60.0, seed=6))
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+
+    def test_png_is_cached_per_bucket(self):
+        from .sparklines import invalidate
+
+        url = "/api/sparkline/ch1.png"
+        with self.assertNumQueries(4):                                # session, user, newest, rows
+            first = self.client.get(url, {"field": "humidity"})
+        self.assertEqual(first["Content-Type"], "image/png")
+        self.assertTrue(first.content.startswith(b"\x89PNG"))
+
+        with self.assertNumQueries(3):                                # drawn once per bucket
+            again = self.client.get(url, {"field": "humidity"})
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(self.client.get(url, {"field": "humidity"}, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        invalidate("ch1")
+        self.assertNotEqual(self.client.get(url, {"field": "humidity"})["ETag"], first["ETag"])
+        self.assertEqual(self.client.get(url, {"field": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/sparkline/ch2.png").status_code, 204)
+
+        home = self.client.get("/chambers/")
+        self.assertContains(home, "/api/sparkline/ch3.png?field=temperature")
+
+
+class CompactSchemaTests(TestCase):
+    def test_copy_and_read_back(self):
+        from .readings import CompactReadings, OrmReadings
+
+        end = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        insert_readings(Chamber1Data, synthetic_rows(2500, end, 60.0, seed=7))
+        out = StringIO()
+        call_command("compact_readings", "--chambers", "ch1", "--batch-size", "1000", stdout=out)
+        self.assertIn("2500 rows copied", out.getvalue())
+        self.assertIn("chamber1_compact: 2500 rows", out.getvalue())
+
+        compact, orm = CompactReadings("ch1"), OrmReadings("ch1")
+        self.assertEqual(list(compact.rows()), list(orm.rows()))
+        start = end - timedelta(hours=3)
+        self.assertEqual(list(compact.rows(start)), list(orm.rows(start)))
+        self.assertEqual(compact.last_timestamp(), orm.last_timestamp())
+        self.assertEqual(list(compact.timestamps(start)), list(orm.timestamps(start)))
+        for f in FIELDS:
+            self.assertAlmostEqual(compact.moments()[f]["mean"], orm.moments()[f]["mean"], places=6)
+
+        # resumes after the newest copied reading
+        insert_readings(Chamber1Data, synthetic_rows(10, end + timedelta(minutes=10), 60.0, gap_rate=0, seed=8))
+        out = StringIO()
+        call_command("compact_readings", "--chambers", "ch1", stdout=out)
+        self.assertIn(" 10 rows copied", out.getvalue())
+
+        row = compact.append(temperature=21.456, pressure=1.0, humidity=55.5, co2=None)
+        twin = compact.append(temperature=21.0, pressure=1.0, humidity=55.5, co2=None)
+        self.assertGreater(twin.id, row.id)
+        latest = compact.latest()
+        self.assertEqual((latest.id, latest.temperature, latest.co2), (twin.id, 21.0, None))
+        self.assertEqual(list(compact.rows(row.created_at))[0][1], 21.46)       # hundredths
+
+
+class SeriesCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        seriescache.reset()
+        self.end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(7 * 1440, self.end, 60.0, seed=9))
+
+    def direct(self, start, end, step, mode):
+        from .readings import source_for
+
+        rows = source_for("ch1").rows(start, end)
+        return resample.resample(resample.from_rows(rows), step, mode, origin=resample.grid_origin(at=start))
+
+    def assertSameSeries(self, got, want):
+        self.assertEqual(got["ts"].tolist(), want["ts"].tolist())
+        for f in FIELDS:
+            np.testing.assert_array_equal(got[f], want[f])
+
+    def test_closed_blocks_are_computed_once(self):
+        step = timedelta(minutes=5)
+        first = Chamber1Data.objects.order_by("created_at").first().created_at
+        whole = seriescache.series("ch1", None, None, step, "mean")
+        self.assertSameSeries(whole, self.direct(first, None, step, "mean"))
+        self.assertEqual(seriescache.stats()["reads"], 1)             # cold: one read
+
+        start, end = self.end - timedelta(days=5, minutes=7), self.end - timedelta(days=1, minutes=3)
+        for mode in ("mean", "last"):
+            got = seriescache.series("ch1", start, end, step, mode)
+            self.assertSameSeries(got, self.direct(start, end, step, mode))
+
+        seriescache.reset()
+        seriescache.series("ch1", start, end, step, "mean")           # from the shared tier
+        again = seriescache.series("ch1", start, end, step, "mean")   # from the local tier
+        self.assertSameSeries(again, self.direct(start, end, step, "mean"))
+        stats = seriescache.stats()
+        self.assertEqual((stats["misses"], stats["reads"]), (0, 4))   # only the edges
+        self.assertEqual(stats["shared_hits"], stats["local_hits"])
+        self.assertGreater(stats["local_hits"], 2)
+
+        # new readings only touch the open tail; a load into the past retires everything
+        Chamber1Data.objects.filter(created_at__lt=self.end - timedelta(days=3)).update(temperature=0)
+        zeros = lambda arr: int((arr["temperature"] == 0).sum())
+        want = zeros(self.direct(start, end, step, "mean"))
+        self.assertLess(zeros(seriescache.series("ch1", start, end, step, "mean")), want)
+        from .readings import invalidate_recent
+
+        invalidate_recent("ch1")
+        self.assertEqual(zeros(seriescache.series("ch1", start, end, step, "mean")), want)
+
+    def test_stats_endpoint(self):
+        seriescache.series("ch1", None, None, timedelta(hours=1), "first")
+        self.client.force_login(User.objects.create_superuser("boss", password="x"))
+        self.assertEqual(self.client.get("/api/series-cache/").json()["misses"], seriescache.stats()["misses"])
+
+    def test_lru_is_bounded(self):
+        lru = seriescache.LRU(3 * (80 + seriescache.ENTRY_OVERHEAD))
+        for i in range(5):
+            lru.put(i, np.zeros(10))
+            lru.get(0)
+        self.assertEqual(list(lru.items), [3, 4, 0])
+        self.assertLessEqual(lru.size, lru.max_bytes)
+
+
+class DeviceTimeTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        seriescache.reset()
+        self.end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(2 * 288, self.end, 300.0, gap_rate=0, seed=10))
+        # an outage from 34 h to 30 h ago
+        self.hole = (self.end - timedelta(hours=34), self.end - timedelta(hours=30))
+        Chamber1Data.objects.filter(created_at__gt=self.hole[0], created_at__lt=self.hole[1]).delete()
+        gaps.backfill("ch1")
+        self.url = "/emb/api/ch1/sensor-data/"
+
+    def post(self, ts, temperature=30.0):
+        body = {"temperature": temperature, "pressure": 25, "humidity": 50, "co2": 50, "ts": ts}
+        return self.client.post(self.url, data=json.dumps(body), content_type="application/json")
+
+    def test_late_reading_repairs_derived_data(self):
+        from .models import ReadingSketch
+        from .stats import bucket_floor, window_stats
+
+        step = timedelta(minutes=15)
+        direct = lambda: resample.resample(
+            resample.from_rows(Chamber1Data.objects.order_by("created_at").values_list("created_at", *FIELDS)),
+            step, "mean", origin=resample.grid_origin(at=self.end),
+        )
+        seriescache.series("ch1", None, None, step, "mean")
+        at = self.end - timedelta(hours=40, seconds=-90)
+        window_stats("ch1", at - timedelta(hours=2), at + timedelta(hours=2))
+        sketch = ReadingSketch.objects.get(chamber="ch1", bucket_start=bucket_floor(at))
+
+        # late, in the middle of the outage: the gap splits in two
+        middle = self.hole[0] + timedelta(hours=2)
+        # dedup, newest, insert, gap lookup + split in a savepoint, sketch lookup in a savepoint
+        with self.assertNumQueries(11):
+            resp = self.post(middle.isoformat())
+        self.assertEqual(resp.status_code, 201)
+        self.assertTrue(resp.json()["late"])
+        self.assertEqual(
+            list(DataGap.objects.values_list("started_at", "ended_at")),
+            [(self.hole[0], middle), (middle, self.hole[1])],
+        )
+        times = list(Chamber1Data.objects.order_by("created_at").values_list("created_at", flat=True))
+        self.assertEqual(times, sorted(times))
+        self.assertIn(middle, times)
+
+        # late, into a stored sketch bucket and a cached series block
+        # dedup, newest, insert, gap lookup, sketch lookup + update, 4 savepoint statements
+        with self.assertNumQueries(10):
+            self.assertEqual(self.post(int(at.timestamp() * 1000), temperature=99.0).status_code, 201)
+        sketch.refresh_from_db()
+        self.assertEqual(sketch.count, Chamber1Data.objects.filter(
+            created_at__gte=bucket_floor(at), created_at__lt=bucket_floor(at) + timedelta(hours=1)).count())
+        cached = seriescache.series("ch1", None, None, step, "mean")
+        self.assertEqual(cached["temperature"].tolist(), direct()["temperature"].tolist())
+
+        # a resend is acknowledged but not stored twice
+        count = Chamber1Data.objects.count()
+        self.assertEqual(self.post(middle.isoformat()).json()["status"], "duplicate")
+        self.assertEqual(Chamber1Data.objects.count(), count)
+
+    def test_clock_bounds(self):
+        self.assertEqual(self.post((timezone.now() + timedelta(minutes=5)).isoformat()).status_code, 400)
+        self.assertEqual(self.post((timezone.now() - timedelta(days=8)).isoformat()).status_code, 400)
+        self.assertEqual(self.post("yesterday").status_code, 400)
+
+        resp = self.post((timezone.now() + timedelta(seconds=30)).isoformat())   # slightly fast clock
+        self.assertEqual(resp.status_code, 201)
+        self.assertFalse(resp.json()["late"])
+        self.assertLessEqual(Chamber1Data.objects.order_by("created_at").last().created_at, timezone.now())
+
+
+@override_settings(SENSOR_READ_BUDGET={"range": 100, "chart": 100, "csv": 100, "pdf": 100})
+class AdmissionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.end = timezone.now().replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(2 * 288, cls.end, 300.0, gap_rate=0, seed=11))
+        cls.user = User.objects.create_user("op", password="x")
+        ChamberAccess.objects.create(user=cls.user, chamber="ch1")
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        seriescache.reset()
+        self.client.force_login(self.user)
+
+    def test_estimate(self):
+        # two days at the native 5 minutes, whatever finer step is asked for
+        self.assertAlmostEqual(admission.estimate("ch1", None, None, timedelta(minutes=1)), 576, delta=2)
+        self.assertAlmostEqual(admission.estimate("ch1", None, None, timedelta(hours=1)), 48, delta=2)
+        self.assertEqual(admission.estimate("ch1", self.end + timedelta(hours=1), None), 0)
+        # fill= makes every bucket, data or not
+        self.assertAlmostEqual(admission.estimate("ch1", None, None, timedelta(minutes=1), "linear"), 2880, delta=10)
+
+    def test_step_finer_than_steps(self):
+        tiny = timedelta(milliseconds=1)
+        with self.assertRaises(admission.Rejected):
+            admission.plan("ch1", "range", self.end - timedelta(minutes=5), None, "1ms", tiny, False, "linear")
+        every, step, points = admission.plan("ch1", "range", self.end - timedelta(minutes=5), None, "1ms", tiny,
+                                             True, "linear")
+        self.assertEqual((every, step), ("1m", timedelta(minutes=1)))
+
+    def test_coarsened_to_fit(self):
+        resp = self.client.get("/api/range/ch1/", {"every": "1m", "gaps": "0"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["X-Resolution"], "30m")
+        self.assertLessEqual(len(resp.json()), 100)
+
+        # raw chart rows come back resampled
+        resp = self.client.get("/api/chart_data/ch1/")
+        self.assertEqual(resp.json()["every"], "30m")
+        self.assertLessEqual(len(resp.json()["labels"]), 100)
+
+        # a window that fits is served as asked
+        resp = self.client.get("/api/chart_data/ch1/", {"hours": 4})
+        self.assertEqual(resp["X-Resolution"], "raw")
+        self.assertIsNone(resp.json()["every"])
+
+    def test_step_under_a_minute_refused(self):
+        for every in ("0m", "-5m", "0h", "5s"):
+            resp = self.client.get("/api/range/ch1/", {"every": every, "fill": "linear"})
+            self.assertEqual(resp.status_code, 400, every)
+            self.assertIn("at least 1m", resp.json()["error"])
+        self.assertEqual(self.client.get("/api/bundle/", {"every": "0m", "fill": "linear"}).status_code, 400)
+
+    def test_rejected(self):
+        resp = self.client.get("/api/range/ch1/", {"every": "1m", "coarsen": "0"})
+        self.assertEqual(resp.status_code, 413)
+        self.assertIn("limit of 100", resp.json()["error"])
+
+        with override_settings(SENSOR_READ_BUDGET={"range": 1}):
+            self.assertEqual(self.client.get("/api/range/ch1/").status_code, 413)
+
+    @override_settings(SENSOR_HEAVY_POINTS=10, SENSOR_HEAVY_CONCURRENCY=1, SENSOR_HEAVY_WAIT=0)
+    def test_heavy_reads_capped(self):
+        slots = admission._semaphore()
+        slots.acquire()
+        try:
+            resp = self.client.get("/api/range/ch1/", {"every": "1h"})
+            self.assertEqual(resp.status_code, 503)
+            self.assertEqual(resp["Retry-After"], "1")
+            # small reads don't queue behind big ones
+            self.assertEqual(self.client.get("/api/range/ch1/", {"every": "1h", "hours": 4}).status_code, 200)
+        finally:
+            slots.release()
+        self.assertEqual(self.client.get("/api/range/ch1/", {"every": "1h"}).status_code, 200)
+
+
+@override_settings(SENSOR_INGEST_RATE={"device": (1.0, 3), "chamber": (0.01, 5)})
+class IngestRateLimitTests(TestCase):
+    url = "/emb/api/ch1/sensor-data/"
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.admin = User.objects.create_superuser("boss", password="x")
+
+    def post(self, device):
+        body = json.dumps({"temperature": 25, "pressure": 25, "humidity": 50, "co2": 50})
+        return self.client.post(self.url, data=body, content_type="application/json", HTTP_X_DEVICE_ID=device)
+
+    def test_device_and_chamber_buckets(self):
+        self.assertEqual([self.post("a").status_code for _ in range(4)], [201, 201, 201, 429])
+        resp = self.post("a")
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "1")
+        self.assertEqual(Chamber1Data.objects.count(), 3)
+
+        # another device still gets in, until the chamber's bucket is empty
+        self.assertEqual([self.post("b").status_code for _ in range(3)], [201, 201, 429])
+
+        self.client.force_login(self.admin)
+        counts = self.client.get("/api/ingest-throttle/").json()["ch1"]
+        self.assertEqual((counts["device"], counts["chamber"]), (2, 1))
+        self.assertEqual(counts["last"]["device"], "b")
+
+    def test_refill(self):
+        from . import ratelimit
+
+        now = 1_000_000.0
+        self.assertEqual([ratelimit.take("ch2", "x", now) for _ in range(4)], [0, 0, 0, 1])
+        self.assertEqual(ratelimit.take("ch2", "x", now + 1.0), 0)     # one token back per second
+        self.assertEqual(ratelimit.take("ch2", "x", now + 1.0), 1)
+        with override_settings(SENSOR_INGEST_RATE={}):
+            self.assertEqual(ratelimit.take("ch2", "x", now + 1.0), 0)
+
+    def test_device_named_in_body(self):
+        # devices behind one gateway (same address, no header) get buckets of their own
+        post = lambda device: self.client.post(self.url, content_type="application/json", data=json.dumps(
+            {"device": device, "temperature": 25, "pressure": 25, "humidity": 50, "co2": 50}))
+        self.assertEqual([post("gw-a").status_code for _ in range(4)], [201, 201, 201, 429])
+        self.assertEqual(post("gw-b").status_code, 201)
+
+    def test_needs_shared_cache(self):
+        from . import ratelimit
+
+        self.assertEqual([e.id for e in ratelimit.check_shared_cache()], ["sensor.E001"])
+        shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/x"}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(ratelimit.check_shared_cache(), [])
+        with override_settings(SENSOR_INGEST_RATE={}):
+            self.assertEqual(ratelimit.check_shared_cache(), [])
+
+
+class StaticAssetTests(TestCase):
+    def test_icon_subset_covers_templates(self):
+        from .management.commands.subset_icons import codepoints, used_icons
+
+        css = (settings.BASE_DIR / "static" / "vendor" / "fontawesome" / "icons.css").read_text()
+        styles = {"solid", "regular", "brands", "classic", "sharp"}
+        missing = used_icons() - set(codepoints(css)) - styles
+        self.assertFalse(missing, f"re-run manage.py subset_icons for {sorted(missing)}")
+
+    def test_hashed_compressed_and_immutable(self):
+        from django.test import Client
+
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            call_command("collectstatic", interactive=False, ignore_patterns=["admin"], verbosity=0)
+            page = Client().get("/login/").content.decode()
+            self.assertNotIn("cdnjs", page)
+            url = next(u for u in re.findall(r'(?:href|src)="([^"]+)"', page) if "fontawesome" in u)
+            self.assertRegex(url, r"/static/vendor/fontawesome/icons\.[0-9a-f]{12}\.css$")
+
+            resp = Client().get(url, HTTP_ACCEPT_ENCODING="br, gzip")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp["Content-Encoding"], "br")
+            self.assertIn("immutable", resp["Cache-Control"])
+            # the font URL inside the CSS is hashed too
+            css = b"".join(Client().get(url).streaming_content).decode()
+            self.assertRegex(css, r"fa-solid-900\.[0-9a-f]{12}\.woff2")
+
+
+@override_settings(SENSOR_ROLLUP_POLICY=((90, 60), (92, 3600)))
+class RollupTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        seriescache.reset()
+        # 4 days of 5-minute readings, ending 89 days ago
+        self.end = (timezone.now() - timedelta(days=89)).replace(microsecond=0)
+        insert_readings(Chamber1Data, synthetic_rows(4 * 288, self.end, 300.0, gap_rate=0, seed=12))
+        self.total = Chamber1Data.objects.count()
+
+    def hourly(self, mode):
+        return seriescache.series("ch1", None, None, timedelta(hours=1), mode)
+
+    def compact(self):
+        from . import rollups
+
+        return list(rollups.compact("ch1", chunk=timedelta(hours=6)))
+
+    def test_history_read_through_rollups(self):
+        from .models import ReadingRollup
+
+        before = {mode: self.hourly(mode) for mode in ("mean", "min", "max")}
+        self.compact()
+
+        # the cutoff is rounded down to a whole minute
+        old = Chamber1Data.objects.filter(created_at__lt=timezone.now() - timedelta(days=90, minutes=1))
+        self.assertFalse(old.exists())
+        self.assertEqual(set(ReadingRollup.objects.values_list("resolution", flat=True)), {60, 3600})
+        folded = sum(ReadingRollup.objects.values_list("count", flat=True))
+        self.assertEqual(folded + Chamber1Data.objects.count(), self.total)
+
+        # hourly buckets come out the same from the raw rows and the rollups
+        for mode, want in before.items():
+            got = self.hourly(mode)
+            self.assertEqual(got["ts"].tolist(), want["ts"].tolist())
+            np.testing.assert_allclose(got["temperature"], want["temperature"], atol=1e-3)
+
+    def test_resumable_and_late_readings_folded(self):
+        from . import rollups
+        from .models import ReadingRollup
+
+        run = rollups.compact("ch1", chunk=timedelta(hours=6))
+        next(run)
+        run.close()          # stopped after one chunk
+        self.compact()
+        self.assertEqual(sum(ReadingRollup.objects.values_list("count", flat=True)) + Chamber1Data.objects.count(),
+                         self.total)
+
+        bucket = ReadingRollup.objects.filter(resolution=3600).order_by("bucket_start").first()
+        late = Chamber1Data.objects.create(created_at=bucket.bucket_start + timedelta(seconds=1), temperature=99.0,
+                                           pressure=25, humidity=50, co2=50)
+        # visible before the next run, folded in by it
+        rows = list(source_for("ch1").rows(bucket.bucket_start, bucket.bucket_start + timedelta(minutes=59), "max"))
+        self.assertIn(99.0, [r[1] for r in rows])
+        self.compact()
+        self.assertFalse(Chamber1Data.objects.filter(pk=late.pk).exists())
+        merged = ReadingRollup.objects.get(chamber="ch1", resolution=3600, bucket_start=bucket.bucket_start)
+        self.assertEqual((merged.count, merged.temperature_max), (bucket.count + 1, 99.0))
+
+    def test_stats_and_gaps_after_compaction(self):
+        from .stats import window_stats
+
+        start, end = self.end - timedelta(days=5), timezone.now()
+        before = window_stats("ch1", start, end)
+        self.compact()
+        after = window_stats("ch1", start, end)
+        self.assertEqual(after["count"], before["count"])
+        for f in ("temperature", "humidity"):
+            got, want = after["channels"][f], before["channels"][f]
+            self.assertEqual((got["min"], got["max"]), (want["min"], want["max"]))
+            self.assertAlmostEqual(got["mean"], want["mean"], places=3)
+            self.assertLessEqual(got["stddev"], want["stddev"] + 1e-9)
+
+        # the compacted span is covered, not one long outage
+        self.assertEqual(gaps.backfill("ch1"), 0)
+
+    def test_range_api_spans_both(self):
+        self.compact()
+        user = User.objects.create_superuser("boss", password="x")
+        self.client.force_login(user)
+        resp = self.client.get("/api/range/ch1/", {"every": "1h", "gaps": "0"})
+        self.assertEqual(len(resp.json()), len(self.hourly("mean")))
+        self.assertGreaterEqual(len(resp.json()), 4 * 24)
+
+
+@override_settings(SENSOR_DEVICE_KEYS={"gw1": {"key": "s3cret", "chambers": ["ch1", "ch2"]}, "gw2": "other"})
+class ListenerTests(TransactionTestCase):
+    """sensor.listener end to end; its writer thread needs committed data."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def run_listener(self, scenario):
+        import asyncio
+        from .listener import Listener
+
+        async def main():
+            listener = Listener("127.0.0.1", tcp_port=0, udp_port=0, batch_size=100, flush_ms=20)
+            tcp, udp = await listener.start()
+            try:
+                return await scenario(tcp, udp)
+            finally:
+                await listener.stop()
+        return asyncio.run(main())
+
+    def test_tcp_text_and_binary(self):
+        import asyncio
+        from .listener import RECORD
+
+        rule = AlertRule.objects.create(chamber="ch1", channel="temperature", kind=AlertRule.BAND, high=40.0)
+        base = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        ms = lambda minutes: int((base + timedelta(minutes=minutes)).timestamp() * 1000)
+
+        async def scenario(tcp, udp):
+            reader, writer = await asyncio.open_connection("127.0.0.1", tcp)
+
+            async def send(data, replies):
+                writer.write(data)
+                await writer.drain()
+                return [(await reader.readline()).decode().strip() for _ in range(replies)]
+
+            got = await send(b"1 25 1 50 400\nAUTH gw1 nope\n", 2)
+            got += await send(b"AUTH gw1 s3cret\n", 1)
+            got += await send((
+                f"1 25.5 1.0 50 400 {ms(0)}\n"
+                f"ch1 45 1.0 50 400 {ms(1)}\n"
+                + json.dumps({"ch": "ch1", "temperature": 26, "pressure": 1, "humidity": 51, "co2": 410,
+                              "ts": ms(2)}) + "\n"
+                f"1 25 1 120 400 {ms(3)}\n"         # humidity out of range
+                f"3 25 1 50 400\n"                  # not this device's chamber
+                f"1 25.5 1.0 50 400 {ms(0)}\n"      # a resend
+                "SYNC\n"
+            ).encode(), 3)
+            records = b"".join(RECORD.pack(1, ms(m), 15.0 + m, 1.0, 50.0, 400.0) for m in range(20, 25))
+            got += await send(b"BINARY\n" + records + RECORD.pack(0, 0, 0, 0, 0, 0), 2)
+            writer.close()
+            return got
+
+        replies = self.run_listener(scenario)
+        self.assertEqual(replies[:3], ["ERR 1 AUTH first", "ERR auth", "OK"])
+        self.assertTrue(replies[3].startswith("ERR 7 humidity"))
+        self.assertTrue(replies[4].startswith("ERR 8 not allowed"))
+        self.assertEqual(replies[5:], ["OK 4 2", "OK", "OK 9 2"])
+
+        times = list(Chamber1Data.objects.order_by("created_at").values_list("created_at", flat=True))
+        self.assertEqual(len(times), 8)                 # the resend was dropped
+        self.assertEqual(times[0], base)
+        self.assertEqual(DataGap.objects.get(chamber="ch1").started_at, base + timedelta(minutes=2))
+        exc = Excursion.objects.get(rule=rule)
+        self.assertEqual((exc.started_at, exc.ended_at), (base + timedelta(minutes=1), base + timedelta(minutes=2)))
+        self.assertEqual(Chamber1Data.objects.get(created_at=base + timedelta(minutes=24)).temperature, 39.0)
+
+    def test_udp(self):
+        import asyncio
+        import socket
+
+        async def scenario(tcp, udp):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"AUTH gw2 other\n2 25 1 50 400\n2 26 1 50 400", ("127.0.0.1", udp))
+                sock.sendto(b"AUTH gw2 wrong\n2 25 1 50 400\n", ("127.0.0.1", udp))
+                await asyncio.sleep(0.2)
+
+        self.run_listener(scenario)
+        from .models import Chamber2Data
+
+        self.assertEqual(sorted(Chamber2Data.objects.values_list("temperature", flat=True)), [25.0, 26.0])
+        # stamped on arrival, one time each
+        self.assertEqual(Chamber2Data.objects.values("created_at").distinct().count(), 2)
+
+    def test_untimed_readings_spooled_apart(self):
+        from . import spool
+        from .listener import Batcher, Session, store
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        batcher = Batcher(100, 200)
+        self.addCleanup(batcher.close)
+        session = Session(batcher)
+        session.feed(b"AUTH gw1 s3cret\n1 25 1 50 400\n1 26 1 50 400\n1 27 1 50 400\n")
+        with override_settings(SENSOR_SPOOL_DIR=tmp.name):
+            self.assertEqual(store(batcher.pending), (3, 0))
+            self.assertEqual(spool.drain(), 3)
+        self.assertEqual(sorted(Chamber1Data.objects.values_list("temperature", flat=True)), [25.0, 26.0, 27.0])
+
+
+class SpoolTests(TestCase):
+    url = "/emb/api/ch1/sensor-data/"
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        settings_override = override_settings(SENSOR_SPOOL_DIR=self.root, SENSOR_SPOOL_SEGMENT_BYTES=10 * 45)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def post(self, **extra):
+        body = {"temperature": 25, "pressure": 1, "humidity": 50, "co2": 400, **extra}
+        return self.client.post(self.url, data=json.dumps(body), content_type="application/json")
+
+    def test_replay_keeps_times_and_dedups(self):
+        from . import spool
+
+        base = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        with self.assertNumQueries(0):
+            resp = self.post(ts=base.isoformat())
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json()["status"], "queued")
+        for s in range(1, 25):
+            spool.append([("ch1", base + timedelta(seconds=s), {f: 1.0 for f in FIELDS})])
+        self.assertEqual(Chamber1Data.objects.count(), 0)
+        self.assertEqual(len(spool.segments(self.root)), 3)       # 10 records a segment
+
+        self.assertEqual(spool.drain(batch=7), 25)
+        times = list(Chamber1Data.objects.order_by("created_at").values_list("created_at", flat=True))
+        self.assertEqual(times, [base + timedelta(seconds=s) for s in range(25)])
+        self.assertEqual(Chamber1Data.objects.get(created_at=base).temperature, 25.0)
+        # sealed segments went, the open one stays for its writer
+        self.assertEqual([sealed for _, sealed in spool.segments(self.root)], [False])
+        self.assertEqual(spool.drain(), 0)
+
+        # a drainer that died before its checkpoint: the batch comes again and is dropped
+        os.remove(os.path.join(self.root, spool.CHECKPOINT))
+        self.assertEqual(spool.drain(), 0)
+        self.assertEqual(Chamber1Data.objects.count(), 25)
+
+    def test_readings_within_a_millisecond_kept(self):
+        from . import spool
+
+        at = timezone.now().replace(microsecond=0) - timedelta(minutes=1)
+        spool.append([("ch1", at + timedelta(microseconds=us), {f: 1.0 for f in FIELDS}) for us in (0, 400)])
+        self.assertEqual(spool.drain(), 2)
+        self.assertEqual(Chamber1Data.objects.count(), 2)
+        # sent again: both are recognised as stored
+        spool.append([("ch1", at + timedelta(microseconds=us), {f: 1.0 for f in FIELDS}) for us in (0, 400)])
+        self.assertEqual(spool.drain(), 0)
+
+    def test_concurrent_segments_merged_by_time(self):
+        from . import spool
+
+        rule = AlertRule.objects.create(chamber="ch1", channel="temperature", kind=AlertRule.BAND, high=40.0)
+        base = timezone.now().replace(microsecond=0) - timedelta(minutes=30)
+        # two worker processes, each with its own segment, taking turns
+        writers = [spool.Spool(self.root, 1 << 20), spool.Spool(self.root, 1 << 20)]
+        for i in range(100):
+            writers[i % 2].append([("ch1", base + timedelta(seconds=i), {**{f: 1.0 for f in FIELDS},
+                                                                         "temperature": 50.0})])
+        self.assertEqual(len(spool.segments(self.root)), 2)
+
+        self.assertEqual(spool.drain(batch=7), 100)
+        rule.refresh_from_db()
+        self.assertEqual(rule.last_at, base + timedelta(seconds=99))
+        # every reading was evaluated in order: none counted as late
+        self.assertEqual(Excursion.objects.get(rule=rule).samples, 100)
+
+    def test_torn_tail_and_database_errors(self):
+        from unittest import mock
+        from django.db import OperationalError
+        from . import spool
+
+        base = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+        spool.append([("ch2", base + timedelta(seconds=s), {f: 2.0 for f in FIELDS}) for s in range(3)])
+        spool.spool().close()
+        path, sealed = spool.segments(self.root)[0]
+        self.assertTrue(sealed)
+        with open(path, "ab") as f:
+            f.write(spool.pack("ch2", base, {})[:20])          # a write cut short
+
+        with mock.patch("sensor.ingest.record_batch", side_effect=OperationalError("gone away")):
+            with self.assertRaises(OperationalError):
+                spool.drain()
+        self.assertGreater(spool.backlog(), 0)
+        self.assertEqual(spool.drain(), 3)
+        self.assertEqual(spool.segments(self.root), [])
+        self.assertEqual(spool.backlog(), 0)
+
+    def test_writers_share_fsyncs(self):
+        import threading
+        from unittest import mock
+        from . import spool
+
+        calls = []
+        real = getattr(os, "fdatasync", os.fsync)
+
+        def slow_sync(fd):
+            calls.append(fd)
+            time.sleep(0.01)
+            real(fd)
+
+        now = timezone.now()
+        with override_settings(SENSOR_SPOOL_SEGMENT_BYTES=1 << 20), \
+                mock.patch.object(os, "fdatasync" if hasattr(os, "fdatasync") else "fsync", slow_sync):
+            threads = [threading.Thread(target=spool.append, args=(
+                [("ch3", now + timedelta(milliseconds=i * 10 + j), {f: 3.0 for f in FIELDS}) for j in range(10)],
+            )) for i in range(16)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertLess(len(calls), 16)
+        self.assertEqual(spool.drain(), 160)
+
+
+class LoadGeneratorTests(SimpleTestCase):
+    """loadtest_ingest's devices against a stub server with scripted answers."""
+
+    def serve(self, answers):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                seen.append(time.perf_counter())
+                status, headers, *delay = answers[len(seen) - 1] if len(seen) <= len(answers) else (201, {})
+                time.sleep(sum(delay))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_address[1], seen
+
+    def test_statuses_retries_and_latencies(self):
+        from .management.commands.loadtest_ingest import Device, Stats
+
+        port, seen = self.serve([(201, {}), (202, {}), (429, {"Retry-After": "0.3"}), (500, {}), (201, {})])
+        stats = Stats()
+        opts = {"timeout": 5.0, "keepalive": False, "max_retries": 2, "burst_every": 0}
+        device = Device(0, "127.0.0.1", port, "ch1", "/emb/api/ch1/sensor-data/", 20.0,
+                        time.perf_counter() + 1.0, stats, opts, None)
+        device.start()
+        device.join()
+
+        # 201 and 202 (spooled) are both acknowledgements; 429 and 500 are retried
+        self.assertEqual(len(stats.latencies), len(seen))
+        self.assertTrue(all(ms > 0 for ms in stats.latencies))
+        self.assertEqual(stats.status["202"], 1)
+        self.assertEqual(stats.status["201"], len(seen) - 3)
+        self.assertEqual((stats.status["429"], stats.status["500"]), (1, 1))
+        self.assertEqual(stats.acked["ch1"], len(seen) - 2)
+        self.assertEqual((stats.errors, stats.retries), (2, 2))
+        self.assertEqual(stats.ambiguous, {})
+        self.assertGreaterEqual(seen[3] - seen[2], 0.3)              # waited out Retry-After
+
+    def test_timed_out_attempt_is_unknown(self):
+        from .management.commands.loadtest_ingest import Device, Stats
+
+        # the first answer comes after the client gave up; the retry is acknowledged
+        port, seen = self.serve([(201, {}, 0.5)])
+        stats = Stats()
+        opts = {"timeout": 0.2, "keepalive": False, "max_retries": 1, "burst_every": 0}
+        Device(0, "127.0.0.1", port, "ch1", "/emb/api/ch1/sensor-data/", 20.0,
+               time.perf_counter() + 0.4, stats, opts, None).run()
+        self.assertEqual(stats.status["None"], 1)
+        self.assertEqual(stats.acked["ch1"], len(seen) - 1)
+        self.assertEqual(stats.ambiguous["ch1"], 1)
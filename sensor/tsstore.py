@@ -0,0 +1,181 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+# ---------------- Append-only segment store ----------------
+# One directory per chamber holding fixed-width records:
+#
+#   seg-<first ts>.dat   RECORD structs, appended in time order
+#   seg-<first ts>.idx   sparse index: (ts, record no) every INDEX_EVERY records
+#
+# Timestamps are UTC epoch milliseconds; missing channels are NaN. Readers
+# memory-map the data files, so range reads are slices of the mapping
+# (no copy) located with the sparse index and a binary search.
+
+RECORD = np.dtype([
+    ("ts", "<i8"),
+    ("temperature", "<f4"),
+    ("pressure", "<f4"),
+    ("humidity", "<f4"),
+    ("co2", "<f4"),
+])
+INDEX = np.dtype([("ts", "<i8"), ("pos", "<i8")])
+INDEX_EVERY = 4096
+
+
+class OutOfOrder(ValueError):
+    """An append older than the stored tail: segment files only grow at the end."""
+
+
+class SegmentStore:
+    def __init__(self, root, segment_records=1 << 20):
+        self.root = str(root)
+        self.segment_records = segment_records
+        os.makedirs(self.root, exist_ok=True)
+
+    # ---------- layout ----------
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def segments(self):
+        """Sorted list of (first_ts, data_path, index_path)."""
+        out = []
+        for name in os.listdir(self.root):
+            if name.startswith("seg-") and name.endswith(".dat"):
+                first = int(name[4:-4])
+                out.append((first, self._path(name), self._path(name[:-4] + ".idx")))
+        out.sort()
+        return out
+
+    @contextmanager
+    def _locked(self):
+        with open(self._path(".lock"), "a+b") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _count(path):
+        try:
+            return os.path.getsize(path) // RECORD.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def _last_ts(self, path, n):
+        if n == 0:
+            return None
+        with open(path, "rb") as fh:
+            fh.seek((n - 1) * RECORD.itemsize)
+            return int(np.frombuffer(fh.read(RECORD.itemsize), dtype=RECORD)["ts"][0])
+
+    # ---------- writes ----------
+    def append(self, records):
+        """
+        Append a RECORD array (or anything np.asarray can turn into one).
+        Records must be in time order and no older than the stored tail;
+        otherwise OutOfOrder is raised and nothing is written.
+        Returns the total number of records in the store afterwards.
+        """
+        records = np.array(records, dtype=RECORD, copy=True, ndmin=1)
+        if not len(records):
+            return self.count()
+        with self._locked():
+            segs = self.segments()
+            if segs:
+                first, data, idx = segs[-1]
+                n = self._count(data)
+                # drop a torn trailing record left by a crash
+                if os.path.getsize(data) != n * RECORD.itemsize:
+                    os.truncate(data, n * RECORD.itemsize)
+                last = self._last_ts(data, n)
+            else:
+                data = idx = None
+                n = 0
+                last = None
+
+            ts = records["ts"]
+            if (last is not None and ts[0] < last) or np.any(ts[1:] < ts[:-1]):
+                raise OutOfOrder("records older than the newest stored one can't be appended")
+
+            pos = 0
+            while pos < len(records):
+                if data is None or n >= self.segment_records:
+                    name = f"seg-{int(records['ts'][pos]):016d}"
+                    data, idx, n = self._path(name + ".dat"), self._path(name + ".idx"), 0
+                take = min(len(records) - pos, self.segment_records - n)
+                chunk = records[pos:pos + take]
+                with open(data, "ab") as fh:
+                    fh.write(chunk.tobytes())
+                # sparse index entries for every INDEX_EVERY-th record number
+                marks = np.arange(-n % INDEX_EVERY, take, INDEX_EVERY)
+                if len(marks):
+                    entries = np.empty(len(marks), dtype=INDEX)
+                    entries["ts"] = chunk["ts"][marks]
+                    entries["pos"] = marks + n
+                    with open(idx, "ab") as fh:
+                        fh.write(entries.tobytes())
+                n += take
+                pos += take
+        return self.count()
+
+    # ---------- reads ----------
+    def count(self):
+        return sum(self._count(data) for _, data, _ in self.segments())
+
+    def _map(self, data):
+        n = self._count(data)
+        if n == 0:
+            return np.empty(0, dtype=RECORD)
+        return np.memmap(data, dtype=RECORD, mode="r", shape=(n,))
+
+    def _bounds(self, data, idx, start, end):
+        """[lo, hi) record numbers of `data` with start <= ts <= end."""
+        arr = self._map(data)
+        n = len(arr)
+        lo_blk, hi_blk = 0, n
+        if os.path.exists(idx) and os.path.getsize(idx) >= INDEX.itemsize:
+            index = np.fromfile(idx, dtype=INDEX)
+            if start is not None:
+                i = np.searchsorted(index["ts"], start, side="left") - 1
+                lo_blk = int(index["pos"][i]) if i >= 0 else 0
+            if end is not None:
+                j = np.searchsorted(index["ts"], end, side="right")
+                hi_blk = int(index["pos"][j]) if j < len(index) else n
+        ts = arr["ts"][lo_blk:hi_blk]
+        lo = lo_blk + (int(np.searchsorted(ts, start, side="left")) if start is not None else 0)
+        hi = lo_blk + (int(np.searchsorted(ts, end, side="right")) if end is not None else len(ts))
+        return arr, lo, hi
+
+    def views(self, start=None, end=None):
+        """Zero-copy RECORD views, one per segment touching [start, end]."""
+        segs = self.segments()
+        out = []
+        for i, (first, data, idx) in enumerate(segs):
+            nxt = segs[i + 1][0] if i + 1 < len(segs) else None
+            if end is not None and first > end:
+                break
+            if start is not None and nxt is not None and nxt < start:
+                continue
+            arr, lo, hi = self._bounds(data, idx, start, end)
+            if hi > lo:
+                out.append(arr[lo:hi])
+        return out
+
+    def read(self, start=None, end=None):
+        """One RECORD array for [start, end]; a view when a single segment covers it."""
+        parts = self.views(start, end)
+        if not parts:
+            return np.empty(0, dtype=RECORD)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def last(self):
+        segs = self.segments()
+        for _, data, _ in reversed(segs):
+            arr = self._map(data)
+            if len(arr):
+                return arr[-1]
+        return None
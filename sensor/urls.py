@@ -5,6 +5,7 @@ from django.contrib.auth import views as auth_views
 
 urlpatterns = [
     path("", views_admin.redirect_to_default_chamber, name="home"),
+    path("chambers/", views.chambers_home, name="chambers_home"),
     re_path(r'^(?P<ch>ch[123])/$', views.minute_table, name='sensor_data_page'),
     re_path(r'^chart/(?P<ch>ch[123])/$', views.chart_page, name='chart_page'),
     re_path(r'^emb/api/(?P<ch>ch[123])/sensor-data/$', views.ingest_sensor_data, name='ingest_sensor_data'),
@@ -12,6 +13,11 @@ urlpatterns = [
     re_path(r'^api/chart_data/(?P<ch>ch[123])/$', views.chart_data, name='chart_data'),
     re_path(r'^api/download_csv/(?P<ch>ch[123])/?$', views.download_csv, name='download_csv'),
     re_path(r'^api/download_pdf/(?P<ch>ch[123])/?$', views.download_pdf, name='download_pdf'),
+    re_path(r'^api/stats/(?P<ch>ch[123])/$', views.window_stats, name='window_stats'),
+    re_path(r'^api/excursions/(?P<ch>ch[123])/$', views.excursions, name='excursions'),
+    re_path(r'^api/gaps/(?P<ch>ch[123])/$', views.data_gaps, name='data_gaps'),
+    re_path(r'^api/sparkline/(?P<ch>ch[123])\.png$', views.sparkline, name='sparkline'),
+    path('api/bundle/', views.dashboard_bundle, name='dashboard_bundle'),
 
     path("login/", auth_views.LoginView.as_view(template_name="login.html"), name="login"),
     path("logout/", auth_views.LogoutView.as_view(), name="logout"),
@@ -20,6 +26,10 @@ urlpatterns = [
     path("users/create/", views_admin.user_create, name="user_create"),
     path("users/<int:user_id>/edit/", views_admin.user_edit, name="user_edit"),
     path("users/<int:user_id>/delete/", views_admin.user_delete, name="user_delete"),
+    path("profiles/", views_admin.profile_list, name="profile_list"),
+    path("profiles/<str:name>/", views_admin.profile_detail, name="profile_detail"),
+    path("api/series-cache/", views_admin.series_cache_stats, name="series_cache_stats"),
+    path("api/ingest-throttle/", views_admin.ingest_throttle_stats, name="ingest_throttle_stats"),
     
 ]
 
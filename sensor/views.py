@@ -1,6 +1,11 @@
-import re, csv, json
+import asyncio
+import logging
+import re, json
 from datetime import timedelta, datetime
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render, redirect
 from django.utils import timezone
@@ -8,7 +13,16 @@ from django.utils.timezone import make_aware, is_naive
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 
-from .models import Chamber1Data, Chamber2Data, Chamber3Data, ChamberAccess
+from . import admission, gaps, ratelimit, spool
+from .alerts import evaluate_safely as evaluate_alerts
+from .devicetime import repair_late
+from .ingest import validate as validate_reading
+from .models import ChamberAccess, Excursion
+from .querybudget import query_budget
+from .readings import FIELDS, MODEL_BY_CH, source_for
+from .routers import read_replica
+
+logger = logging.getLogger("sensor.views")
 
 # ---------------- Chamber mapping ----------------
 
@@ -17,12 +31,7 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import ChamberAccess
-
-MODEL_BY_CH = {
-    "ch1": Chamber1Data,
-    "ch2": Chamber2Data,
-    "ch3": Chamber3Data,
-}
+from .views_admin import _allowed_chambers_for
 
 # ---------------- Access check ----------------
 def _user_has_access(user, ch):
@@ -32,183 +41,233 @@ def _user_has_access(user, ch):
 
 # ---------------- Helpers ----------------
 def _parse_span(s: str) -> timedelta:
+    """?every= as a step, at most 12h; ValueError for anything under a minute or unreadable."""
     s = (s or "1m").strip().lower()
     m = re.fullmatch(r"(\d+)\s*([mh])", s)
-    if not m:
-        return timedelta(minutes=1)
+    if not m or int(m.group(1)) < 1:
+        # a zero step would make fill= produce a bucket per millisecond
+        raise ValueError("every must be a whole number of minutes or hours, at least 1m (e.g. 5m, 2h)")
     qty, unit = int(m.group(1)), m.group(2)
     return timedelta(hours=max(1, min(12, qty))) if unit == "h" else timedelta(minutes=max(1, min(720, qty)))
 
-from django.utils.timezone import make_aware, is_naive
-from datetime import datetime
-
-def _floor_minute(dt):
-    return dt.replace(second=0, microsecond=0)
-
-def _select_rows_actual(qs, step):
-    """
-    Walk through queryset (ordered by created_at).
-    Only include real rows, spaced at least `step` apart.
-    """
-    rows = []
-    last_dt = None
-    IST = timezone.get_current_timezone()
-
-    for r in qs:
-        dt = timezone.localtime(r.created_at, IST)
-        if last_dt is None or dt >= last_dt + step:
-            rows.append({
-                "date": dt.date().isoformat(),
-                "time": dt.strftime("%H:%M:%S"),
-                "temperature": r.temperature,
-                "pressure": r.pressure,
-                "humidity": r.humidity,
-                "co2": r.co2,
-            })
-            last_dt = dt
-    return rows
-
-def _select_rows_by_step(qs, start_dt, end_dt, step):
-    """
-    qs: queryset ordered by created_at ASC (from a single chamber's table)
-    step: timedelta (1m, 5m, 30m ...)
-
-    - If multiple rows exist within the same minute, pick the **last** one.
-    - Walk at 'step' cadence starting from start minute.
-    """
-    tz = timezone.get_current_timezone()
-
-    # Build "latest per minute" map
-    per_minute = {}
-    for r in qs.order_by("created_at"):
-        loc = timezone.localtime(r.created_at, tz)
-        # round DOWN to minute
-        slot = loc.replace(second=0, microsecond=0)
-        if slot not in per_minute:
-            per_minute[slot] = r   # keep first row of that minute
-
-    # Walk aligned to start
-    selected = []
-    slot = _floor_minute(timezone.localtime(start_dt, tz))
-    end_local = timezone.localtime(end_dt, tz)
-    while slot <= end_local:
-        if slot in per_minute:
-            selected.append(per_minute[slot])
-        slot += step
-    return selected
-
 # ---------------- Page routes ----------------
 def redirect_to_ch1(request):
     return redirect("sensor_data_page", ch="ch1")
 
+@query_budget(3)
 @login_required
 def chambers_home(request):
-    if request.user.is_superuser:
-        allowed = ["ch1", "ch2", "ch3"]
-    else:
-        allowed = list(
-            ChamberAccess.objects.filter(user=request.user).values_list("chamber", flat=True)
-        )
-    return render(request, "chambers_home.html", {"allowed": allowed})
+    allowed = _allowed_chambers_for(request.user)
+    return render(request, "chambers_home.html", {"allowed": allowed, "fields": ("temperature", "humidity")})
 
+@query_budget(3)
 @login_required
 def minute_table(request, ch):
-    if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
+    # allowed list for the navbar doubles as the access check
+    allowed = _allowed_chambers_for(request.user)
+    if ch not in MODEL_BY_CH or ch not in allowed:
         return JsonResponse({"error": "Access denied"}, status=403)
 
-    # build allowed list for the navbar
-    if request.user.is_superuser:
-        allowed = ["ch1", "ch2", "ch3"]
-    else:
-        allowed = list(
-            ChamberAccess.objects.filter(user=request.user).values_list("chamber", flat=True)
-        )
-
     return render(request, "dashboard.html", {"chamber": ch, "allowed": allowed})
 
 
+@query_budget(3)
 @login_required
 def chart_page(request, ch):
-    if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
+    allowed = _allowed_chambers_for(request.user)
+    if ch not in MODEL_BY_CH or ch not in allowed:
         return JsonResponse({"error": "Access denied"}, status=403)
 
-    if request.user.is_superuser:
-        allowed = ["ch1", "ch2", "ch3"]
-    else:
-        allowed = list(
-            ChamberAccess.objects.filter(user=request.user).values_list("chamber", flat=True)
-        )
-
     return render(request, "chart.html", {"chamber": ch, "allowed": allowed})
 
 
+def _resampling(request, default_every="1m"):
+    """(every, step, mode, fill) from ?every=&mode=&fill=; ValueError on a bad step, mode or fill."""
+    from .resample import FILLS, MODES
+
+    every = request.GET.get("every", default_every)
+    mode, fill = request.GET.get("mode", "first"), request.GET.get("fill", "none")
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if fill not in FILLS:
+        raise ValueError(f"fill must be one of {', '.join(FILLS)}")
+    return every, _parse_span(every), mode, fill
+
+
+def _coarsen(request):
+    """?coarsen=0 refuses over-budget reads instead of coarsening them."""
+    return request.GET.get("coarsen") != "0"
+
+
+def _resolution(resp, every):
+    resp["X-Resolution"] = every or "raw"
+    return resp
+
+
+def _recent_start(request):
+    """Start of the ?hours=N window, or None for the whole history."""
+    try:
+        hours = float(request.GET.get("hours", ""))
+    except ValueError:
+        return None
+    return timezone.now() - timedelta(hours=hours) if hours > 0 else None
+
+
 # ---------------- Table API ----------------
+@query_budget(8)
+@read_replica
 @login_required
 def range_rows(request, ch):
     if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
         return JsonResponse([], safe=False)
 
-    Model = MODEL_BY_CH[ch]
-    every = request.GET.get("every", "1m")
-    step = _parse_span(every)
+    try:
+        every, step, mode, fill = _resampling(request)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    start = _recent_start(request)
+    try:
+        every, step, points = admission.plan(ch, "range", start, None, every, step, _coarsen(request), fill)
+        with admission.heavy_slot(points):
+            rows = _range_rows(ch, start, step, mode, fill, request.GET.get("gaps") != "0")
+    except admission.Rejected as exc:
+        return exc.response()
+    return _resolution(JsonResponse(rows, safe=False), every)
+
 
-    qs = Model.objects.order_by("created_at")
-    if not qs.exists():
-        return JsonResponse([], safe=False)
+def _range_rows(ch, start, step, mode, fill, with_gaps):
+    from .resample import fill_gaps, to_rows
+    from .seriescache import series as cached_series
 
     rows = []
-    last_dt = None
-
-    for r in qs:
-        dt = timezone.make_aware(datetime.combine(r.date, r.time))
-        # always take the first row, then take a new one only if >= step later
-        if last_dt is None or dt >= last_dt + step:
+    tz = timezone.get_current_timezone()
+    # outages show up as marker rows (channels null, "gap" set) unless ?gaps=0
+    pending = gaps.gaps_between(ch, start) if with_gaps else []
+    gi = 0
+
+    series = fill_gaps(cached_series(ch, start, None, step, mode), step, fill)
+    for created_at, temperature, pressure, humidity, co2 in to_rows(series):
+        # a gap goes before the first bucket that starts after it began
+        while gi < len(pending) and pending[gi][0] < created_at:
+            g_from = timezone.localtime(pending[gi][0], tz)
             rows.append({
-                "date": r.date.isoformat(),
-                "time": r.time.strftime("%H:%M"),
-                "temperature": r.temperature,
-                "pressure": r.pressure,
-                "humidity": r.humidity,
-                "co2": r.co2,
+                "date": g_from.date().isoformat(),
+                "time": g_from.strftime("%H:%M"),
+                "temperature": None, "pressure": None, "humidity": None, "co2": None,
+                "gap": gaps.as_json(*pending[gi]),
             })
-            last_dt = dt
-
-    return JsonResponse(rows, safe=False)
+            gi += 1
+        dt = timezone.localtime(created_at, tz)
+        rows.append({
+            "date": dt.date().isoformat(),
+            "time": dt.strftime("%H:%M"),
+            "temperature": temperature,
+            "pressure": pressure,
+            "humidity": humidity,
+            "co2": co2,
+        })
+    return rows
 
 # ---------------- Chart data API ----------------
+@query_budget(8)
+@read_replica
 @login_required
 @csrf_exempt
 def chart_data(request, ch):
     if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
         return JsonResponse({"labels": [], "temperature": [], "pressure": [], "humidity": [], "co2": []}, status=403)
 
-    Model = MODEL_BY_CH[ch]
-    qs = Model.objects.order_by("created_at")  # oldest → newest
-    data = {
-        "labels": [f"{r.date} {r.time.strftime('%H:%M')}" for r in qs],
-        "temperature": [r.temperature for r in qs],
-        "pressure": [r.pressure for r in qs],
-        "humidity": [r.humidity for r in qs],
-        "co2": [r.co2 for r in qs],
-    }
-    return JsonResponse(data)
+    try:
+        every, step, mode, fill = _resampling(request)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    if "every" not in request.GET:
+        every = step = None
+    start = _recent_start(request)
+    try:
+        # raw rows that would not fit come back resampled
+        every, step, points = admission.plan(ch, "chart", start, None, every, step, _coarsen(request), fill)
+        with admission.heavy_slot(points):
+            data = _chart_data(ch, start, step, mode, fill)
+    except admission.Rejected as exc:
+        return exc.response()
+    data["every"] = every
+    return _resolution(JsonResponse(data), every)
+
+
+def _chart_data(ch, start, step, mode, fill):
+    tz = timezone.get_current_timezone()
+    data = {"labels": [], "temperature": [], "pressure": [], "humidity": [], "co2": []}
+    # oldest → newest, one pass, no model instances; resampled (closed days
+    # from the series cache) when a step is given
+    source = source_for(ch)
+    if step is not None:
+        from .resample import fill_gaps, to_rows
+        from .seriescache import series as cached_series
+
+        readings = to_rows(fill_gaps(cached_series(ch, start, None, step, mode), step, fill))
+    else:
+        readings = source.rows(start)
+    last_at = None
+    for created_at, temp, pres, hum, co2 in readings:
+        data["labels"].append(timezone.localtime(created_at, tz).strftime("%Y-%m-%d %H:%M"))
+        data["temperature"].append(temp)
+        data["pressure"].append(pres)
+        data["humidity"].append(hum)
+        data["co2"].append(co2)
+        last_at = created_at
+    if last_at is None and start is not None:
+        last_at = source.last_timestamp()
+    data["gaps"] = [gaps.as_json(*g) for g in gaps.gaps_between(ch, start)]
+    since = gaps.offline_since(last_at)
+    data["offline_since"] = since and timezone.localtime(since, tz).isoformat(timespec="seconds")
+    return data
+
+# ---------------- Sparkline thumbnails ----------------
+@query_budget(5)
+@read_replica
+@login_required
+def sparkline(request, ch):
+    """Cached 24 h trend PNG for the home page; ?field= picks the channel."""
+    if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
+        return HttpResponse(status=403)
+    field = request.GET.get("field", "temperature")
+    if field not in FIELDS:
+        return JsonResponse({"error": f"field must be one of {', '.join(FIELDS)}"}, status=400)
+    from .sparklines import sparkline as draw
+
+    png, key = draw(ch, field, source_for(ch).last_timestamp())
+    if png is None:
+        return HttpResponse(status=204)
+    etag = f'"{key}"'
+    if request.META.get("HTTP_IF_NONE_MATCH") == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(png, content_type="image/png")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=60"
+    return response
 
 # ---------------- Ingest (device POST) ----------------
 from json import JSONDecodeError
 
+# a late reading costs up to 12: dedup, newest, insert, then a gap split and a
+# sketch update, each in a savepoint (sensor.devicetime.repair_late)
+@query_budget(12)
 @csrf_exempt
 def ingest_sensor_data(request, ch):
     """Device endpoint (NO login required)."""
     if ch not in MODEL_BY_CH:
         return JsonResponse({"error": "Invalid chamber"}, status=400)
-    Model = MODEL_BY_CH[ch]
+    source = source_for(ch)
 
     if request.method == "GET":
-        last = Model.objects.order_by("-created_at").first()
+        last = source.latest()
         return JsonResponse({
             "ok": True,
             "chamber": ch,
             "expect_json_fields": ["temperature", "pressure", "humidity", "co2"],
+            "optional_json_fields": ["ts"],
             "hint": "POST JSON to this URL with Content-Type: application/json",
             "last": None if not last else {
                 "id": last.id,
@@ -234,17 +293,53 @@ def ingest_sensor_data(request, ch):
     except (UnicodeDecodeError, JSONDecodeError):
         return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-    required = ["temperature", "pressure", "humidity", "co2"]
-    missing = [f for f in required if f not in payload]
-    if missing:
-        return JsonResponse({"error": f"Missing fields: {', '.join(missing)}"}, status=400)
+    # before any validation or storage: a sender in a tight loop costs a cache round trip
+    retry_after = ratelimit.take(ch, ratelimit.device_id(request, payload))
+    if retry_after:
+        resp = JsonResponse({"error": "Too many readings, slow down", "retry_after": retry_after}, status=429)
+        resp["Retry-After"] = str(retry_after)
+        return resp
 
-    row = Model.objects.create(
-        temperature=float(payload["temperature"]),
-        pressure=float(payload["pressure"]),
-        humidity=float(payload["humidity"]),
-        co2=float(payload["co2"]),
-    )
+    # the checks the socket listener applies too (sensor.ingest)
+    try:
+        created_at, values = validate_reading(payload)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    if spool.enabled():
+        # on local disk now, in the database once drain_spool gets to it
+        created_at = created_at or timezone.now()
+        try:
+            spool.append([(ch, created_at, values)])
+        except OSError:
+            logger.exception("spooling a reading of %s failed", ch)
+            return JsonResponse({"error": "Reading not stored, try again"}, status=503)
+        return JsonResponse({
+            "status": "queued",
+            "chamber": ch,
+            "created_at": timezone.localtime(created_at).isoformat(timespec="seconds"),
+        }, status=202)
+
+    if created_at is not None and source.has_reading(created_at):
+        # a buffered reading sent again after a lost response
+        return JsonResponse({"status": "duplicate", "chamber": ch}, status=200)
+
+    refused = ()
+    if getattr(source, "append_only", False):
+        # the segment store can't take a reading before its newest one, whoever wrote that
+        from .tsstore import OutOfOrder as refused
+    previous_at = source.last_timestamp()
+    try:
+        row = source.append(created_at, **values)
+    except refused:
+        return JsonResponse({"error": "Reading is older than the newest stored one; this store only appends",
+                             "chamber": ch}, status=409)
+    late = previous_at is not None and row.created_at < previous_at
+    if late:
+        repair_late(ch, row.created_at, values)
+    else:
+        gaps.note_reading(ch, previous_at, row.created_at)
+        evaluate_alerts(ch, row.created_at, values)
 
     return JsonResponse({
         "status": "ok",
@@ -253,17 +348,15 @@ def ingest_sensor_data(request, ch):
         "date": row.date.isoformat(),
         "time": row.time.strftime("%H:%M:%S"),
         "created_at": timezone.localtime(row.created_at).isoformat(timespec="seconds"),
+        "late": late,
     }, status=201)
 
-import csv
 from datetime import datetime, timedelta
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
+
+from .exporters import get_engine
 
 # ======= DEBUG SWITCH =======
 DEBUG_DL = True
@@ -271,22 +364,6 @@ def dbg(*args, **kwargs):
     if DEBUG_DL:
         print("[DLDEBUG]", *args, **kwargs)
 
-# ---------- Parse span helper ----------
-def _parse_span(every: str) -> timedelta:
-    if not every:
-        return timedelta(minutes=1)
-    every = every.strip().lower()
-    if every.endswith("m"):
-        val = int(every[:-1] or 1)
-        step = timedelta(minutes=val)
-    elif every.endswith("h"):
-        val = int(every[:-1] or 1)
-        step = timedelta(hours=val)
-    else:
-        step = timedelta(minutes=1)
-    dbg("step parsed from 'every':", every, "=>", step)
-    return step
-
 # ---------- Parse frontend datetime ----------
 def parse_local(dt_str: str):
     """
@@ -307,43 +384,40 @@ def parse_local(dt_str: str):
     return out
 
 # ---------- Query helper ----------
+from datetime import timezone as dt_timezone
 from django.utils import timezone
-import pytz
+from zoneinfo import ZoneInfo
 
-IST = pytz.timezone("Asia/Kolkata")
+IST = ZoneInfo("Asia/Kolkata")
 
-def _query_range(Model, start_dt, end_dt):
+def _utc_range(start_dt, end_dt):
     """
-    Query using created_at (stored in UTC).
-    Convert frontend IST datetimes → UTC aware.
+    Frontend IST datetimes → UTC aware, for filtering created_at (stored in UTC).
     """
     # Mark frontend inputs as IST
     if timezone.is_naive(start_dt):
-        start_dt = IST.localize(start_dt)
+        start_dt = timezone.make_aware(start_dt, IST)
     if timezone.is_naive(end_dt):
-        end_dt = IST.localize(end_dt)
+        end_dt = timezone.make_aware(end_dt, IST)
 
     # Convert IST → UTC
-    start_dt = start_dt.astimezone(pytz.UTC)
-    end_dt = end_dt.astimezone(pytz.UTC)
+    return start_dt.astimezone(dt_timezone.utc), end_dt.astimezone(dt_timezone.utc)
 
-    return Model.objects.filter(
-        created_at__gte=start_dt,
-        created_at__lte=end_dt
-    ).order_by("created_at")
-
-# ---------- CSV Export ----------
-@login_required
-def download_csv(request, ch):
+# ---------- Exports ----------
+def _export(request, ch, fmt):
     if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
         return JsonResponse({"error": "Access denied"}, status=403)
 
-    Model = MODEL_BY_CH[ch]
-    dbg("CSV REQUEST chamber:", ch, "GET:", request.GET.dict())
+    label = fmt.upper()
+    dbg(label, "REQUEST chamber:", ch, "GET:", request.GET.dict())
 
-    start, end, every = request.GET.get("start"), request.GET.get("end"), request.GET.get("every", "1m")
+    start, end = request.GET.get("start"), request.GET.get("end")
     if not start or not end:
         return JsonResponse({"error": "Start and End datetime required"}, status=400)
+    try:
+        every, step, mode, fill = _resampling(request)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
 
     start_dt, end_dt = parse_local(start), parse_local(end)
     if not start_dt or not end_dt:
@@ -351,93 +425,229 @@ def download_csv(request, ch):
 
     # include whole last minute
     end_dt = end_dt.replace(second=59, microsecond=999999)
-    step = _parse_span(every)
-    dbg("CSV window:", start_dt, "→", end_dt, "| step:", step)
-
-    qs = _query_range(Model, start_dt, end_dt)
-    if not qs.exists():
-        dbg("CSV: NO DATA in this window")
-        return JsonResponse({"error": "No data available"}, status=404)
-
-    rows = _select_rows_actual(qs, step)
-
-
-    response = HttpResponse(content_type="text/csv; charset=utf-8")
-    response["Content-Disposition"] = (
-        f'attachment; filename="Chamber_{ch}_{start_dt.date()}_{end_dt.date()}_{every}.csv"'
-    )
-    response.write("\ufeff")  # BOM for Excel
-
-    writer = csv.writer(response)
-    writer.writerow(["Date", "Time", "Temperature (°C)", "Temperature1 (°C)", "Humidity (%)", "Humidity1 (%)"])
-    for r in rows:
-        writer.writerow([
-            r["date"], r["time"],
-            "" if r["temperature"]  is None else f'{r["temperature"]:.2f}',
-            "" if r["pressure"] is None else f'{r["pressure"]:.2f}',
-            "" if r["humidity"]     is None else f'{r["humidity"]:.2f}',
-            "" if r["co2"]    is None else f'{r["co2"]:.2f}',
-        ])
-    dbg("CSV: wrote", len(rows), "rows")
-    return response
+    dbg(label, "window:", start_dt, "→", end_dt, "| step:", step, mode, fill)
+
+    start_utc, end_utc = _utc_range(start_dt, end_dt)
+    try:
+        every, step, points = admission.plan(ch, fmt, start_utc, end_utc, every, step, _coarsen(request), fill)
+        with admission.heavy_slot(points):
+            rows = _export_rows(ch, start_utc, end_utc, step, mode, fill)
+            if not rows:
+                dbg(label + ": NO DATA in this window")
+                return JsonResponse({"error": "No data available"}, status=404)
+            # the file name carries the resolution actually applied
+            response = get_engine(fmt)(rows, ch, start_dt, end_dt, every)
+    except admission.Rejected as exc:
+        return exc.response()
+    dbg(label + ": wrote", len(rows), "rows")
+    return _resolution(response, every)
+
+
+def _export_rows(ch, start_utc, end_utc, step, mode, fill):
+    from .resample import fill_gaps, to_rows
+    from .seriescache import series as cached_series
+
+    rows = []
+    for created_at, temperature, pressure, humidity, co2 in to_rows(
+        fill_gaps(cached_series(ch, start_utc, end_utc, step, mode), step, fill)
+    ):
+        dt = timezone.localtime(created_at, IST)
+        rows.append({
+            "date": dt.date().isoformat(),
+            "time": dt.strftime("%H:%M:%S"),
+            "temperature": temperature,
+            "pressure": pressure,
+            "humidity": humidity,
+            "co2": co2,
+        })
+    return rows
+
+# ---------- CSV Export ----------
+@query_budget(7)
+@read_replica
+@login_required
+def download_csv(request, ch):
+    return _export(request, ch, "csv")
 
 # ---------- PDF Export ----------
+@query_budget(7)
+@read_replica
 @login_required
 def download_pdf(request, ch):
+    return _export(request, ch, "pdf")
+
+# ---------- Window statistics ----------
+@query_budget(8)
+@read_replica
+@login_required
+def window_stats(request, ch):
+    """min/max/mean/stddev and p5/p50/p95 of every channel over ?start=&end=."""
     if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
         return JsonResponse({"error": "Access denied"}, status=403)
 
-    Model = MODEL_BY_CH[ch]
-    dbg("PDF REQUEST chamber:", ch, "GET:", request.GET.dict())
+    start_dt, end_dt = parse_local(request.GET.get("start")), parse_local(request.GET.get("end"))
+    if not start_dt or not end_dt:
+        return JsonResponse({"error": "Start and End datetime required (YYYY-MM-DDTHH:MM)"}, status=400)
+    end_dt = end_dt.replace(second=59, microsecond=999999)
+    if end_dt < start_dt:
+        return JsonResponse({"error": "End must be after Start"}, status=400)
 
-    start, end, every = request.GET.get("start"), request.GET.get("end"), request.GET.get("every", "1m")
-    if not start or not end:
-        return JsonResponse({"error": "Start and End datetime required"}, status=400)
+    from .stats import window_stats as _window_stats
 
-    start_dt, end_dt = parse_local(start), parse_local(end)
-    if not start_dt or not end_dt:
-        return JsonResponse({"error": "Invalid datetime format"}, status=400)
+    start_utc = timezone.make_aware(start_dt, IST).astimezone(dt_timezone.utc)
+    end_utc = timezone.make_aware(end_dt, IST).astimezone(dt_timezone.utc)
+    out = _window_stats(ch, start_utc, end_utc)
+    return JsonResponse({
+        "chamber": ch,
+        "start": start_dt.isoformat(timespec="seconds"),
+        "end": end_dt.isoformat(timespec="seconds"),
+        **out,
+    })
+
+# ---------- Excursions ----------
+@query_budget(4)
+@read_replica
+@login_required
+def excursions(request, ch):
+    """Alert excursions overlapping ?start=&end= (local time); ?open=1 for open ones only."""
+    if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
+        return JsonResponse({"error": "Access denied"}, status=403)
 
-    end_dt = end_dt.replace(second=59, microsecond=999999)
-    step = _parse_span(every)
-    dbg("PDF window:", start_dt, "→", end_dt, "| step:", step)
-
-    qs = _query_range(Model, start_dt, end_dt)
-    if not qs.exists():
-        dbg("PDF: NO DATA in this window")
-        return JsonResponse({"error": "No data available"}, status=404)
-
-    rows = _select_rows_actual(qs, step)
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="Chamber_{ch}_{start_dt.date()}_{end_dt.date()}_{every}.pdf"'
-
-    doc = SimpleDocTemplate(response, pagesize=landscape(A4),
-                            rightMargin=18, leftMargin=18, topMargin=24, bottomMargin=18)
-    styles = getSampleStyleSheet()
-    title = Paragraph(f"Chamber {ch.upper()} — Sensor Data (every {every})", styles["Heading3"])
-
-    data = [["Date", "Time", "Temperature (°C)", "Temperature1 (°C)", "Humidity (%)", "Humidity1 (%)"]]
-    for r in rows:
-        data.append([
-            r["date"], r["time"],
-            "" if r["temperature"]  is None else f'{r["temperature"]:.2f}',
-            "" if r["pressure"] is None else f'{r["pressure"]:.2f}',
-            "" if r["humidity"]     is None else f'{r["humidity"]:.2f}',
-            "" if r["co2"]    is None else f'{r["co2"]:.2f}',
-        ])
-
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#f1f5f9")),
-        ("TEXTCOLOR",  (0,0), (-1,0), colors.HexColor("#111827")),
-        ("FONTNAME",   (0,0), (-1,0), "Helvetica-Bold"),
-        ("FONTSIZE",   (0,0), (-1,0), 10),
-        ("FONTSIZE",   (0,1), (-1,-1), 9),
-        ("ALIGN",      (0,0), (-1,-1), "CENTER"),
-        ("GRID",       (0,0), (-1,-1), 0.5, colors.HexColor("#111111")),
-        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#f7fafc")]),
-    ]))
-    doc.build([title, Spacer(1, 8), table])
-    dbg("PDF: wrote", len(rows), "rows")
-    return response
+    qs = Excursion.objects.filter(chamber=ch).select_related("rule")
+    start_dt, end_dt = parse_local(request.GET.get("start")), parse_local(request.GET.get("end"))
+    if start_dt:
+        start_utc = timezone.make_aware(start_dt, IST)
+        qs = qs.filter(Q(ended_at__isnull=True) | Q(ended_at__gte=start_utc))
+    if end_dt:
+        qs = qs.filter(started_at__lte=timezone.make_aware(end_dt.replace(second=59), IST))
+    if request.GET.get("open") == "1":
+        qs = qs.filter(ended_at__isnull=True)
+
+    def _local(dt):
+        return None if dt is None else timezone.localtime(dt).isoformat(timespec="seconds")
+
+    return JsonResponse([{
+        "id": e.id,
+        "rule": e.rule.name,
+        "kind": e.rule.kind,
+        "channel": e.channel,
+        "started_at": _local(e.started_at),
+        "ended_at": _local(e.ended_at),
+        "duration_s": e.duration,
+        "peak": e.peak,
+        "samples": e.samples,
+    } for e in qs[:500]], safe=False)
+
+# ---------- Data gaps ----------
+@query_budget(5)
+@read_replica
+@login_required
+def data_gaps(request, ch):
+    """Outages overlapping ?start=&end= (local time) and whether the chamber is silent now."""
+    if ch not in MODEL_BY_CH or not _user_has_access(request.user, ch):
+        return JsonResponse({"error": "Access denied"}, status=403)
+
+    start_dt, end_dt = parse_local(request.GET.get("start")), parse_local(request.GET.get("end"))
+    start_utc = start_dt and timezone.make_aware(start_dt, IST)
+    end_utc = end_dt and timezone.make_aware(end_dt.replace(second=59), IST)
+
+    since = gaps.offline_since(source_for(ch).last_timestamp())
+    return JsonResponse({
+        "chamber": ch,
+        "threshold_s": gaps.threshold().total_seconds(),
+        "gaps": [gaps.as_json(*g) for g in gaps.gaps_between(ch, start_utc, end_utc)],
+        "offline_since": since and timezone.localtime(since).isoformat(timespec="seconds"),
+    })
+
+# ---------- Dashboard bundle ----------
+def _summary(arr):
+    import numpy as np
+
+    out = {}
+    for f in FIELDS:
+        a = arr[f][~np.isnan(arr[f])]
+        if not len(a):
+            out[f] = None
+            continue
+        p5, p50, p95 = np.percentile(a, [5, 50, 95])
+        out[f] = {
+            "min": float(a.min()), "max": float(a.max()),
+            "mean": round(float(a.mean()), 4), "stddev": round(float(a.std()), 4),
+            "p5": float(p5), "p50": float(p50), "p95": float(p95),
+        }
+    return out
+
+
+def _chamber_bundle(ch, start, end, step, mode, fill, own_thread):
+    """
+    Latest reading, resampled series and window summary of one chamber: the
+    window in one query, the latest reading in another (it may be older).
+    """
+    from .resample import from_rows, resample, to_rows
+
+    try:
+        tz = timezone.get_current_timezone()
+        source = source_for(ch)
+        arr = from_rows(source.rows(start, end))
+        series = {"labels": [], **{f: [] for f in FIELDS}}
+        for created_at, *vals in to_rows(resample(arr, step, mode, fill)):
+            series["labels"].append(timezone.localtime(created_at, tz).strftime("%Y-%m-%d %H:%M"))
+            for f, v in zip(FIELDS, vals):
+                series[f].append(v)
+
+        latest = since = None
+        last = source.latest()
+        if last is not None:
+            latest = {"created_at": timezone.localtime(last.created_at, tz).isoformat(timespec="seconds"),
+                      **{f: getattr(last, f) for f in FIELDS}}
+            since = gaps.offline_since(last.created_at)
+        return {
+            "latest": latest,
+            "offline_since": since and timezone.localtime(since, tz).isoformat(timespec="seconds"),
+            "series": series,
+            "stats": {"count": len(arr), "channels": _summary(arr)},
+        }
+    finally:
+        if own_thread:
+            # pool threads outlive the request; don't leave their connections open
+            connections.close_all()
+
+
+@query_budget(9)
+@read_replica
+async def dashboard_bundle(request):
+    """
+    Everything a dashboard needs for ?ch=ch1,ch2 (default: all allowed) in one response:
+    latest reading, the last ?hours= (default 6) resampled by ?every=&mode=&fill= and a summary.
+    Chambers are fetched concurrently, two queries each.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+
+    allowed = await sync_to_async(_allowed_chambers_for)(user)
+    wanted = [c for c in (request.GET.get("ch") or ",".join(allowed)).split(",") if c]
+    if any(c not in MODEL_BY_CH or c not in allowed for c in wanted):
+        return JsonResponse({"error": "Access denied"}, status=403)
+
+    try:
+        hours = max(1, min(72, int(request.GET.get("hours", 6))))
+    except ValueError:
+        hours = 6
+    try:
+        every, step, mode, fill = _resampling(request, "5m")
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    end = timezone.now()
+    start = end - timedelta(hours=hours)
+
+    # SQLite serialises connections anyway (and test databases are per connection)
+    concurrent = getattr(settings, "SENSOR_BUNDLE_CONCURRENT", connection.vendor != "sqlite")
+    fetch = sync_to_async(_chamber_bundle, thread_sensitive=not concurrent)
+    results = await asyncio.gather(*(fetch(ch, start, end, step, mode, fill, concurrent) for ch in wanted))
+
+    return JsonResponse({
+        "hours": hours,
+        "every": every,
+        "chambers": dict(zip(wanted, results)),
+    })
@@ -1,7 +1,13 @@
+import os
+
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from .models import ChamberAccess
+from .profiling import list_captures, load_capture, profile_dir
+from .querybudget import query_budget
 
 def is_manager(user):
     return user.is_superuser   # only managers can access
@@ -12,13 +18,16 @@ CHAMBERS = [
     ("ch3", "Chamber 3"),
 ]
 
+@query_budget(4)
 @login_required
 @user_passes_test(is_manager)
 def user_list(request):
-    users = User.objects.all().exclude(is_superuser=True)
+    # the template lists each user's chambers; fetch them in one query
+    users = User.objects.all().exclude(is_superuser=True).prefetch_related("chamberaccess_set")
     return render(request, "admin_users.html", {"users": users})
 
 
+@query_budget(5)
 @login_required
 @user_passes_test(is_manager)
 def user_create(request):
@@ -47,8 +56,7 @@ def user_create(request):
         # always hashed
         u = User.objects.create_user(username=username, password=raw_password)
 
-        for ch in chambers:
-            ChamberAccess.objects.create(user=u, chamber=ch)
+        ChamberAccess.objects.bulk_create([ChamberAccess(user=u, chamber=ch) for ch in chambers])
 
         return redirect("user_list")
 
@@ -59,6 +67,7 @@ def user_create(request):
     })
 
 
+@query_budget(5)
 @login_required
 @user_passes_test(is_manager)
 def user_edit(request, user_id):
@@ -66,8 +75,7 @@ def user_edit(request, user_id):
     if request.method == "POST":
         chambers = request.POST.getlist("chambers")
         ChamberAccess.objects.filter(user=u).delete()
-        for ch in chambers:
-            ChamberAccess.objects.create(user=u, chamber=ch)
+        ChamberAccess.objects.bulk_create([ChamberAccess(user=u, chamber=ch) for ch in chambers])
         return redirect("user_list")
 
     assigned = list(ChamberAccess.objects.filter(user=u).values_list("chamber", flat=True))
@@ -77,6 +85,7 @@ def user_edit(request, user_id):
         "assigned": assigned,
     })
 
+@query_budget(12)
 @login_required
 @user_passes_test(is_manager)
 def user_delete(request, user_id):
@@ -89,6 +98,7 @@ def user_delete(request, user_id):
 
 from django.shortcuts import redirect
 
+@query_budget(2)
 @login_required
 def post_login_redirect(request):
     if request.user.is_superuser:
@@ -100,6 +110,7 @@ def _allowed_chambers_for(user):
         return ["ch1", "ch2", "ch3"]
     return list(ChamberAccess.objects.filter(user=user).values_list("chamber", flat=True))
 
+@query_budget(3)
 @login_required
 def redirect_to_default_chamber(request):
     allowed = _allowed_chambers_for(request.user)
@@ -109,4 +120,41 @@ def redirect_to_default_chamber(request):
         return redirect("logout")  # or choose any
     # Pick the first allowed chamber and go to the table page
     default_ch = allowed[0]
-    return redirect("sensor_data_page", ch=default_ch)
\ No newline at end of file
+    return redirect("sensor_data_page", ch=default_ch)
+
+
+# ---------------- Profiles (sensor.profiling) ----------------
+@login_required
+@user_passes_test(is_manager)
+def profile_list(request):
+    return render(request, "profiles.html", {"captures": list_captures()})
+
+
+@login_required
+@user_passes_test(is_manager)
+def profile_detail(request, name):
+    capture = load_capture(name)
+    if capture is None:
+        raise Http404("No such capture")
+    if request.GET.get("download"):
+        path = os.path.join(profile_dir(), name + ".prof")
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=name + ".prof")
+    return render(request, "profiles.html", {"capture": capture})
+
+
+@login_required
+@user_passes_test(is_manager)
+def series_cache_stats(request):
+    """Hit/miss counters of this worker's series cache (sensor.seriescache)."""
+    from .seriescache import stats
+
+    return JsonResponse(stats())
+
+
+@login_required
+@user_passes_test(is_manager)
+def ingest_throttle_stats(request):
+    """Ingest readings refused per chamber by the rate limiter (sensor.ratelimit)."""
+    from .ratelimit import stats
+
+    return JsonResponse(stats([ch for ch, _ in CHAMBERS]))
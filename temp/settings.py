@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -31,7 +32,7 @@ AUTHENTICATION_BACKENDS = [
 SECRET_KEY = 'django-insecure-y(mo+6)nw5!6e7m77h84l-^y^m*@p88gjou$7by__aw)vx(z7#'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DJANGO_DEBUG', 'true').lower() in ('1', 'true', 'yes')
 
 ALLOWED_HOSTS = [ '*',
     'chamber-res-amd8embbbrbgezfc.canadacentral-01.azurewebsites.net',
@@ -54,11 +55,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sensor.querybudget.QueryBudgetMiddleware',  # first, so it sees every query
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',  # /static/, before anything touches the session
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'sensor.profiling.ProfilingMiddleware',      # superusers: ?_profile=1
+    'sensor.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
@@ -101,6 +106,27 @@ DATABASES = {
     }
 }
 
+# Local SQLite database for benchmarks and tests (DATABASE_ENGINE=sqlite)
+if os.getenv('DATABASE_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DATABASE_NAME') or BASE_DIR / 'db.sqlite3',
+    }
+
+# Optional read replica for charts, range API and exports (sensor.routers).
+# MySQL: DATABASE_REPLICA_HOST; local SQLite: DATABASE_REPLICA_NAME.
+if os.getenv('DATABASE_REPLICA_HOST') or os.getenv('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = dict(DATABASES['default'])
+    for key in ('NAME', 'USER', 'PASSWORD', 'HOST'):
+        if os.getenv(f'DATABASE_REPLICA_{key}'):
+            DATABASES['replica'][key] = os.getenv(f'DATABASE_REPLICA_{key}')
+
+DATABASE_ROUTERS = ['sensor.routers.PrimaryReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_MAX_LAG = int(os.getenv('REPLICA_MAX_LAG', '10'))          # seconds
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+REPLICA_HEALTH_TTL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -139,6 +165,94 @@ CSRF_TRUSTED_ORIGINS = [
 
 ]
 
+# Reading storage (sensor.readings): "orm" (database tables), "compact" (the
+# chamberN_compact tables, filled by manage.py compact_readings) or "segments"
+# (append-only memory-mapped files, see sensor.tsstore)
+SENSOR_READING_BACKEND = os.getenv('SENSOR_READING_BACKEND', 'orm')
+SENSOR_SEGMENT_ROOT = Path(os.getenv('SENSOR_SEGMENT_ROOT') or BASE_DIR / 'tsdata')
+SENSOR_SEGMENT_RECORDS = 1 << 20   # records per segment file (24 MiB)
+
+# Shared-memory ring of recent readings per chamber (sensor.ring); 0 = off.
+# 65536 records is 3 MiB per chamber; seeded with the last SENSOR_RING_HOURS.
+# Only for single-host ingest: other hosts' readings never reach the ring.
+SENSOR_RING_RECORDS = int(os.getenv('SENSOR_RING_RECORDS', '0'))
+SENSOR_RING_HOURS = 6
+SENSOR_RING_ROOT = os.getenv('SENSOR_RING_ROOT')   # default /dev/shm/sensor-ring
+
+# Window statistics (sensor.stats): hourly quantile sketches at 0.05 resolution,
+# stored once a bucket is 5 minutes old
+SENSOR_SKETCH_BUCKET = 3600
+SENSOR_SKETCH_RESOLUTION = 0.05
+SENSOR_SKETCH_SETTLE = 300
+
+# Series cache (sensor.seriescache): resampled blocks that closed more than
+# SENSOR_SERIES_SETTLE seconds ago, in a per-process LRU of
+# SENSOR_SERIES_LRU_BYTES in front of CACHES[SENSOR_SERIES_CACHE]
+SENSOR_SERIES_SETTLE = 300
+SENSOR_SERIES_LRU_BYTES = 32 << 20
+SENSOR_SERIES_CACHE = 'default'
+SENSOR_SERIES_TTL = 30 * 86400
+
+# Home page sparklines (sensor.sparklines): last SENSOR_SPARK_HOURS at one
+# point per SENSOR_SPARK_BUCKET seconds, cached in CACHES[SENSOR_SPARK_CACHE]
+SENSOR_SPARK_HOURS = 24
+SENSOR_SPARK_BUCKET = 900
+SENSOR_SPARK_CACHE = 'default'
+
+# Retention (sensor.rollups, manage.py compact_history): (days, seconds) --
+# readings older than `days` are kept as `seconds` buckets of min/max/mean.
+# 90 days raw, 1-minute aggregates to two years, hourly after that.
+SENSOR_ROLLUP_POLICY = ((90, 60), (730, 3600))
+
+# Read admission (sensor.admission): reads estimated over their kind's point
+# budget are coarsened (or refused with ?coarsen=0); reads over
+# SENSOR_HEAVY_POINTS share SENSOR_HEAVY_CONCURRENCY slots per process
+SENSOR_READ_BUDGET = {"range": 20_000, "chart": 20_000, "csv": 500_000, "pdf": 20_000}
+SENSOR_ADMISSION_TTL = 300
+SENSOR_HEAVY_POINTS = 5_000
+SENSOR_HEAVY_CONCURRENCY = 2
+SENSOR_HEAVY_WAIT = 5
+
+# Device-supplied reading times (sensor.devicetime): accepted up to
+# SENSOR_DEVICE_CLOCK_AHEAD seconds ahead of the server (clamped to now) and
+# SENSOR_DEVICE_MAX_LATE seconds behind it
+SENSOR_DEVICE_CLOCK_AHEAD = 60
+SENSOR_DEVICE_MAX_LATE = 7 * 86400
+
+# Ingest rate limits (sensor.ratelimit): (readings per second, burst) per
+# device ("device" field, X-Device-Id, else address) and per chamber, e.g.
+# {"device": (1.0, 120), "chamber": (10.0, 600)}. Off by default; needs
+# CACHES[SENSOR_INGEST_RATE_CACHE] to be a shared cache (manage.py check)
+SENSOR_INGEST_RATE = {}
+SENSOR_INGEST_RATE_CACHE = 'default'
+
+# Socket ingest (sensor.listener, manage.py run_listener): devices allowed to
+# send, as JSON {"device": {"key": "...", "chambers": ["ch1"]}}; readings are
+# stored every SENSOR_LISTENER_BATCH readings or SENSOR_LISTENER_FLUSH_MS
+SENSOR_DEVICE_KEYS = json.loads(os.getenv('SENSOR_DEVICE_KEYS') or '{}')
+SENSOR_LISTENER_HOST = os.getenv('SENSOR_LISTENER_HOST', '0.0.0.0')
+SENSOR_LISTENER_TCP_PORT = int(os.getenv('SENSOR_LISTENER_TCP_PORT', '7070'))
+SENSOR_LISTENER_UDP_PORT = int(os.getenv('SENSOR_LISTENER_UDP_PORT', '7071'))
+SENSOR_LISTENER_BATCH = 2000
+SENSOR_LISTENER_FLUSH_MS = 200
+
+# Ingest spool (sensor.spool): when set, ingest appends readings to segment
+# files here and acknowledges them once fsynced; manage.py drain_spool
+# loads them into the database. Unset = ingest writes the database directly.
+SENSOR_SPOOL_DIR = os.getenv('SENSOR_SPOOL_DIR')
+SENSOR_SPOOL_SEGMENT_BYTES = 8 << 20
+
+# A silence longer than this between two readings is recorded as a data gap
+SENSOR_GAP_SECONDS = int(os.getenv('SENSOR_GAP_SECONDS', '300'))
+
+# Per-view SQL budgets (sensor.querybudget): "warn", "raise" or "off"
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'warn' if DEBUG else 'off')
+QUERY_BUDGET_REPEAT_THRESHOLD = 5
+
+# On-demand request profiles (sensor.profiling), newest SENSOR_PROFILE_KEEP kept
+SENSOR_PROFILE_DIR = Path(os.getenv('SENSOR_PROFILE_DIR') or BASE_DIR / 'profiles')
+SENSOR_PROFILE_KEEP = 50
+
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/post-login/"   # will route by role
 LOGOUT_REDIRECT_URL = "/login/"
@@ -153,6 +267,15 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / "staticfiles" 
 
+# collectstatic writes content-hashed copies plus .gz/.br next to them;
+# WhiteNoise serves those with a one-year immutable Cache-Control (hashed
+# URLs need DEBUG off). Third-party assets are vendored under static/vendor
+# (icon font subset: manage.py subset_icons), nothing loads from a CDN.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "sensor.staticstorage.StaticStorage"},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 